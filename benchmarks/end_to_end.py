@@ -0,0 +1,411 @@
+"""
+Drives whole client flows against the local fake PayWay server and reports how many a
+single client can push:
+
+- card: create_card_token -> create_customer -> process_payment (src/app/credit_card_poc.py)
+- direct_debit: create_bank_account_token -> create_customer -> process_payment
+  (src/app/direct_debit_poc.py)
+
+Each flow runs sequentially (sync), from a thread pool sharing one PayWayClient (threaded)
+and from tasks sharing one AsyncPayWayClient (async). Every scenario runs in a fresh
+process, so its peak RSS and CPU time are its own; the server runs in another process so
+its work is not counted.
+
+    python -m benchmarks.end_to_end --flows 500 --concurrency 1,8,32 --output e2e.json
+    python -m benchmarks.end_to_end --baseline e2e.json
+
+Latency is per flow (three PayWay calls). CPU is the client process's user + system time
+divided by the number of PayWay calls.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+
+from src.payway.client.async_client import AsyncPayWayClient
+from src.payway.client.client import PayWayClient
+from src.payway.errors import PaywayError
+from src.payway.models import BankAccount, PayWayCard, PayWayCustomer, PayWayPayment
+
+
+FLOWS = ("card", "direct_debit")
+MODES = ("sync", "threaded", "async")
+CALLS_PER_FLOW = 3
+
+
+def _client_kwargs(url, concurrency):
+    return dict(
+        api_base_url=url,
+        merchant_id="TEST",
+        bank_account_id="0000000A",
+        publishable_api_key="BENCH_PUBLISHABLE_API_KEY",
+        secret_api_key="BENCH_SECRET_API_KEY",
+        pool_maxsize=max(concurrency, 1),
+    )
+
+
+def _token_payload(flow, index):
+    # distinct payloads, as a real run would tokenize distinct cards
+    if flow == "card":
+        return PayWayCard(
+            card_number="4564710000000004",
+            cvn="847",
+            card_holder_name="Bench Holder %d" % index,
+            expiry_date_month="02",
+            expiry_date_year="29",
+        )
+    return BankAccount(
+        account_name="Bench Account %d" % index, bsb="032-002", account_number=123456
+    )
+
+
+def _customer(index, token):
+    return PayWayCustomer(
+        custom_id="BENCH%08d" % index,
+        customer_name="John Doe",
+        email_address="johndoe@whitefox.cloud",
+        send_email_receipts=False,
+        phone_number="0343232323",
+        street="1 Test Street",
+        street2="2 Test Street",
+        city_name="Melbourne",
+        state="VIC",
+        postal_code="3000",
+        token=token,
+    )
+
+
+def _payment(index, customer_number):
+    return PayWayPayment(
+        customer_number=customer_number,
+        transaction_type="payment",
+        amount="100.00",
+        currency="aud",
+        order_number="ORDER%08d" % index,
+        ip_address="",
+    )
+
+
+def run_flow(payway_client, flow, index):
+    """
+    :return: bool  True if every step succeeded
+    """
+    payload = _token_payload(flow, index)
+    if flow == "card":
+        token_response, errors = payway_client.create_card_token(payload)
+    else:
+        token_response, errors = payway_client.create_bank_account_token(payload)
+    if errors:
+        return False
+    customer, errors = payway_client.create_customer(_customer(index, token_response.token))
+    if errors:
+        return False
+    transaction, errors = payway_client.process_payment(
+        _payment(index, customer.customer_number)
+    )
+    return not errors and transaction.status == "approved"
+
+
+async def run_flow_async(payway_client, flow, index):
+    payload = _token_payload(flow, index)
+    if flow == "card":
+        token_response, errors = await payway_client.create_card_token(payload)
+    else:
+        token_response, errors = await payway_client.create_bank_account_token(payload)
+    if errors:
+        return False
+    customer, errors = await payway_client.create_customer(
+        _customer(index, token_response.token)
+    )
+    if errors:
+        return False
+    transaction, errors = await payway_client.process_payment(
+        _payment(index, customer.customer_number)
+    )
+    return not errors and transaction.status == "approved"
+
+
+def _timed(func, *args):
+    """
+    :return: tuple (seconds, bool success)
+    """
+    started = time.perf_counter()
+    try:
+        ok = func(*args)
+    except PaywayError:
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+async def _timed_async(func, *args):
+    started = time.perf_counter()
+    try:
+        ok = await func(*args)
+    except PaywayError:
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+def _run_sync(url, flow, concurrency, indexes):
+    with PayWayClient(**_client_kwargs(url, 1)) as payway_client:
+        return [_timed(run_flow, payway_client, flow, i) for i in indexes]
+
+
+def _run_threaded(url, flow, concurrency, indexes):
+    with PayWayClient(**_client_kwargs(url, concurrency)) as payway_client:
+        with ThreadPoolExecutor(concurrency) as executor:
+            return list(
+                executor.map(
+                    lambda i: _timed(run_flow, payway_client, flow, i), indexes
+                )
+            )
+
+
+async def _run_async(url, flow, concurrency, indexes):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(payway_client, index):
+        async with semaphore:
+            return await _timed_async(run_flow_async, payway_client, flow, index)
+
+    async with AsyncPayWayClient(**_client_kwargs(url, concurrency)) as payway_client:
+        return await asyncio.gather(*[one(payway_client, i) for i in indexes])
+
+
+def run_scenario(url, flow, mode, concurrency, count, warmup):
+    """
+    Runs in its own process
+    :return: dict  measurements of the scenario
+    """
+    if mode == "sync":
+        concurrency = 1
+
+    def run(indexes):
+        if mode == "async":
+            return asyncio.run(_run_async(url, flow, concurrency, indexes))
+        if mode == "threaded":
+            return _run_threaded(url, flow, concurrency, indexes)
+        return _run_sync(url, flow, concurrency, indexes)
+
+    # separate customer numbers per scenario, the server keeps everything it is sent
+    scenario = FLOWS.index(flow) * len(MODES) + MODES.index(mode)
+    base = scenario * 10 ** 7 + concurrency * 10 ** 5
+    run(range(base, base + warmup))
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    timings = run(range(base + warmup, base + warmup + count))
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+
+    latencies = sorted(seconds for seconds, ok in timings if ok)
+    calls = count * CALLS_PER_FLOW
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        peak_rss *= 1024
+    return {
+        "flow": flow,
+        "mode": mode,
+        "concurrency": concurrency,
+        "flows": count,
+        "errors": count - len(latencies),
+        "seconds": elapsed,
+        "flows_per_second": count / elapsed,
+        "requests_per_second": calls / elapsed,
+        "latency_ms": {
+            "p50": _to_ms(percentile(latencies, 0.50)),
+            "p95": _to_ms(percentile(latencies, 0.95)),
+            "p99": _to_ms(percentile(latencies, 0.99)),
+            "max": _to_ms(latencies[-1] if latencies else None),
+        },
+        "cpu_us_per_request": cpu / calls * 1e6,
+        "peak_rss_mb": peak_rss / 2 ** 20,
+    }
+
+
+def percentile(ordered, share):
+    """
+    :param ordered: list  sorted values
+    :param share: float  e.g. 0.99
+    :return: nearest-rank percentile, None without values
+    """
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def _to_ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+
+class LocalServer(object):
+    """
+    src.payway.testing.server in a child process
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0):
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                "-u",
+                "-m",
+                "src.payway.testing.server",
+                "--port",
+                "0",
+                "--latency",
+                str(latency),
+                "--jitter",
+                str(jitter),
+            ],
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        # "Fake PayWay API listening on <url>"
+        self.url = self.process.stdout.readline().split()[-1]
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """
+    Print how each scenario moved against a previous run's JSON output
+    """
+    previous = {
+        (r["flow"], r["mode"], r["concurrency"]): r for r in baseline["results"]
+    }
+    print()
+    print("against %s:" % (baseline.get("commit") or "baseline"))
+    for result in results:
+        before = previous.get((result["flow"], result["mode"], result["concurrency"]))
+        if before is None:
+            continue
+        print(
+            "%-13s %-9s %5d  rps %+6.1f%%  p99 %+6.1f%%  cpu/req %+6.1f%%"
+            % (
+                result["flow"],
+                result["mode"],
+                result["concurrency"],
+                _change(before["requests_per_second"], result["requests_per_second"]),
+                _change(before["latency_ms"]["p99"], result["latency_ms"]["p99"]),
+                _change(before["cpu_us_per_request"], result["cpu_us_per_request"]),
+            )
+        )
+
+
+def _change(before, after):
+    if not before or after is None:
+        return 0.0
+    return (after - before) / before * 100
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--flows", type=int, default=300, help="flows per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured flows first")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma separated levels")
+    parser.add_argument("--flow", default=",".join(FLOWS), help="flows to run")
+    parser.add_argument("--mode", default=",".join(MODES), help="modes to run")
+    parser.add_argument("--latency", type=float, default=0.0, help="server latency, s")
+    parser.add_argument("--jitter", type=float, default=0.0, help="server jitter, s")
+    parser.add_argument("--server", help="URL of an already running fake server")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare")
+    args = parser.parse_args(argv)
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    scenarios = []
+    for flow in args.flow.split(","):
+        for mode in args.mode.split(","):
+            for concurrency in [1] if mode == "sync" else levels:
+                scenarios.append((flow, mode, concurrency))
+
+    server = None
+    url = args.server
+    if url is None:
+        server = LocalServer(args.latency, args.jitter)
+        url = server.url
+    results = []
+    print(
+        "%-13s %-9s %5s %9s %9s %9s %9s %9s %8s %7s"
+        % (
+            "flow",
+            "mode",
+            "conc",
+            "req/s",
+            "p50 ms",
+            "p95 ms",
+            "p99 ms",
+            "cpu us",
+            "rss MB",
+            "errors",
+        )
+    )
+    try:
+        for flow, mode, concurrency in scenarios:
+            # spawn, so every scenario starts from a clean interpreter and its own peak RSS
+            with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as executor:
+                result = executor.submit(
+                    run_scenario, url, flow, mode, concurrency, args.flows, args.warmup
+                ).result()
+            results.append(result)
+            latency = result["latency_ms"]
+            print(
+                "%-13s %-9s %5d %9.0f %9s %9s %9s %9.0f %8.1f %7d"
+                % (
+                    flow,
+                    mode,
+                    result["concurrency"],
+                    result["requests_per_second"],
+                    _ms(latency["p50"]),
+                    _ms(latency["p95"]),
+                    _ms(latency["p99"]),
+                    result["cpu_us_per_request"],
+                    result["peak_rss_mb"],
+                    result["errors"],
+                )
+            )
+    finally:
+        if server is not None:
+            server.stop()
+
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "server": {"url": args.server, "latency": args.latency, "jitter": args.jitter},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+    return report
+
+
+def _ms(value):
+    return "-" if value is None else "%.1f" % value
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Realistic PayWay payloads shared by the benchmarks
+"""
+
+
+def transaction_payload(index=0, status="approved"):
+    """
+    A PayWay transaction response as returned by GET /transactions/{transactionId}
+    :param index: int  varies the identifiers between payloads
+    :param status: str  transaction status
+    """
+    return {
+        "transactionId": 1000000 + index,
+        "receiptNumber": str(2000000000 + index),
+        "status": status,
+        "responseCode": "08" if status == "approved" else "05",
+        "responseText": "Honour with identification" if status == "approved" else "Do not honour",
+        "transactionType": "payment",
+        "customerNumber": "CUST%06d" % (index % 50000),
+        "customerName": "Filippa Padovano",
+        "customerEmail": "filippa.padovano@example.com",
+        "currency": "aud",
+        "principalAmount": 100.0 + index % 1000,
+        "surchargeAmount": 1.5,
+        "paymentAmount": 101.5 + index % 1000,
+        "paymentMethod": "creditCard",
+        "creditCard": {
+            "cardNumber": "471514...6536",
+            "expiryDateMonth": "04",
+            "expiryDateYear": "29",
+            "cardScheme": "visa",
+            "cardType": "credit",
+            "cardholderName": "Filippa Padovano",
+        },
+        "merchant": {
+            "merchantId": "TEST",
+            "merchantName": "Test Merchant",
+            "settlementBsb": "032-002",
+            "settlementAccountNumber": "000000",
+            "surchargeBsb": "032-002",
+            "surchargeAccountNumber": "000000",
+        },
+        "transactionDateTime": "12 Jun 2024 14:%02d AEST" % (index % 60),
+        "user": "SECRET_API_KEY",
+        "settlementDate": "12 Jun 2024",
+        "orderNumber": "ORD%08d" % index,
+        "customerIpAddress": "203.0.113.%d" % (index % 250),
+        "fraudResult": "NOT_CHECKED",
+        "customerIpCountry": "AUS",
+        "cardCountry": "AUS",
+        "customFields": {"customField1": "plan-%d" % (index % 7)},
+        "isVoidable": True,
+        "isRefundable": False,
+    }
+
+
+def customer_payload(index=0, extra_custom_fields=0):
+    """
+    A PayWay customer response as returned by GET /customers/{customerNumber}
+    :param index: int  varies the identifiers between payloads
+    :param extra_custom_fields: int  custom fields added beyond customField1-4
+    """
+    payload = {
+        "customerNumber": "CUST%06d" % index,
+        "paymentSetup": {
+            "paymentMethod": "creditCard",
+            "stopped": False,
+            "creditCard": {
+                "cardNumber": "471514...6536",
+                "expiryDateMonth": "04",
+                "expiryDateYear": "29",
+                "cardScheme": "visa",
+                "cardholderName": "Filippa Padovano",
+            },
+            "merchant": {"merchantId": "TEST", "merchantName": "Test Merchant"},
+        },
+        "contact": {
+            "customerName": "Filippa Padovano",
+            "emailAddress": "filippa.padovano@example.com",
+            "sendEmailReceipts": False,
+            "phoneNumber": "0343232323",
+            "address": {
+                "street1": "1 Test Street",
+                "street2": "2 Test Street",
+                "cityName": "Melbourne",
+                "state": "VIC",
+                "postalCode": "3000",
+            },
+        },
+        "customFields": {
+            "customField1": "plan-gold",
+            "customField2": "referral-%d" % index,
+            "customField3": "region-vic",
+            "customField4": "cohort-2024",
+        },
+        "notes": {"notes": "Created by benchmark"},
+    }
+    payload["customFields"].update(
+        ("extraField%d" % i, "value-%d" % i) for i in range(extra_custom_fields)
+    )
+    return payload
+
+
+def field_errors_payload(count=1):
+    """
+    A PayWay 422 response body listing `count` rejected fields
+    """
+    return {
+        "data": [
+            {
+                "fieldName": "field%d" % i,
+                "message": "must not be blank",
+                "fieldValue": None if i % 2 else "value-%d" % i,
+            }
+            for i in range(count)
+        ]
+    }
+
+
+def server_error_payload():
+    """
+    A PayWay 500 response body
+    """
+    return {"errorNumber": 2, "traceCode": "8e0a7b1c2d3f4a5b"}
@@ -0,0 +1,254 @@
+"""
+Micro-benchmarks of the per-call CPU work every client call does: building request
+payloads, validating responses and parsing them into models.
+
+    python -m benchmarks.hot_paths            # fails (exit 1) on a significant regression
+    python -m benchmarks.hot_paths --update   # record the current timings as the baseline
+
+Timings are compared as multiples of a fixed pure-Python calibration loop timed in the
+same run, so a baseline recorded on one machine remains meaningful on another.
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+from benchmarks.fixtures import (
+    customer_payload,
+    field_errors_payload,
+    server_error_payload,
+    transaction_payload,
+)
+from src.payway import codec
+from src.payway.client.client import PayWayClient
+from src.payway.errors import PaymentError, PaywayError
+from src.payway.models import (
+    LazyPayWayTransaction,
+    PayWayCustomer,
+    PayWayPayment,
+    PayWayTransaction,
+)
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "hot_paths_baseline.json")
+# slower than the baseline by more than this share fails the run
+DEFAULT_TOLERANCE = 0.5
+# a benchmark over the threshold is measured again this many times before it fails
+RETRIES = 2
+TARGET_SECONDS = 0.05
+REPEAT = 7
+
+
+class FakeResponse(object):
+    """
+    The attributes _validate_response reads from a requests or httpx response
+    """
+
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self.content = b"" if payload is None else codec.dumps(payload)
+        self.url = "https://api.payway.com.au/rest/v1/transactions"
+        self.reason = "Conflict"
+
+
+def _customer():
+    return PayWayCustomer(
+        custom_id="CUST000001",
+        customer_name="Filippa Padovano",
+        email_address="filippa.padovano@example.com",
+        send_email_receipts=True,
+        phone_number="0343232323",
+        street="1 Test Street",
+        street2="2 Test Street",
+        city_name="Melbourne",
+        state="VIC",
+        postal_code="3000",
+        token="d2c2cbf0-1e1e-4d4b-9b7e-5f2a0c6c4e1a",
+        notes="Created by benchmark",
+        custom_field_1="plan-gold",
+        custom_field_2="referral-1",
+        custom_field_3="region-vic",
+        custom_field_4="cohort-2024",
+    )
+
+
+def _payment():
+    return PayWayPayment(
+        transaction_type="payment",
+        customer_number="CUST000001",
+        amount="100.00",
+        currency="aud",
+        order_number="ORD00000001",
+        ip_address="203.0.113.7",
+        merchant_id="TEST",
+    )
+
+
+def _raises(func, *args):
+    def call():
+        try:
+            func(*args)
+        except PaywayError:
+            pass
+
+    return call
+
+
+def benchmarks():
+    """
+    :return: dict  name -> callable doing one unit of work
+    """
+    payway_client = PayWayClient(
+        "https://api.payway.com.au/rest/v1", "TEST", "0000000A", "SECRET", "PUBLISHABLE"
+    )
+    validate = payway_client._validate_response
+    customer = _customer()
+    payment = _payment()
+    transaction = transaction_payload(1)
+    transaction_bytes = codec.dumps(transaction)
+    # PayWayCustomer reads customField1-4 only, the other 196 are skipped
+    customer_large = customer_payload(1, extra_custom_fields=196)
+    errors_small = field_errors_payload(3)
+    errors_large = field_errors_payload(200)
+    ok = FakeResponse(200, transaction)
+    rejected = FakeResponse(422, errors_small)
+    rejected_large = FakeResponse(422, errors_large)
+    conflict = FakeResponse(409)
+    server_error = FakeResponse(500, server_error_payload())
+    return {
+        "PayWayCustomer.to_dict": customer.to_dict,
+        "PayWayPayment.to_dict": payment.to_dict,
+        "PayWayTransaction.from_dict": lambda: PayWayTransaction.from_dict(transaction),
+        "LazyPayWayTransaction.from_dict": lambda: LazyPayWayTransaction.from_dict(
+            transaction_bytes
+        ).status,
+        "PayWayCustomer.from_dict[4 customFields + 196 ignored]": lambda: (
+            PayWayCustomer.from_dict(customer_large)
+        ),
+        "PaymentError.from_dict[3]": lambda: PaymentError.from_dict(errors_small),
+        "PaymentError.from_dict[200]": lambda: PaymentError.from_dict(errors_large),
+        "_validate_response[200]": lambda: validate(ok),
+        "_validate_response[422]": lambda: validate(rejected),
+        "_validate_response[422, 200 errors]": lambda: validate(rejected_large),
+        "_validate_response[409]": _raises(validate, conflict),
+        "_validate_response[500]": _raises(validate, server_error),
+    }
+
+
+def _calibration():
+    total = 0
+    for i in range(100):
+        item = {"index": i, "name": "item-%d" % i}
+        total += len(item["name"])
+    return total
+
+
+def per_call(func):
+    """
+    :return: float  best microseconds per call
+    """
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * TARGET_SECONDS / max(elapsed, 1e-9)))
+    return min(timer.repeat(repeat=REPEAT, number=number)) / number * 1e6
+
+
+def run(functions):
+    """
+    :param functions: dict  name -> callable, see benchmarks()
+    :return: tuple (calibration microseconds, dict name -> microseconds per call)
+    """
+    # calibrate between benchmarks too, the best of several is less exposed to noise
+    calibrations = []
+    timings = {}
+    for name, func in functions.items():
+        calibrations.append(per_call(_calibration))
+        timings[name] = per_call(func)
+    return min(calibrations), timings
+
+
+def _regressions(relative, baseline, tolerance):
+    return [
+        name
+        for name, value in relative.items()
+        if name in baseline and value > baseline[name] * (1 + tolerance)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--update", action="store_true", help="write a new baseline")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=None)
+    args = parser.parse_args(argv)
+
+    functions = benchmarks()
+    calibration, timings = run(functions)
+    relative = {name: us / calibration for name, us in timings.items()}
+    if args.update:
+        with open(args.baseline, "w") as f:
+            json.dump(
+                {
+                    "tolerance": args.tolerance or DEFAULT_TOLERANCE,
+                    "calibration_us": calibration,
+                    "benchmarks": relative,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+            f.write("\n")
+
+    baseline = {}
+    tolerance = args.tolerance or DEFAULT_TOLERANCE
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            recorded = json.load(f)
+        baseline = recorded["benchmarks"]
+        if args.tolerance is None:
+            tolerance = recorded.get("tolerance", DEFAULT_TOLERANCE)
+
+    # rule out a noisy moment before failing the run
+    for _ in range(RETRIES):
+        regressions = _regressions(relative, baseline, tolerance)
+        if not regressions:
+            break
+        calibration_again, timings_again = run(
+            {name: functions[name] for name in regressions}
+        )
+        for name in regressions:
+            relative[name] = min(
+                relative[name], timings_again[name] / calibration_again
+            )
+            timings[name] = relative[name] * calibration
+    regressions = _regressions(relative, baseline, tolerance)
+
+    print("calibration %.2f us" % calibration)
+    print("%-56s %10s %10s %10s" % ("benchmark", "us/call", "relative", "baseline"))
+    for name, us in timings.items():
+        expected = baseline.get(name)
+        flag = ""
+        if name in regressions:
+            flag = "  REGRESSION +%.0f%%" % ((relative[name] / expected - 1) * 100)
+        print(
+            "%-56s %10.2f %10.3f %10s%s"
+            % (
+                name,
+                us,
+                relative[name],
+                "-" if expected is None else "%.3f" % expected,
+                flag,
+            )
+        )
+    if regressions:
+        print(
+            "%d benchmark(s) more than %.0f%% slower than the baseline"
+            % (len(regressions), tolerance * 100)
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
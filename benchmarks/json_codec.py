@@ -0,0 +1,54 @@
+"""
+Compares decoding and encoding of PayWay transaction payloads with each available JSON codec.
+"response.json()" is the path the client used before: decode the body to text, then parse it.
+
+    python -m benchmarks.json_codec [count]
+"""
+import json
+import sys
+import timeit
+
+from benchmarks.fixtures import transaction_payload
+from src.payway.codec import OrjsonCodec, StdlibJSONCodec, orjson
+
+
+def available_codecs():
+    codecs = [StdlibJSONCodec()]
+    if orjson is not None:
+        codecs.append(OrjsonCodec())
+    return codecs
+
+
+def per_call(func, items, repeat=3):
+    """
+    :return: float  best microseconds per item over `repeat` runs
+    """
+    best = min(timeit.repeat(lambda: [func(item) for item in items], number=1, repeat=repeat))
+    return best / len(items) * 1e6
+
+
+def main(count=20000):
+    payloads = [transaction_payload(i) for i in range(count)]
+    bodies = [json.dumps(payload).encode("utf-8") for payload in payloads]
+    results = {
+        "response.json()": {
+            "decode": per_call(lambda body: json.loads(body.decode("utf-8")), bodies)
+        }
+    }
+    for codec in available_codecs():
+        results[codec.name] = {
+            "decode": per_call(codec.loads, bodies),
+            "encode": per_call(codec.dumps, payloads),
+        }
+    print("%-16s %12s %12s" % ("codec", "decode us", "encode us"))
+    for name, timings in results.items():
+        encode = timings.get("encode")
+        print(
+            "%-16s %12.2f %12s"
+            % (name, timings["decode"], "%.2f" % encode if encode is not None else "-")
+        )
+    return results
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,45 @@
+"""
+Measures the memory held per model instance when many PayWay objects are kept in memory.
+
+    python -m benchmarks.model_memory [count]
+"""
+import sys
+import tracemalloc
+
+from benchmarks.fixtures import customer_payload, transaction_payload
+from src.payway.models import PayWayCustomer, PayWayTransaction
+
+
+def measure(build, count):
+    """
+    :param build: callable(index) returning one object
+    :param count: int  objects to build
+    :return: float  bytes allocated per object and kept alive
+    """
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    objects = [build(i) for i in range(count)]
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return (end - start) / count
+
+
+def main(count=100000):
+    transactions = [transaction_payload(i) for i in range(count)]
+    customers = [customer_payload(i) for i in range(count // 10)]
+    results = {
+        "PayWayTransaction": measure(
+            lambda i: PayWayTransaction.from_dict(transactions[i]), count
+        ),
+        "PayWayCustomer": measure(
+            lambda i: PayWayCustomer.from_dict(customers[i]), count // 10
+        ),
+    }
+    for name, per_instance in results.items():
+        print("%-20s %8.0f bytes per instance (including nested objects)" % (name, per_instance))
+    return results
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
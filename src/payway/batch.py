@@ -0,0 +1,205 @@
+import sqlite3
+import time
+import uuid
+from logging import getLogger
+
+from .client.concurrency import DEFAULT_CONCURRENCY, bounded_map
+from .consts import (
+    APPROVED_CONDITIONAL_TRANSACTION_STATUS,
+    APPROVED_TRANSACTION_STATUS,
+    DECLINED_TRANSACTION_STATUS,
+    PENDING_TRANSACTION_STATUS,
+    SUMMARY_CODES,
+    TRANSACTION_APPROVED,
+    TRANSACTION_DECLINED,
+    TRANSACTION_ERRED,
+    TRANSACTION_REJECTED,
+)
+
+logger = getLogger(__name__)
+
+# Namespace for deterministic batch idempotency keys
+BATCH_KEY_NAMESPACE = uuid.UUID("6f1c2d5e-8a4b-4f0e-9c73-2b1d8e5a7c40")
+
+ACCEPTED_TRANSACTION_STATUSES = (
+    APPROVED_TRANSACTION_STATUS,
+    APPROVED_CONDITIONAL_TRANSACTION_STATUS,
+    PENDING_TRANSACTION_STATUS,
+)
+
+
+def summary_code(transaction, errors):
+    """
+    Classify the outcome of a payment into one of SUMMARY_CODES
+    :param transaction: PayWayTransaction or None
+    :param errors: list of PaymentError, an exception, or None
+    """
+    if isinstance(errors, Exception):
+        return TRANSACTION_ERRED
+    if errors:
+        return TRANSACTION_REJECTED
+    if transaction.status in ACCEPTED_TRANSACTION_STATUSES:
+        return TRANSACTION_APPROVED
+    if transaction.status == DECLINED_TRANSACTION_STATUS:
+        return TRANSACTION_DECLINED
+    return TRANSACTION_ERRED
+
+
+class BatchReport(object):
+    """
+    processed: int: payments sent to PayWay in this run
+    skipped: int: payments already completed by a previous run of the same batch
+    counts: dict: number of payments per SUMMARY_CODES code
+    elapsed: float: seconds spent processing
+    """
+
+    def __init__(self):
+        self.processed = 0
+        self.skipped = 0
+        self.counts = dict.fromkeys(SUMMARY_CODES, 0)
+        self.elapsed = 0.0
+
+    @property
+    def throughput(self):
+        """
+        Payments processed per second
+        """
+        if not self.elapsed:
+            return 0.0
+        return self.processed / self.elapsed
+
+    def to_dict(self):
+        return {
+            "processed": self.processed,
+            "skipped": self.skipped,
+            "elapsed": self.elapsed,
+            "throughput": self.throughput,
+            "outcomes": {
+                SUMMARY_CODES[code]: count for code, count in self.counts.items()
+            },
+        }
+
+
+class PaymentBatch(object):
+    """
+    Processes a stream of PayWayPayment objects concurrently for a recurring billing run.
+
+    Every payment gets an idempotency key derived from the batch ID, its position in the
+    stream and the payment itself, and each final outcome is recorded in a checkpoint
+    database. Running the same batch again after a crash, over the same payments in the
+    same order, skips the completed payments and resends the in-flight ones with their
+    original keys, so PayWay never charges a customer twice. Completed payments are looked
+    up in the checkpoint's index, so memory stays flat however large the run is.
+    """
+
+    def __init__(
+        self,
+        client,
+        batch_id,
+        checkpoint_path=None,
+        concurrency=DEFAULT_CONCURRENCY,
+        on_result=None,
+    ):
+        """
+        :param client : PayWayClient                    = Client used to process the payments
+        :param batch_id : str                           = Identifies the billing run, reuse it to resume
+        :param checkpoint_path : str                    = SQLite database recording completed payments
+        :param concurrency : int                        = Max payments in flight
+        :param on_result : callable                     = Called with (payment, transaction, errors) per payment
+        """
+        self.client = client
+        self.batch_id = batch_id
+        self.checkpoint_path = checkpoint_path
+        self.concurrency = concurrency
+        self.on_result = on_result
+
+    def idempotency_key(self, payment, position):
+        """
+        Deterministic idempotency key for a payment within this batch. The position keeps
+        two identical payments of one run apart.
+        :param payment: PayWayPayment
+        :param position: int  index of the payment in the batch's input
+        """
+        fields = [self.batch_id, str(position)] + [
+            str(value) for value in sorted(payment.to_dict().items())
+        ]
+        return str(uuid.uuid5(BATCH_KEY_NAMESPACE, "|".join(fields)))
+
+    def _open_checkpoint(self):
+        if not self.checkpoint_path:
+            return None
+        connection = sqlite3.connect(self.checkpoint_path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS completed_payments ("
+                "key TEXT PRIMARY KEY, summary_code TEXT NOT NULL, transaction_id TEXT)"
+            )
+        return connection
+
+    @staticmethod
+    def _completed(checkpoint, key):
+        return (
+            checkpoint.execute(
+                "SELECT 1 FROM completed_payments WHERE key = ?", (key,)
+            ).fetchone()
+            is not None
+        )
+
+    def _process(self, item):
+        payment, key = item
+        return self.client.process_payment(payment, idempotency_key=key)
+
+    def run(self, payments):
+        """
+        Process all payments and return a BatchReport.
+        Payments are pulled from the iterable lazily, so generators of any size keep memory flat.
+        :param payments: iterable of PayWayPayment, in the same order when resuming
+        """
+        report = BatchReport()
+        checkpoint = self._open_checkpoint()
+
+        def pending_payments():
+            for position, payment in enumerate(payments):
+                key = self.idempotency_key(payment, position)
+                if checkpoint is not None and self._completed(checkpoint, key):
+                    report.skipped += 1
+                    continue
+                yield payment, key
+
+        started = time.monotonic()
+        try:
+            for (payment, key), future in bounded_map(
+                self._process, pending_payments(), self.concurrency
+            ):
+                try:
+                    transaction, errors = future.result()
+                except Exception as e:
+                    logger.warning("Payment %s failed: %s" % (key, e))
+                    transaction, errors = None, e
+                code = summary_code(transaction, errors)
+                report.processed += 1
+                report.counts[code] += 1
+                # erred payments are left out of the checkpoint so a resumed run retries them
+                if checkpoint is not None and code != TRANSACTION_ERRED:
+                    with checkpoint:
+                        checkpoint.execute(
+                            "INSERT OR REPLACE INTO completed_payments "
+                            "(key, summary_code, transaction_id) VALUES (?, ?, ?)",
+                            (
+                                key,
+                                code,
+                                str(transaction.transaction_id)
+                                if transaction
+                                else None,
+                            ),
+                        )
+                if self.on_result is not None:
+                    self.on_result(payment, transaction, errors)
+        finally:
+            report.elapsed = time.monotonic() - started
+            if checkpoint is not None:
+                checkpoint.close()
+        logger.info("Batch %s finished: %s" % (self.batch_id, report.to_dict()))
+        return report
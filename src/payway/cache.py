@@ -0,0 +1,384 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from . import codec
+from .consts import (
+    APPROVED_TRANSACTION_STATUS,
+    DECLINED_TRANSACTION_STATUS,
+    VOID_TRANSACTION_STATUS,
+)
+
+
+DEFAULT_CACHE_MAXSIZE = 10000
+DEFAULT_TRANSACTION_CACHE_BYTES = 64 * 1024 * 1024
+DEFAULT_PENDING_TRANSACTION_TTL = 30
+# hits after which an SQLiteCache writes their times without waiting for a set
+ACCESS_WRITE_BATCH = 100
+
+# a transaction in one of these states never changes again
+TERMINAL_TRANSACTION_STATUSES = (
+    APPROVED_TRANSACTION_STATUS,
+    DECLINED_TRANSACTION_STATUS,
+    VOID_TRANSACTION_STATUS,
+)
+
+
+class CacheStats(object):
+    """
+    hits: int: lookups answered from the cache
+    misses: int: lookups that found nothing live
+    evictions: int: entries dropped for space or because they expired
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0.0
+        return self.hits / lookups
+
+    def to_dict(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hitRate": self.hit_rate,
+        }
+
+
+class MemoryCache(object):
+    """
+    Thread safe in-process LRU cache with per-entry time to live.
+    Values should be JSON-like (dicts of PayWay response data) so the caches are
+    interchangeable with SQLiteCache.
+
+    maxsize: int: entries kept before the least recently used is evicted, None for no limit
+    ttl: float: default seconds an entry stays valid, None to keep it until evicted
+    max_bytes: int: budget for the JSON encoded size of all values, None for no limit
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_MAXSIZE, ttl=None, max_bytes=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.stats = CacheStats()
+
+    def _expires(self, ttl):
+        if ttl is None:
+            ttl = self.ttl
+        if ttl is None:
+            return None
+        return time.monotonic() + ttl
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        value, expires, size = entry
+        if expires is not None and expires <= time.monotonic():
+            self._pop(key)
+            self.stats.misses += 1
+            self.stats.evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= entry[2]
+
+    def _set(self, key, value, ttl):
+        size = 0
+        if self.max_bytes is not None:
+            size = len(codec.dumps(value))
+        self._pop(key)
+        self._entries[key] = (value, self._expires(ttl), size)
+        self.size_bytes += size
+        while self._entries and (
+            (self.maxsize is not None and len(self._entries) > self.maxsize)
+            or (self.max_bytes is not None and self.size_bytes > self.max_bytes)
+        ):
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self.size_bytes -= evicted_size
+            self.stats.evictions += 1
+
+    def get(self, key):
+        """
+        :return: the cached value, or None if missing or expired
+        """
+        with self._lock:
+            return self._get(key)
+
+    def set(self, key, value, ttl=None):
+        """
+        :param ttl: float  seconds this entry stays valid, defaults to the cache ttl
+        """
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def setdefault(self, key, value, ttl=None):
+        """
+        Atomically store value unless a live entry exists
+        :return: the value now cached under key
+        """
+        with self._lock:
+            current = self._get(key)
+            if current is not None:
+                return current
+            self._set(key, value, ttl)
+            return value
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache(object):
+    """
+    LRU cache with per-entry time to live stored in a local SQLite database, so several
+    worker processes on one host can share it. The database runs in WAL mode so readers
+    never block the writer.
+
+    A lookup is a plain read and never takes the write lock. The time of each hit is
+    kept in memory and written in a batch with the next write, so the eviction order
+    is approximately least recently used.
+
+    path: str: database file shared by all processes
+    maxsize: int: entries kept before the least recently used are evicted
+    ttl: float: default seconds an entry stays valid, None to keep it until evicted
+
+    stats are counted per process.
+    """
+
+    def __init__(self, path, maxsize=DEFAULT_CACHE_MAXSIZE, ttl=None, table="payway_cache"):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.table = table
+        self._local = threading.local()
+        # eviction scans the table, so it runs every few writes and lets the table
+        # overshoot maxsize by about one percent in between
+        self._evict_every = maxsize // 100 + 1
+        self._writes = 0
+        # key -> time of the last hit not yet written to the database
+        self._accessed = {}
+        self._accessed_lock = threading.Lock()
+        self.stats = CacheStats()
+        with self._transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS %s ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL, accessed REAL NOT NULL)"
+                % self.table
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS %s_accessed ON %s (accessed)"
+                % (self.table, self.table)
+            )
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def _expires(self, ttl):
+        if ttl is None:
+            ttl = self.ttl
+        if ttl is None:
+            return None
+        return time.time() + ttl
+
+    def _get(self, connection, key, now):
+        row = connection.execute(
+            "SELECT value FROM %s WHERE key = ? AND (expires IS NULL OR expires > ?)"
+            % self.table,
+            (key, now),
+        ).fetchone()
+        if row is None:
+            self.stats.misses += 1
+            return None
+        with self._accessed_lock:
+            self._accessed[key] = now
+        self.stats.hits += 1
+        return codec.loads(row[0])
+
+    def _write_accessed(self, connection):
+        with self._accessed_lock:
+            accessed, self._accessed = self._accessed, {}
+        if accessed:
+            connection.executemany(
+                "UPDATE %s SET accessed = ? WHERE key = ?" % self.table,
+                [(now, key) for key, now in accessed.items()],
+            )
+
+    def _set(self, connection, key, value, ttl, now):
+        connection.execute(
+            "INSERT OR REPLACE INTO %s (key, value, expires, accessed) VALUES (?, ?, ?, ?)"
+            % self.table,
+            (key, codec.dumps(value), self._expires(ttl), now),
+        )
+        self._writes += 1
+        self._write_accessed(connection)
+        if self._writes % self._evict_every == 0:
+            self._evict(connection)
+
+    def _evict(self, connection):
+        expired = connection.execute(
+            "DELETE FROM %s WHERE expires IS NOT NULL AND expires <= ?" % self.table,
+            (time.time(),),
+        )
+        self.stats.evictions += expired.rowcount
+        evicted = connection.execute(
+            "DELETE FROM %s WHERE key IN (SELECT key FROM %s ORDER BY accessed DESC "
+            "LIMIT -1 OFFSET ?)" % (self.table, self.table),
+            (self.maxsize,),
+        )
+        self.stats.evictions += evicted.rowcount
+
+    def get(self, key):
+        """
+        :return: the cached value, or None if missing or expired
+        """
+        # autocommit read, it holds no lock beyond the SELECT itself
+        value = self._get(self._connection(), key, time.time())
+        if self._accessed and self.stats.hits % ACCESS_WRITE_BATCH == 0:
+            # a process that only reads still has to pass its hits on to eviction
+            with self._transaction() as connection:
+                self._write_accessed(connection)
+        return value
+
+    def set(self, key, value, ttl=None):
+        """
+        :param ttl: float  seconds this entry stays valid, defaults to the cache ttl
+        """
+        with self._transaction() as connection:
+            self._set(connection, key, value, ttl, time.time())
+
+    def setdefault(self, key, value, ttl=None):
+        """
+        Atomically store value unless a live entry exists
+        :return: the value now cached under key
+        """
+        with self._transaction() as connection:
+            now = time.time()
+            current = self._get(connection, key, now)
+            if current is not None:
+                return current
+            self._set(connection, key, value, ttl, now)
+            return value
+
+    def delete(self, key):
+        with self._accessed_lock:
+            self._accessed.pop(key, None)
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM %s WHERE key = ?" % self.table, (key,))
+
+    def clear(self):
+        with self._accessed_lock:
+            self._accessed.clear()
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM %s" % self.table)
+
+    def __len__(self):
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM %s" % self.table
+        ).fetchone()[0]
+
+
+class TransactionCache(object):
+    """
+    Cache of PayWay transaction response bodies keyed by transaction ID.
+
+    Transactions in a terminal status (approved, declined, voided) never change, so they
+    stay cached until the byte budget forces them out. Any other transaction (pending,
+    approved*, ...) may still move on and is only kept for a short TTL.
+
+    cache: MemoryCache or SQLiteCache: backend, by default a MemoryCache bounded by max_bytes
+    pending_ttl: float: seconds a non terminal transaction stays valid
+    """
+
+    def __init__(
+        self,
+        cache=None,
+        pending_ttl=DEFAULT_PENDING_TRANSACTION_TTL,
+        max_bytes=DEFAULT_TRANSACTION_CACHE_BYTES,
+    ):
+        """
+        :param max_bytes: int  byte budget of the default MemoryCache backend
+        """
+        if cache is None:
+            cache = MemoryCache(maxsize=None, max_bytes=max_bytes)
+        self.cache = cache
+        self.pending_ttl = pending_ttl
+
+    @property
+    def stats(self):
+        return self.cache.stats
+
+    def get(self, transaction_id):
+        return self.cache.get(str(transaction_id))
+
+    def set(self, transaction_id, body, ttl=None):
+        """
+        :param body: dict  PayWay transaction response
+        :param ttl: float  overrides the status based TTL
+        """
+        if ttl is None and body.get("status") not in TERMINAL_TRANSACTION_STATUSES:
+            ttl = self.pending_ttl
+        self.cache.set(str(transaction_id), body, ttl=ttl)
+
+    def delete(self, transaction_id):
+        self.cache.delete(str(transaction_id))
+
+    def clear(self):
+        self.cache.clear()
+
+    def __len__(self):
+        return len(self.cache)
+
+
+class _Transaction(object):
+    """
+    Runs a block inside an immediate (write locked) SQLite transaction
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.connection.execute("COMMIT")
+        else:
+            self.connection.execute("ROLLBACK")
@@ -0,0 +1,404 @@
+import asyncio
+import time
+from logging import getLogger
+
+import httpx
+
+from . import timeouts, tracing
+from .base import BaseClient
+from .checkout import CheckoutRequest, CheckoutResult
+from .concurrency import DEFAULT_CONCURRENCY, async_bounded_map
+from .customer import CustomerRequest
+from .payment import PaymentRequest
+from .transaction import TransactionRequest
+from .ratelimit import RetryPolicy
+from .schedule import ScheduleRequest, _Progress
+from .timeouts import DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+from .transport import DEFAULT_KEEP_ALIVE
+
+
+logger = getLogger(__name__)
+
+DEFAULT_ASYNC_POOL_MAXSIZE = 100
+
+
+class AsyncPayWayTransport(object):
+    """
+    Sends HTTP requests to PayWay over a single httpx.AsyncClient, so every coroutine
+    running on the event loop shares one pool of keep-alive connections.
+    """
+
+    def __init__(
+        self,
+        pool_maxsize=DEFAULT_ASYNC_POOL_MAXSIZE,
+        keep_alive=DEFAULT_KEEP_ALIVE,
+        connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+        read_timeout=DEFAULT_READ_TIMEOUT,
+    ):
+        """
+        :param pool_maxsize     : int       = Max concurrent connections, further requests wait for a free one
+        :param keep_alive       : float     = Seconds an idle connection may be reused
+        :param connect_timeout  : float     = Default seconds to establish a connection, None to wait forever
+        :param read_timeout     : float     = Default seconds to wait for data from PayWay, None to wait forever
+        """
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=pool_maxsize,
+                max_keepalive_connections=pool_maxsize,
+                keepalive_expiry=keep_alive,
+            ),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+
+    async def request(self, method, url, **kwargs):
+        """
+        Send a request through the pooled async session
+        :param method: str  HTTP method
+        :param url: str  absolute URL
+        :param kwargs: passed through to httpx.AsyncClient.request, timeout may be
+                       a (connect, read) tuple as with requests
+        """
+        timeout = kwargs.get("timeout")
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            kwargs["timeout"] = httpx.Timeout(read, connect=connect)
+        return await self.session.request(method, url, **kwargs)
+
+    async def close(self):
+        """
+        Close all pooled connections
+        """
+        await self.session.aclose()
+
+
+class AsyncBaseClient(BaseClient):
+    """
+    Sends the PayWayRequests built by the request mixins without blocking the event loop.
+    Response validation and parsing are shared with the sync client.
+    """
+
+    async def _send(self, request):
+        body = self._lookup(request)
+        if body is not None:
+            return self._parse(request, body), None
+        response = await self._perform(request)
+        return self._handle_response(request, response)
+
+    async def _perform(self, request):
+        attempt = 0
+        while True:
+            # an expired deadline is the caller's, not a failure of PayWay to report
+            timeouts.check_deadline()
+            self._check_circuit(request)
+            delay = self._rate_limit_delay()
+            if delay:
+                timeouts.check_deadline(delay)
+                await asyncio.sleep(delay)
+            started = time.monotonic()
+            try:
+                if self.hedging_policy is not None and request.method == "GET":
+                    response = await self._dispatch_hedged(request)
+                else:
+                    response = await self._dispatch(request)
+            except Exception as e:
+                self._record_outcome(request, None, started, error=e)
+                raise
+            except BaseException:
+                # cancelled or interrupted: says nothing about PayWay's health
+                self._record_outcome(request, None, started, abandoned=True)
+                raise
+            self._record_outcome(request, response, started)
+            delay = self._retry_delay(request, response, attempt)
+            if delay is None:
+                return response
+            timeouts.check_deadline(delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _dispatch_hedged(self, request):
+        # same as BaseClient._dispatch_hedged, but the losing request is cancelled
+        policy = self.hedging_policy
+        delay = policy.hedge_delay()
+        started = time.monotonic()
+        attempts = [asyncio.ensure_future(self._dispatch(request))]
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(attempts, timeout=delay)
+                if not done and policy.acquire():
+                    logger.info("Hedging %s %s" % (request.method, request.endpoint))
+                    attempts.append(asyncio.ensure_future(self._dispatch(request)))
+            pending = attempts
+            while True:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                winner = self._hedge_winner(done, pending)
+                if winner is not None:
+                    if winner.exception() is None:
+                        policy.record(time.monotonic() - started)
+                    return winner.result()
+        finally:
+            for attempt in attempts:
+                if not attempt.done():
+                    attempt.cancel()
+                elif not attempt.cancelled():
+                    # marks the error of a losing attempt as seen
+                    attempt.exception()
+
+    async def _dispatch(self, request):
+        auth = request.auth or (self.secret_api_key, "")
+        with tracing.span(
+            self, "attempt", method=request.method, endpoint=request.endpoint
+        ) as span:
+            kwargs = {}
+            if span is not None:
+                kwargs["extensions"] = {"trace": tracing.httpx_trace_extension(span)}
+            try:
+                response = await self.transport.request(
+                    request.method,
+                    self.payway_api_base_url + request.endpoint,
+                    auth=auth,
+                    data=request.data,
+                    headers=request.headers,
+                    timeout=self._request_timeout(),
+                    **kwargs
+                )
+            except httpx.TimeoutException as e:
+                raise timeouts.timeout_error(e) from e
+            if span is not None:
+                span.set("status", response.status_code)
+            return response
+
+
+class AsyncPayWayClient(
+    CheckoutRequest,
+    CustomerRequest,
+    ScheduleRequest,
+    TransactionRequest,
+    PaymentRequest,
+    AsyncBaseClient,
+):
+    """
+    asyncio PayWay Client with the same methods as PayWayClient.
+    Every request method returns an awaitable resolving to the usual (result, errors) pair:
+
+        token_response, errors = await payway_client.create_card_token(card)
+    """
+
+    def __init__(
+        self,
+        api_base_url,
+        merchant_id,
+        bank_account_id,
+        secret_api_key,
+        publishable_api_key,
+        pool_maxsize=DEFAULT_ASYNC_POOL_MAXSIZE,
+        keep_alive=DEFAULT_KEEP_ALIVE,
+        connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+        read_timeout=DEFAULT_READ_TIMEOUT,
+        transport=None,
+        rate_limiter=None,
+        retry_policy=None,
+        circuit_breaker=None,
+        hedging_policy=None,
+        metrics=None,
+        tracer=None,
+        auto_idempotency=True,
+        idempotency_store=None,
+        customer_cache=None,
+        transaction_cache=None,
+        lazy_transactions=False,
+        ledger=None,
+    ):
+        """
+        :param api_base_url : str                       = PayWay API Base URL
+        :param merchant_id        : str                 = PayWay Merchant ID
+        :param bank_account_id   : str                  = PayWay Bank Account ID
+        :param secret_api_key   : str                   = PayWay Secret APi Key
+        :param publishable_api_key   : str              = PayWay Publishable API Key
+        :param pool_maxsize   : int                     = Max concurrent connections to PayWay
+        :param keep_alive   : float                     = Seconds an idle connection may be reused
+        :param connect_timeout   : float              = Default seconds to establish a connection, see also timeout()
+        :param read_timeout   : float                 = Default seconds to wait for data from PayWay
+        :param transport   : AsyncPayWayTransport       = Share an existing transport (ignores pool settings)
+        :param rate_limiter   : TokenBucket             = Paces requests, share one to share a budget
+        :param retry_policy   : RetryPolicy             = Retries throttled idempotent requests, defaults to RetryPolicy()
+        :param circuit_breaker   : CircuitBreaker       = Fails fast while PayWay is failing an endpoint family,
+                                                          share one between clients to share its view
+        :param hedging_policy   : HedgingPolicy         = Opt-in hedging of slow GET lookups, e.g. HedgingPolicy(budget=0.05)
+        :param metrics   : MetricsHook                  = Receives latency, status, retry, timeout, size and parse
+                                                          measurements, e.g. InMemoryMetrics()
+        :param tracer   : Tracer                        = Records a span per phase of every call,
+                                                          e.g. Tracer(JSONLinesExporter("spans.jsonl"))
+        :param auto_idempotency   : bool                = Give payments, refunds, voids, customers and tokens
+                                                          a new idempotency key per call, reused by its retries
+        :param idempotency_store   : IdempotencyStore   = Opt-in record of responses to calls made with your own
+                                                          idempotency key, replayed when the key is used again
+        :param customer_cache   : MemoryCache           = Opt-in cache for get_customer, e.g. MemoryCache(ttl=300)
+                                                          or SQLiteCache(path, ttl=300) shared between processes
+        :param transaction_cache   : TransactionCache   = Opt-in cache for get_transaction, kept up to date by
+                                                          payments, refunds and voids
+        :param lazy_transactions   : bool               = Return LazyPayWayTransaction objects that only decode
+                                                          the fields that are read
+        :param ledger   : TransactionLedger             = Opt-in local record of every transaction received,
+                                                          queryable without calling PayWay
+        """
+        self._validate_credentials(
+            merchant_id, bank_account_id, secret_api_key, publishable_api_key
+        )
+        self.payway_api_base_url = api_base_url
+        self.merchant_id = merchant_id
+        self.bank_account_id = bank_account_id
+        self.secret_api_key = secret_api_key
+        self.publishable_api_key = publishable_api_key
+
+        if transport is None:
+            transport = AsyncPayWayTransport(
+                pool_maxsize=pool_maxsize,
+                keep_alive=keep_alive,
+                connect_timeout=connect_timeout,
+                read_timeout=read_timeout,
+            )
+        self.transport = transport
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.circuit_breaker = circuit_breaker
+        self.hedging_policy = hedging_policy
+        self.metrics = metrics
+        self.tracer = tracer
+        if metrics is not None:
+            metrics.track_transport(transport)
+        self.auto_idempotency = auto_idempotency
+        self.idempotency_store = idempotency_store
+        self.customer_cache = customer_cache
+        self.transaction_cache = transaction_cache
+        self.ledger = ledger
+        self._use_lazy_transactions(lazy_transactions)
+
+    async def get_transactions(self, transaction_ids, concurrency=DEFAULT_CONCURRENCY):
+        """
+        Lookup many transactions concurrently, yielding each result as soon as it arrives.
+        A failed lookup is yielded alongside the others instead of aborting the batch.
+        :param transaction_ids: iterable of str PayWay transaction IDs, consumed lazily
+        :param concurrency: int  max lookups in flight
+        :return: async generator of (transaction_id, result) in completion order, where result
+                 is a PayWayTransaction, a list of PaymentError, or the exception raised
+        """
+        async for transaction_id, task in async_bounded_map(
+            self.get_transaction, transaction_ids, concurrency
+        ):
+            try:
+                transaction, errors = task.result()
+            except Exception as e:
+                logger.warning("Lookup of transaction %s failed: %s" % (transaction_id, e))
+                yield transaction_id, e
+                continue
+            yield transaction_id, errors or transaction
+
+    async def set_schedules(
+        self, schedules, concurrency=DEFAULT_CONCURRENCY, on_progress=None
+    ):
+        """
+        Set the schedules of many customers concurrently, yielding each result as soon as
+        it arrives. A failed update is yielded alongside the others instead of aborting.
+        :param schedules: iterable of (customer_id, PayWaySchedule), consumed lazily
+        :param concurrency: int  max updates in flight
+        :param on_progress: callable  called with (succeeded, failed) after every update
+        :return: async generator of (customer_id, result) in completion order, where result
+                 is a PayWaySchedule, a list of PaymentError, or the exception raised
+        """
+        progress = _Progress(on_progress)
+        async for (customer_id, _), task in async_bounded_map(
+            self._set_schedule_item, schedules, concurrency
+        ):
+            try:
+                schedule, errors = task.result()
+            except Exception as e:
+                logger.warning("Schedule of customer %s failed: %s" % (customer_id, e))
+                progress.update(False)
+                yield customer_id, e
+                continue
+            progress.update(not errors)
+            yield customer_id, errors or schedule
+
+    @tracing.traced
+    async def checkout(
+        self,
+        payment,
+        payment_details=None,
+        token=None,
+        customer=None,
+        customer_number=None,
+    ):
+        """
+        Take a payment in as few sequential round trips as the flow allows, see
+        PayWayClient.checkout
+        :return: CheckoutResult
+        """
+        started = time.perf_counter()
+        result = CheckoutResult()
+        steps = self._checkout_steps(
+            result, payment, payment_details, token, customer, customer_number
+        )
+        try:
+            for step, request in steps:
+                response = await self._checkout_send(result, step, request)
+                if not self._checkout_done(result, step, response, steps):
+                    break
+        finally:
+            result.elapsed = time.perf_counter() - started
+        return result
+
+    async def _checkout_send(self, result, step, request):
+        started = time.perf_counter()
+        try:
+            with tracing.span(self, step):
+                return await self._send(request)
+        finally:
+            result.timings[step] = time.perf_counter() - started
+
+    async def _search_transactions(self, endpoint):
+        """
+        Yield the transactions of a search page by page. The next page is fetched in the
+        background while the caller works through the current one, so at most two pages
+        are held in memory whatever the size of the result.
+        :param endpoint: str  the search, with its query string
+        """
+        task = asyncio.ensure_future(self._send(self._search_page_request(endpoint)))
+        try:
+            while task is not None:
+                page = self._search_page(await task)
+                task = None
+                if page.next_page is not None:
+                    task = asyncio.ensure_future(
+                        self._send(
+                            self._search_page_request(
+                                self._next_page_endpoint(page.next_page)
+                            )
+                        )
+                    )
+                for transaction in page.transactions:
+                    yield transaction
+        finally:
+            # a caller that stops early does not wait for the page being prefetched
+            if task is not None:
+                if task.done():
+                    if not task.cancelled():
+                        task.exception()
+                else:
+                    task.cancel()
+
+    async def close(self):
+        """
+        Release the pooled connections held by this client
+        """
+        await self.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
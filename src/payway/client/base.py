@@ -1,20 +1,132 @@
-import json
+import contextvars
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from logging import getLogger
+from urllib.parse import urlsplit
 
-import requests
+from requests.exceptions import Timeout
 
+from src.payway import codec
 from src.payway.errors import PaywayError, PaymentError, ServerError
+from ..models import (
+    LazyPayWayTransaction,
+    LazyTransactionSearchPage,
+    PayWayTransaction,
+    TransactionSearchPage,
+)
+from . import timeouts, tracing
+from .circuit import endpoint_family
+from .idempotency import request_fingerprint
+from .ratelimit import THROTTLED_STATUS_CODES, parse_retry_after
+from .transport import DEFAULT_POOL_MAXSIZE
 
 
+logger = getLogger(__name__)
+
 CUSTOMER_ENDPOINT_PATH = "/customers"
 TRANSACTION_ENDPOINT_PATH = "/transactions"
 TOKEN_ENDPOINT_PATH = "/single-use-tokens-redirect"
 OWN_BANK_ACCOUNTS_ENDPOINT_PATH = "/your-bank-accounts"
 TOKEN_NO_REDIRECT_ENDPOINT_PATH = "/single-use-tokens"
+TRANSACTION_SEARCH_CUSTOMER_PATH = "/transactions/search-customer"
+TRANSACTION_SEARCH_SETTLEMENT_PATH = "/transactions/search-settlement"
+TRANSACTION_SEARCH_RECEIPT_PATH = "/transactions/search-receipt"
+
+# statuses raised as PaywayError, checked for every response
+HTTP_ERROR_STATUS_CODES = frozenset(
+    (400, 401, 403, 405, 406, 407, 409, 410, 415, 429, 501, 503)
+)
+# statuses whose JSON body lists the fields PayWay rejected
+FIELD_ERROR_STATUS_CODES = frozenset((404, 422))
+
+
+class PayWayRequest(object):
+    """
+    A single PayWay API call, described independently of the HTTP stack that sends it.
+    The request mixins build these so the sync and async clients share the same request
+    building and response parsing.
+
+    method: str: HTTP method
+    endpoint: str: path relative to the PayWay API base URL
+    data: dict: form data to send
+    auth: tuple: basic auth credentials, defaults to the client's secret API key
+    idempotency_key: str: unique value to avoid duplicate POSTs
+    parser: callable: converts the JSON body of a successful response into a model
+    idempotent: bool: repeating the request must not repeat its effect, so the client
+                      derives a new idempotency key for each call when none is given,
+                      reused by that call's retries
+    replayable: bool: a response recorded in the IdempotencyStore for the same
+                      caller-supplied key may answer the request, False for responses
+                      that must not be handed out twice, such as single use tokens
+    cache: MemoryCache or SQLiteCache: read-through cache for the response body of a GET
+    cache_key: str: key of the response body in cache
+    on_success: callable: called with the JSON body of a successful response (None for a
+                          request without a parser), e.g. to refresh or invalidate caches
+                          after a write
+    """
+
+    def __init__(
+        self,
+        method,
+        endpoint,
+        data=None,
+        auth=None,
+        idempotency_key=None,
+        parser=None,
+        idempotent=False,
+        cache=None,
+        cache_key=None,
+        on_success=None,
+        replayable=True,
+    ):
+        self.method = method
+        self.endpoint = endpoint
+        self.data = data
+        self.auth = auth
+        self.idempotency_key = idempotency_key
+        self.parser = parser
+        self.idempotent = idempotent
+        self.cache = cache
+        self.cache_key = cache_key
+        self.on_success = on_success
+        self.replayable = replayable
+        self.fingerprint = None
+
+    @property
+    def headers(self):
+        if self.method == "GET":
+            return None
+        headers = {"content-type": "application/x-www-form-urlencoded"}
+        if self.method == "POST" and self.idempotency_key:
+            headers["Idempotency-Key"] = self.idempotency_key
+        return headers
+
+# guards the lazy creation of hedge executors
+_hedge_executor_lock = threading.Lock()
 
 
 class BaseClient(object):
-    session = requests.Session()
-    session_no_headers = requests.Session()
+    transport = None
+    rate_limiter = None
+    retry_policy = None
+    circuit_breaker = None
+    hedging_policy = None
+    metrics = None
+    tracer = None
+    # runs hedged GETs, created on first use, see _hedge_pool
+    hedge_executor = None
+    # give idempotent requests a key of their own when the caller passes none
+    auto_idempotency = False
+    idempotency_store = None
+    customer_cache = None
+    transaction_cache = None
+    # TransactionLedger recording every transaction received, see _record_transactions
+    ledger = None
+    # model transaction responses are parsed into, see _use_lazy_transactions
+    transaction_class = PayWayTransaction
+    transaction_page_class = TransactionSearchPage
 
     payway_api_base_url = ""
     merchant_id = ""
@@ -22,82 +134,533 @@ class BaseClient(object):
     secret_api_key = ""
     publishable_api_key = ""
 
+    def _use_lazy_transactions(self, lazy):
+        """
+        :param lazy: bool  parse transaction responses into LazyPayWayTransaction
+        """
+        self.transaction_class = LazyPayWayTransaction if lazy else PayWayTransaction
+        self.transaction_page_class = (
+            LazyTransactionSearchPage if lazy else TransactionSearchPage
+        )
+
+    def timeout(self, connect=None, read=None):
+        """
+        Context manager overriding the client's connect/read timeouts for the calls inside it:
+
+            with payway_client.timeout(read=5):
+                transaction, errors = payway_client.get_transaction(transaction_id)
+
+        :param connect: float  seconds to establish a connection
+        :param read: float  seconds to wait for data from PayWay
+        """
+        return timeouts.timeout(connect=connect, read=read)
+
+    def deadline(self, seconds):
+        """
+        Context manager bounding the total time of the calls inside it, retries included.
+        Calls still running when it expires raise PaywayError with code DEADLINE_EXCEEDED:
+
+            with payway_client.deadline(10):
+                token_response, errors = payway_client.create_card_token(card)
+                ...
+                transaction, errors = payway_client.process_payment(payment)
+
+        :param seconds: float
+        """
+        return timeouts.deadline(seconds)
+
+    def _validate_credentials(
+        self, merchant_id, bank_account_id, secret_api_key, publishable_api_key
+    ):
+        if (
+            not merchant_id
+            or not bank_account_id
+            or not secret_api_key
+            or not publishable_api_key
+        ):
+            if not secret_api_key or not publishable_api_key:
+                logger.error("PayWay API keys not found")
+                raise PaywayError(
+                    message="PayWay API keys not found", code="INVALID_API_KEYS"
+                )
+            logger.error(
+                "Merchant ID, bank account ID, secret API key, publishable API key are "
+                "invalid"
+            )
+            raise PaywayError(
+                message="Invalid credentials", code="INVALID_API_CREDENTIALS"
+            )
+
     def _validate_response(self, response):
         """
         Validates all responses from PayWay to catch documented PayWay errors.
-        :param response: requests response object
-        """
-        if response.status_code in [
-            400,
-            401,
-            403,
-            405,
-            406,
-            407,
-            409,
-            410,
-            415,
-            429,
-            501,
-            503,
-        ]:
+        :param response: requests (or httpx) response object
+        """
+        status_code = response.status_code
+        if status_code < 400:
+            return None
+
+        if status_code in HTTP_ERROR_STATUS_CODES:
+            # requests and httpx name the status text differently
+            reason = getattr(response, "reason", None) or getattr(
+                response, "reason_phrase", ""
+            )
             http_error_msg = "%s Client Error: %s for url: %s" % (
                 response.status_code,
-                response.reason,
+                reason,
                 response.url,
             )
             raise PaywayError(code=response.status_code, message=http_error_msg)
 
-        elif response.status_code in [404, 422]:  # Documented PayWay errors in JSON
+        elif status_code in FIELD_ERROR_STATUS_CODES:  # Documented PayWay errors in JSON
             # parse error message
-            errors = response.json()
-            payway_errors = PaymentError().from_dict(errors)
+            errors = codec.loads(response.content)
+            payway_errors = PaymentError.from_dict(errors)
             # instead of raising an exception, return the specific PayWay errors as a list
             return payway_errors
 
-        elif response.status_code == 500:
+        elif status_code == 500:
             try:
-                errors = response.json()
-            except json.JSONDecodeError:
+                errors = codec.loads(response.content)
+            except ValueError:
                 raise PaywayError(
                     code=response.status_code, message="Internal server error"
                 )
             # Documented PayWay server errors in JSON
-            payway_error = ServerError().from_dict(errors)
+            payway_error = ServerError.from_dict(errors)
             message = payway_error.to_message()
-            raise PaywayError(code=response.status_code, message=message)
+            error = PaywayError(code=response.status_code, message=message)
+            error.trace_code = payway_error.trace_code
+            raise error
 
         else:
             return None
 
-    def get_request(self, endpoint):
-        return requests.get(
-            url=self.payway_api_base_url + endpoint,
-            auth=(self.secret_api_key, "")
+    def _handle_response(self, request, response):
+        """
+        Validate a response and parse it with the request's parser
+        :param request: PayWayRequest the response belongs to
+        :param response: requests (or httpx) response object
+        :return: tuple (parsed model or None, list of PaymentError or None)
+        """
+        # formatted lazily, this runs for every response
+        logger.info("Response from server: %s", response)
+        with tracing.span(self, "validate"):
+            errors = self._validate_response(response)
+        if errors:
+            return None, errors
+        if request.parser is None:
+            # e.g. a DELETE answered with 204 and no body
+            if request.on_success is not None:
+                request.on_success(None)
+            return None, errors
+        # decoded from the body bytes, which with orjson skips the text copy that
+        # response.json() makes
+        body = codec.loads(response.content)
+        if request.fingerprint is not None:
+            self.idempotency_store.record(
+                request.fingerprint, request.idempotency_key, body
+            )
+        if request.cache is not None:
+            request.cache.set(request.cache_key, body)
+        if request.on_success is not None:
+            request.on_success(body)
+        if self.ledger is not None:
+            self._record_transactions(body)
+        return self._parse(request, body), errors
+
+    def _parse(self, request, body):
+        """
+        Turn a response body into a model with the request's parser
+        :param request: PayWayRequest
+        :param body: dict  JSON body of the response
+        """
+        if self.metrics is None:
+            with tracing.span(self, "parse"):
+                return request.parser(body)
+        started = time.perf_counter()
+        with tracing.span(self, "parse"):
+            result = request.parser(body)
+        self.metrics.observe_parse(
+            getattr(request.parser, "__qualname__", "parser").rsplit(".", 1)[0],
+            time.perf_counter() - started,
         )
+        return result
+
+    def _lookup(self, request):
+        """
+        Answer a request locally when possible: GETs from their cache and calls repeated
+        with the same idempotency key from the IdempotencyStore
+        :param request: PayWayRequest
+        :return: dict  JSON body to parse, or None to send the request
+        """
+        if request.cache is not None:
+            body = request.cache.get(request.cache_key)
+            if body is not None:
+                return body
+        return self._replay(request)
+
+    def _replay(self, request):
+        """
+        Attach an idempotency key to an idempotent request and look up the response already
+        recorded for a caller-supplied key (see IdempotencyStore)
+        :param request: PayWayRequest
+        :return: dict  JSON body of the recorded response, or None to send the request
+        """
+        if not request.idempotent:
+            return None
+        if not request.idempotency_key:
+            if self.auto_idempotency:
+                # one key per call: the request object, and so the key, is reused by the
+                # call's retries, while a second call with the same content is a new call
+                request.idempotency_key = str(uuid.uuid4())
+            return None
+        store = self.idempotency_store
+        if store is None or not request.replayable:
+            return None
+        # callers supplying their own key decide what counts as a repeat
+        request.fingerprint = request_fingerprint(
+            self.merchant_id,
+            request.idempotency_key,
+            request.method,
+            request.endpoint,
+            (request.data or {}).get("transactionType"),
+        )
+        body = store.replay(request.fingerprint)
+        if body is not None:
+            logger.info(
+                "Replaying recorded response for %s %s"
+                % (request.method, request.endpoint)
+            )
+        return body
+
+    def _send(self, request):
+        """
+        Send a PayWayRequest and return the parsed (result, errors) pair
+        :param request: PayWayRequest
+        """
+        body = self._lookup(request)
+        if body is not None:
+            return self._parse(request, body), None
+        response = self._perform(request)
+        return self._handle_response(request, response)
+
+    def _perform(self, request):
+        """
+        Send a PayWayRequest and return the raw response, pacing it through the rate limiter
+        and retrying it while PayWay throttles it (see RetryPolicy)
+        :param request: PayWayRequest
+        """
+        attempt = 0
+        while True:
+            # an expired deadline is the caller's, not a failure of PayWay to report
+            timeouts.check_deadline()
+            self._check_circuit(request)
+            delay = self._rate_limit_delay()
+            if delay:
+                timeouts.check_deadline(delay)
+                time.sleep(delay)
+            started = time.monotonic()
+            try:
+                if self.hedging_policy is not None and request.method == "GET":
+                    response = self._dispatch_hedged(request)
+                else:
+                    response = self._dispatch(request)
+            except Exception as e:
+                self._record_outcome(request, None, started, error=e)
+                raise
+            except BaseException:
+                # cancelled or interrupted: says nothing about PayWay's health
+                self._record_outcome(request, None, started, abandoned=True)
+                raise
+            self._record_outcome(request, response, started)
+            delay = self._retry_delay(request, response, attempt)
+            if delay is None:
+                return response
+            timeouts.check_deadline(delay)
+            time.sleep(delay)
+            attempt += 1
+
+    def _dispatch(self, request):
+        """
+        Send a PayWayRequest once through the client's pooled transport
+        :param request: PayWayRequest
+        """
+        auth = request.auth or (self.secret_api_key, "")
+        with tracing.span(
+            self, "attempt", method=request.method, endpoint=request.endpoint
+        ) as span:
+            try:
+                response = self.transport.request(
+                    request.method,
+                    self.payway_api_base_url + request.endpoint,
+                    auth=auth,
+                    data=request.data,
+                    headers=request.headers,
+                    timeout=self._request_timeout(),
+                )
+            except Timeout as e:
+                raise timeouts.timeout_error(e) from e
+            if span is not None:
+                span.set("status", response.status_code)
+            return response
+
+    def _dispatch_hedged(self, request):
+        """
+        Send a GET, and send it again on another pooled connection if it is slower than
+        the HedgingPolicy allows. The first response wins; requests cannot abort a call
+        in progress, so the loser completes in the background and its connection goes
+        back to the pool.
+        :param request: PayWayRequest
+        """
+        policy = self.hedging_policy
+        executor = self._hedge_pool()
+        delay = policy.hedge_delay()
+        started = time.monotonic()
+        attempts = [
+            executor.submit(contextvars.copy_context().run, self._dispatch, request)
+        ]
+        if delay is not None:
+            done, _ = wait(attempts, timeout=delay)
+            if not done and policy.acquire():
+                logger.info("Hedging %s %s" % (request.method, request.endpoint))
+                attempts.append(
+                    executor.submit(
+                        contextvars.copy_context().run, self._dispatch, request
+                    )
+                )
+        pending = attempts
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = self._hedge_winner(done, pending)
+            if winner is not None:
+                for attempt in pending:
+                    attempt.cancel()
+                if winner.exception() is None:
+                    # a fast failure would drag the latency the hedge delay is set from
+                    policy.record(time.monotonic() - started)
+                return winner.result()
+
+    def _hedge_pool(self):
+        """
+        :return: ThreadPoolExecutor  running hedged GETs, created on first use so that a
+                 hedging_policy set after the client was built works too
+        """
+        executor = self.hedge_executor
+        if executor is None:
+            with _hedge_executor_lock:
+                executor = self.hedge_executor
+                if executor is None:
+                    # a hedged GET may hold two workers, one per pooled connection
+                    pool_maxsize = getattr(
+                        self.transport, "pool_maxsize", DEFAULT_POOL_MAXSIZE
+                    )
+                    executor = self.hedge_executor = ThreadPoolExecutor(
+                        max_workers=2 * pool_maxsize, thread_name_prefix="payway-hedge"
+                    )
+        return executor
+
+    @staticmethod
+    def _hedge_winner(done, pending):
+        """
+        :return: the first attempt that succeeded, or the failed one once none is left
+        """
+        for attempt in done:
+            if attempt.exception() is None:
+                return attempt
+        if not pending:
+            return next(iter(done))
+        return None
+
+    def _request_timeout(self):
+        """
+        (connect, read) timeouts for the next attempt, see timeouts.resolve
+        """
+        return timeouts.resolve(getattr(self.transport, "timeout", None))
+
+    def _check_circuit(self, request):
+        """
+        Fail fast with PaywayError CIRCUIT_OPEN while PayWay is failing the endpoint
+        :param request: PayWayRequest about to be sent
+        """
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.before_call(request.endpoint)
+
+    def _record_outcome(self, request, response, started, error=None, abandoned=False):
+        """
+        Report an attempt to the circuit breaker and the metrics hook
+        :param request: PayWayRequest that was sent
+        :param response: requests (or httpx) response object, None if sending it raised
+        :param started: float  time.monotonic() when the attempt was sent
+        :param error: Exception  raised while sending it
+        :param abandoned: bool  the attempt was cancelled before PayWay answered
+        """
+        if self.circuit_breaker is not None:
+            if abandoned or (
+                isinstance(error, PaywayError) and error.code == "DEADLINE_EXCEEDED"
+            ):
+                # cut short by the caller's deadline, says nothing about PayWay's health
+                success = None
+            else:
+                success = response is not None and response.status_code < 500
+            self.circuit_breaker.record(request.endpoint, success)
+        metrics = self.metrics
+        if metrics is None or abandoned:
+            return
+        endpoint = endpoint_family(request.endpoint)
+        if response is None:
+            if isinstance(error, PaywayError) and error.code in (
+                "TIMEOUT",
+                "DEADLINE_EXCEEDED",
+            ):
+                metrics.observe_timeout(endpoint)
+            return
+        # requests keeps the sent body on .body, httpx on .content
+        sent = getattr(response.request, "body", None) or getattr(
+            response.request, "content", None
+        )
+        metrics.observe_request(
+            endpoint,
+            request.method,
+            response.status_code,
+            time.monotonic() - started,
+            len(sent or b""),
+            len(response.content),
+        )
+
+    def _rate_limit_delay(self):
+        """
+        Seconds to wait before the next request may be sent
+        """
+        if self.rate_limiter is None:
+            return 0
+        return self.rate_limiter.reserve()
+
+    def _retry_delay(self, request, response, attempt):
+        """
+        Feed PayWay's throttling back to the rate limiter and decide whether to retry
+        :param request: PayWayRequest that was sent
+        :param response: requests (or httpx) response object
+        :param attempt: int  retries already made
+        :return: float seconds to wait before retrying, or None to return the response
+        """
+        if response.status_code not in THROTTLED_STATUS_CODES:
+            if self.rate_limiter is not None:
+                self.rate_limiter.succeeded()
+            return None
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if self.rate_limiter is not None:
+            self.rate_limiter.throttled(retry_after)
+        policy = self.retry_policy
+        if (
+            policy is None
+            or attempt >= policy.max_retries
+            or not policy.is_retryable(request)
+        ):
+            return None
+        delay = policy.delay(attempt, retry_after)
+        if self.metrics is not None:
+            self.metrics.observe_retry(endpoint_family(request.endpoint))
+        logger.warning(
+            "PayWay throttled %s %s (%s), retrying in %.2fs"
+            % (request.method, request.endpoint, response.status_code, delay)
+        )
+        return delay
+
+    def _cache_customer(self, body):
+        """
+        Write a customer returned by PayWay through to the customer cache
+        :param body: dict  PayWay customer response
+        """
+        if self.customer_cache is not None and body.get("customerNumber"):
+            self.customer_cache.set(str(body["customerNumber"]), body)
+
+    def _invalidate_customer(self, customer_id):
+        """
+        Drop a customer from the customer cache after it changed in PayWay
+        :param customer_id: str  PayWay customer ID
+        """
+        if self.customer_cache is not None:
+            self.customer_cache.delete(str(customer_id))
+
+    def _cache_transaction(self, body):
+        """
+        Write a transaction returned by PayWay through to the transaction cache
+        :param body: dict  PayWay transaction response
+        """
+        if self.transaction_cache is not None and body.get("transactionId"):
+            self.transaction_cache.set(str(body["transactionId"]), body)
+
+    def _record_transactions(self, body):
+        """
+        Hand the transactions in a response body to the ledger
+        :param body: dict  a transaction, or a page of a transaction search
+        """
+        if not isinstance(body, dict):
+            return
+        if "transactionId" in body:
+            self.ledger.record(body)
+        elif isinstance(body.get("data"), list):
+            self.ledger.record_many(body["data"])
+
+    def _invalidate_transaction(self, transaction_id):
+        """
+        Drop a transaction from the transaction cache after it changed in PayWay
+        :param transaction_id: str  PayWay transaction ID
+        """
+        if self.transaction_cache is not None:
+            self.transaction_cache.delete(str(transaction_id))
+
+    def _search_page_request(self, endpoint):
+        """
+        :param endpoint: str  a transaction search, or a later page of one
+        :return: PayWayRequest  for one page of the search
+        """
+        return PayWayRequest(
+            "GET", endpoint, parser=self.transaction_page_class.from_dict
+        )
+
+    def _search_page(self, result):
+        """
+        :param result: tuple (TransactionSearchPage, list of PaymentError) as sent back
+        :return: TransactionSearchPage
+        """
+        page, errors = result
+        if errors:
+            # a search is consumed as a generator, which has no errors to hand back
+            raise PaywayError(
+                code="INVALID_SEARCH", message=PaymentError.list_to_message(errors)
+            )
+        return page
+
+    def _next_page_endpoint(self, href):
+        """
+        :param href: str  absolute URL of the next page, as linked by PayWay
+        :return: str  the same page relative to the API base URL
+        """
+        if href.startswith(self.payway_api_base_url):
+            return href[len(self.payway_api_base_url) :]
+        # linked under another host name of the API
+        url = urlsplit(href)
+        base_path = urlsplit(self.payway_api_base_url).path.rstrip("/")
+        path = url.path
+        if path.startswith(base_path):
+            path = path[len(base_path) :]
+        return "%s?%s" % (path, url.query) if url.query else path
+
+    def get_request(self, endpoint):
+        return self._perform(PayWayRequest("GET", endpoint))
 
     def post_request(self, endpoint, data, auth=None, idempotency_key=None):
         """
         Supply an idempotency_key to avoid duplicate POSTs
         https://www.payway.com.au/docs/rest.html#avoiding-duplicate-posts
         """
-        if not auth:
-            auth = (self.secret_api_key, "")
-        headers = {"content-type": "application/x-www-form-urlencoded"}
-        if idempotency_key:
-            headers["Idempotency-Key"] = idempotency_key
-        return requests.post(
-            url=self.payway_api_base_url + endpoint,
-            auth=auth,
-            data=data,
-            headers=headers
+        return self._perform(
+            PayWayRequest(
+                "POST", endpoint, data, auth=auth, idempotency_key=idempotency_key
+            )
         )
 
     def put_request(self, endpoint, data):
-        headers = {"content-type": "application/x-www-form-urlencoded"}
-        return requests.put(
-            url=self.payway_api_base_url + endpoint,
-            auth=(self.secret_api_key, ""),
-            data=data,
-            headers=headers
-        )
+        return self._perform(PayWayRequest("PUT", endpoint, data))
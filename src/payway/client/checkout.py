@@ -0,0 +1,196 @@
+import time
+from logging import getLogger
+
+from .base import BaseClient
+from .tracing import span, traced
+from ..errors import PaywayError
+from ..models import BankAccount
+
+logger = getLogger(__name__)
+
+
+class CheckoutResult(object):
+    """
+    token: str: single use token the payment was taken with
+    customer: PayWayCustomer: customer created by the checkout
+    customer_number: str: customer the payment was taken for, None for a one-off payment
+    payment_setup: PaymentSetup: new payment setup of an existing customer
+    transaction: PayWayTransaction: the payment, None if the checkout stopped before it
+    errors: list of PaymentError: errors of the step PayWay rejected
+    failed_step: str: "token", "customer", "payment_setup" or "payment"
+    timings: dict: seconds per step, in the order the steps ran
+    elapsed: float: seconds for the whole checkout
+    """
+
+    __slots__ = (
+        "token",
+        "customer",
+        "customer_number",
+        "payment_setup",
+        "transaction",
+        "errors",
+        "failed_step",
+        "timings",
+        "elapsed",
+    )
+
+    def __init__(self):
+        self.token = None
+        self.customer = None
+        self.customer_number = None
+        self.payment_setup = None
+        self.transaction = None
+        self.errors = None
+        self.failed_step = None
+        self.timings = {}
+        self.elapsed = 0.0
+
+    def to_dict(self):
+        return {
+            "token": self.token,
+            "customerNumber": self.customer_number,
+            "transactionId": self.transaction.transaction_id
+            if self.transaction
+            else None,
+            "status": self.transaction.status if self.transaction else None,
+            "errors": [error.to_message() for error in self.errors or ()],
+            "failedStep": self.failed_step,
+            "timings": self.timings,
+            "elapsed": self.elapsed,
+        }
+
+
+class CheckoutRequest(BaseClient):
+    @traced
+    def checkout(
+        self,
+        payment,
+        payment_details=None,
+        token=None,
+        customer=None,
+        customer_number=None,
+    ):
+        """
+        Take a payment in as few sequential round trips to PayWay as the flow allows:
+
+        new customer:               token -> create customer with the token -> payment
+        existing customer:          token -> update payment setup -> payment
+        existing customer, stored:  payment
+        no customer (one-off):      token -> payment with the token
+
+        The steps run one after another, each once the previous one has succeeded. Their
+        payloads are all built before the first request is sent, and no step reads
+        anything back from PayWay that an earlier response already gave.
+        PayWay rejecting a step stops the checkout and is reported in the result. Other
+        failures raise PaywayError as the individual calls do.
+
+        :param payment: PayWayPayment  taken for the checkout's customer, the object
+                        itself is left unchanged
+        :param payment_details: PayWayCard or BankAccount  to tokenize
+        :param token: str  single use token created beforehand, e.g. in the browser
+        :param customer: PayWayCustomer  to create
+        :param customer_number: str  existing PayWay customer, defaults to the payment's
+        :return: CheckoutResult
+        """
+        started = time.perf_counter()
+        result = CheckoutResult()
+        steps = self._checkout_steps(
+            result, payment, payment_details, token, customer, customer_number
+        )
+        try:
+            for step, request in steps:
+                response = self._checkout_send(result, step, request)
+                if not self._checkout_done(result, step, response, steps):
+                    break
+        finally:
+            result.elapsed = time.perf_counter() - started
+        return result
+
+    def _checkout_send(self, result, step, request):
+        started = time.perf_counter()
+        try:
+            with span(self, step):
+                return self._send(request)
+        finally:
+            result.timings[step] = time.perf_counter() - started
+
+    def _checkout_steps(
+        self, result, payment, payment_details, token, customer, customer_number
+    ):
+        """
+        Check the checkout arguments and build the request of every step, shared by the
+        sync and async checkout
+        :param result: CheckoutResult  gets the token passed in and the customer number
+                       of an existing customer
+        :return: list of (step, PayWayRequest)  in the order they are sent
+        """
+        if customer is not None and customer_number is not None:
+            raise PaywayError(
+                message="Pass either a customer to create or a customer_number",
+                code="INVALID_CHECKOUT",
+            )
+        if payment_details is not None and token is not None:
+            raise PaywayError(
+                message="Pass either payment_details or a token",
+                code="INVALID_CHECKOUT",
+            )
+        steps = []
+        if payment_details is not None:
+            if isinstance(payment_details, BankAccount):
+                payment_method = "direct_debit"
+            else:
+                payment_method = "card"
+            request = self._token_request(payment_details, payment_method)
+            steps.append(("token", request))
+        tokenized = payment_details is not None or token is not None
+        payment_request = self._payment_request(payment)
+        if customer is not None:
+            steps.append(("customer", self._customer_request(customer)))
+            # PayWay generates the customer number unless the customer brings its own
+            customer_number = customer.custom_id
+        else:
+            if customer_number is None:
+                customer_number = payment.customer_number
+            result.customer_number = customer_number
+            if tokenized and customer_number is not None:
+                request = self._payment_setup_request(None, customer_number)
+                steps.append(("payment_setup", request))
+        if customer_number is not None:
+            payment_request.data["customerNumber"] = customer_number
+        steps.append(("payment", payment_request))
+        if token is not None:
+            result.token = token
+            self._checkout_use_token(token, steps[0][1])
+        return steps
+
+    @staticmethod
+    def _checkout_use_token(token, request):
+        """
+        :param request: PayWayRequest  of the step after the token, which sets up the
+                        new payment method, or pays with it when there is no customer
+        """
+        request.data["singleUseTokenId"] = token
+
+    def _checkout_done(self, result, step, response, steps):
+        """
+        Record the outcome of a step and pass what it returned on to the later steps
+        :return: bool  False when PayWay rejected the step
+        """
+        value, errors = response
+        if errors:
+            logger.info("Checkout stopped, PayWay rejected the %s step" % step)
+            result.errors = errors
+            result.failed_step = step
+            return False
+        if step == "token":
+            result.token = value.token
+            self._checkout_use_token(value.token, steps[1][1])
+        elif step == "customer":
+            result.customer = value
+            result.customer_number = value.customer_number
+            steps[-1][1].data["customerNumber"] = value.customer_number
+        elif step == "payment_setup":
+            result.payment_setup = value
+        else:
+            result.transaction = value
+        return True
@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import deque
+from logging import getLogger
+
+from src.payway.errors import PaywayError
+
+
+logger = getLogger(__name__)
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+# endpoints are grouped by these prefixes, e.g. /single-use-tokens-redirect is a token call
+ENDPOINT_FAMILIES = ("/transactions", "/customers", "/single-use-tokens")
+
+DEFAULT_FAILURE_RATE = 0.5
+DEFAULT_CIRCUIT_WINDOW = 20
+DEFAULT_MINIMUM_CALLS = 10
+DEFAULT_RESET_TIMEOUT = 30
+
+
+def endpoint_family(endpoint):
+    """
+    :param endpoint: str  path relative to the PayWay API base URL
+    :return: str  e.g. "/transactions" for "/transactions/123/void"
+    """
+    for family in ENDPOINT_FAMILIES:
+        if endpoint.startswith(family):
+            return family
+    return "/" + endpoint.lstrip("/").split("/", 1)[0]
+
+
+class _Circuit(object):
+    __slots__ = ("state", "results", "opened_at", "probe_started")
+
+    def __init__(self, window):
+        self.state = CIRCUIT_CLOSED
+        self.results = deque(maxlen=window)
+        self.opened_at = 0.0
+        self.probe_started = None
+
+
+class CircuitBreaker(object):
+    """
+    Stops sending requests to an endpoint family (/transactions, /customers,
+    /single-use-tokens) while PayWay is failing it, so callers fail fast instead of
+    piling up behind 5xx responses and timeouts.
+
+    A closed circuit lets everything through and tracks the outcome of the last `window`
+    calls. Once at least `minimum_calls` were made and `failure_rate` of them failed, it
+    opens: calls raise PaywayError with code CIRCUIT_OPEN without touching the network.
+    After `reset_timeout` seconds it goes half open and lets a single probe through, which
+    closes it again on success or reopens it on failure.
+
+    5xx responses, timeouts and connection errors count as failures. Any other response,
+    including PayWay rejecting a request with 4xx, means PayWay is up.
+    Thread safe; one instance may be shared between clients.
+
+    failure_rate: float: share of failed calls in the window that opens the circuit
+    window: int: number of recent calls considered
+    minimum_calls: int: calls needed in the window before the circuit may open
+    reset_timeout: float: seconds an open circuit waits before probing
+    on_state_change: callable(family, old_state, new_state): called on every transition
+    """
+
+    def __init__(
+        self,
+        failure_rate=DEFAULT_FAILURE_RATE,
+        window=DEFAULT_CIRCUIT_WINDOW,
+        minimum_calls=DEFAULT_MINIMUM_CALLS,
+        reset_timeout=DEFAULT_RESET_TIMEOUT,
+        on_state_change=None,
+    ):
+        self.failure_rate = failure_rate
+        self.window = window
+        self.minimum_calls = min(minimum_calls, window)
+        self.reset_timeout = reset_timeout
+        self.on_state_change = on_state_change
+        self._lock = threading.Lock()
+        self._circuits = {}
+
+    def state(self, endpoint):
+        """
+        :param endpoint: str  endpoint or endpoint family
+        :return: str  CIRCUIT_CLOSED, CIRCUIT_OPEN or CIRCUIT_HALF_OPEN
+        """
+        circuit = self._circuits.get(endpoint_family(endpoint))
+        if circuit is None:
+            return CIRCUIT_CLOSED
+        return circuit.state
+
+    def before_call(self, endpoint):
+        """
+        Raise PaywayError CIRCUIT_OPEN unless a call to endpoint may go ahead
+        :param endpoint: str  path relative to the PayWay API base URL
+        """
+        family = endpoint_family(endpoint)
+        transitions = []
+        with self._lock:
+            circuit = self._circuit(family)
+            now = time.monotonic()
+            if circuit.state == CIRCUIT_OPEN:
+                if now - circuit.opened_at < self.reset_timeout:
+                    raise self._open_error(family)
+                self._transition(family, circuit, CIRCUIT_HALF_OPEN, transitions)
+            if circuit.state == CIRCUIT_HALF_OPEN:
+                # a probe that never reported back (e.g. its caller gave up before
+                # sending) stops blocking others after reset_timeout
+                if (
+                    circuit.probe_started is not None
+                    and now - circuit.probe_started < self.reset_timeout
+                ):
+                    raise self._open_error(family)
+                circuit.probe_started = now
+        self._notify(transitions)
+
+    def record(self, endpoint, success):
+        """
+        :param endpoint: str  path relative to the PayWay API base URL
+        :param success: bool  False for a 5xx response, a timeout or a connection error,
+                        None for a call abandoned before PayWay answered
+        """
+        family = endpoint_family(endpoint)
+        transitions = []
+        with self._lock:
+            circuit = self._circuit(family)
+            if success is None:
+                # abandoned: only frees the probe slot
+                if circuit.state == CIRCUIT_HALF_OPEN:
+                    circuit.probe_started = None
+            elif circuit.state == CIRCUIT_HALF_OPEN:
+                circuit.probe_started = None
+                if success:
+                    circuit.results.clear()
+                    self._transition(family, circuit, CIRCUIT_CLOSED, transitions)
+                else:
+                    circuit.opened_at = time.monotonic()
+                    self._transition(family, circuit, CIRCUIT_OPEN, transitions)
+            elif circuit.state == CIRCUIT_CLOSED:
+                circuit.results.append(success)
+                calls = len(circuit.results)
+                if (
+                    calls >= self.minimum_calls
+                    and circuit.results.count(False) >= self.failure_rate * calls
+                ):
+                    circuit.opened_at = time.monotonic()
+                    self._transition(family, circuit, CIRCUIT_OPEN, transitions)
+            # calls that were already in flight when the circuit opened are ignored
+        self._notify(transitions)
+
+    def reset(self):
+        """
+        Close every circuit and forget past outcomes
+        """
+        with self._lock:
+            self._circuits.clear()
+
+    def _circuit(self, family):
+        circuit = self._circuits.get(family)
+        if circuit is None:
+            circuit = self._circuits[family] = _Circuit(self.window)
+        return circuit
+
+    def _transition(self, family, circuit, state, transitions):
+        transitions.append((family, circuit.state, state))
+        circuit.state = state
+
+    def _notify(self, transitions):
+        # callbacks run outside the lock so they may call back into the breaker
+        for family, old_state, new_state in transitions:
+            logger.warning(
+                "PayWay circuit for %s: %s -> %s" % (family, old_state, new_state)
+            )
+            if self.on_state_change is not None:
+                self.on_state_change(family, old_state, new_state)
+
+    def _open_error(self, family):
+        return PaywayError(
+            code="CIRCUIT_OPEN",
+            message="PayWay %s is failing, not sending requests until it recovers"
+            % family,
+        )
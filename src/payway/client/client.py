@@ -1,24 +1,62 @@
-import json
 from logging import getLogger
-import requests
 
 from .base import BaseClient
+from .checkout import CheckoutRequest
 from .payment import PaymentRequest
-from ..errors import PaywayError
 from .customer import CustomerRequest
+from .ratelimit import RetryPolicy
+from .schedule import ScheduleRequest
+from .timeouts import DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
 from .transaction import TransactionRequest
+from .transport import (
+    DEFAULT_KEEP_ALIVE,
+    DEFAULT_POOL_CONNECTIONS,
+    DEFAULT_POOL_MAXSIZE,
+    PayWayTransport,
+)
 
 
 logger = getLogger(__name__)
 
 
-class PayWayClient(CustomerRequest, TransactionRequest, PaymentRequest, BaseClient):
+class PayWayClient(
+    CheckoutRequest,
+    CustomerRequest,
+    ScheduleRequest,
+    TransactionRequest,
+    PaymentRequest,
+    BaseClient,
+):
     """
     PayWay Client to connect to PayWay and perform methods given credentials
     """
 
     def __init__(
-        self, api_base_url, merchant_id, bank_account_id, secret_api_key, publishable_api_key
+        self,
+        api_base_url,
+        merchant_id,
+        bank_account_id,
+        secret_api_key,
+        publishable_api_key,
+        pool_connections=DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize=DEFAULT_POOL_MAXSIZE,
+        keep_alive=DEFAULT_KEEP_ALIVE,
+        max_in_flight=None,
+        connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+        read_timeout=DEFAULT_READ_TIMEOUT,
+        transport=None,
+        rate_limiter=None,
+        retry_policy=None,
+        circuit_breaker=None,
+        hedging_policy=None,
+        metrics=None,
+        tracer=None,
+        auto_idempotency=True,
+        idempotency_store=None,
+        customer_cache=None,
+        transaction_cache=None,
+        lazy_transactions=False,
+        ledger=None,
     ):
         """
         :param api_base_url : str                       = PayWay API Base URL
@@ -26,6 +64,34 @@ class PayWayClient(CustomerRequest, TransactionRequest, PaymentRequest, BaseClie
         :param bank_account_id   : str                  = PayWay Bank Account ID
         :param secret_api_key   : str                   = PayWay Secret APi Key
         :param publishable_api_key   : str              = PayWay Publishable API Key
+        :param pool_connections   : int                 = Number of per-host connection pools to cache
+        :param pool_maxsize   : int                     = Max keep-alive connections per host
+        :param keep_alive   : float                     = Seconds an idle connection may be reused
+        :param max_in_flight   : int                    = Global cap on concurrent requests, None for no cap
+        :param connect_timeout   : float              = Default seconds to establish a connection, see also timeout()
+        :param read_timeout   : float                 = Default seconds to wait for data from PayWay
+        :param transport   : PayWayTransport            = Share an existing transport (ignores pool settings)
+        :param rate_limiter   : TokenBucket             = Paces requests, share one to share a budget
+        :param retry_policy   : RetryPolicy             = Retries throttled idempotent requests, defaults to RetryPolicy()
+        :param circuit_breaker   : CircuitBreaker       = Fails fast while PayWay is failing an endpoint family,
+                                                          share one between clients to share its view
+        :param hedging_policy   : HedgingPolicy         = Opt-in hedging of slow GET lookups, e.g. HedgingPolicy(budget=0.05)
+        :param metrics   : MetricsHook                  = Receives latency, status, retry, timeout, size and parse
+                                                          measurements, e.g. InMemoryMetrics()
+        :param tracer   : Tracer                        = Records a span per phase of every call,
+                                                          e.g. Tracer(JSONLinesExporter("spans.jsonl"))
+        :param auto_idempotency   : bool                = Give payments, refunds, voids, customers and tokens
+                                                          a new idempotency key per call, reused by its retries
+        :param idempotency_store   : IdempotencyStore   = Opt-in record of responses to calls made with your own
+                                                          idempotency key, replayed when the key is used again
+        :param customer_cache   : MemoryCache           = Opt-in cache for get_customer, e.g. MemoryCache(ttl=300)
+                                                          or SQLiteCache(path, ttl=300) shared between processes
+        :param transaction_cache   : TransactionCache   = Opt-in cache for get_transaction, kept up to date by
+                                                          payments, refunds and voids
+        :param lazy_transactions   : bool               = Return LazyPayWayTransaction objects that only decode
+                                                          the fields that are read
+        :param ledger   : TransactionLedger             = Opt-in local record of every transaction received,
+                                                          queryable without calling PayWay
         """
         self._validate_credentials(
             merchant_id, bank_account_id, secret_api_key, publishable_api_key
@@ -36,33 +102,42 @@ class PayWayClient(CustomerRequest, TransactionRequest, PaymentRequest, BaseClie
         self.secret_api_key = secret_api_key
         self.publishable_api_key = publishable_api_key
 
-        session = requests.Session()
-        session.auth = (self.secret_api_key, "")
-        headers = {"content-type": "application/x-www-form-urlencoded"}
-        session.headers = headers
-        self.session = session
-        session_no_headers = requests.Session()
-        session_no_headers.auth = session.auth
-        self.session_no_headers = session_no_headers
-
-    def _validate_credentials(
-        self, merchant_id, bank_account_id, secret_api_key, publishable_api_key
-    ):
-        if (
-            not merchant_id
-            or not bank_account_id
-            or not secret_api_key
-            or not publishable_api_key
-        ):
-            if not secret_api_key or not publishable_api_key:
-                logger.error("PayWay API keys not found")
-                raise PaywayError(
-                    message="PayWay API keys not found", code="INVALID_API_KEYS"
-                )
-            logger.error(
-                "Merchant ID, bank account ID, secret API key, publishable API key are "
-                "invalid"
-            )
-            raise PaywayError(
-                message="Invalid credentials", code="INVALID_API_CREDENTIALS"
+        if transport is None:
+            transport = PayWayTransport(
+                pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize,
+                keep_alive=keep_alive,
+                max_in_flight=max_in_flight,
+                connect_timeout=connect_timeout,
+                read_timeout=read_timeout,
+                tracing=tracer is not None,
             )
+        self.transport = transport
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.circuit_breaker = circuit_breaker
+        self.hedging_policy = hedging_policy
+        self.metrics = metrics
+        self.tracer = tracer
+        if metrics is not None:
+            metrics.track_transport(transport)
+        self.auto_idempotency = auto_idempotency
+        self.idempotency_store = idempotency_store
+        self.customer_cache = customer_cache
+        self.transaction_cache = transaction_cache
+        self.ledger = ledger
+        self._use_lazy_transactions(lazy_transactions)
+
+    def close(self):
+        """
+        Release the pooled connections held by this client
+        """
+        if self.hedge_executor is not None:
+            self.hedge_executor.shutdown(wait=False)
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,68 @@
+import asyncio
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+DEFAULT_CONCURRENCY = 10
+
+
+def bounded_map(func, items, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Call func on every item from a thread pool with at most `concurrency` calls in flight.
+    Items are pulled from the iterable lazily, so generators of any size keep memory flat.
+    Each call runs in a copy of the caller's context, so client.timeout() and
+    client.deadline() blocks around the map apply to it.
+    :param func: callable taking one item
+    :param items: iterable of items
+    :param concurrency: int  max calls in flight
+    :return: generator of (item, future) pairs in completion order
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = {}
+
+        def submit_next():
+            for item in items:
+                context = contextvars.copy_context()
+                pending[executor.submit(context.run, func, item)] = item
+                return
+
+        for _ in range(concurrency):
+            submit_next()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                submit_next()
+                yield item, future
+
+
+async def async_bounded_map(func, items, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Await func on every item with at most `concurrency` coroutines in flight.
+    Items are pulled from the iterable lazily, so generators of any size keep memory flat.
+    :param func: coroutine function taking one item
+    :param items: iterable of items
+    :param concurrency: int  max coroutines in flight
+    :return: async generator of (item, task) pairs in completion order
+    """
+    items = iter(items)
+    pending = {}
+
+    def submit_next():
+        for item in items:
+            pending[asyncio.ensure_future(func(item))] = item
+            return
+
+    for _ in range(concurrency):
+        submit_next()
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                item = pending.pop(task)
+                submit_next()
+                yield item, task
+    finally:
+        for task in pending:
+            task.cancel()
@@ -1,13 +1,14 @@
 from logging import getLogger
 
-from .base import CUSTOMER_ENDPOINT_PATH
-from .client import BaseClient
+from .base import CUSTOMER_ENDPOINT_PATH, BaseClient, PayWayRequest
+from .tracing import span, traced
 from ..models import PayWayCustomer
 
 logger = getLogger(__name__)
 
 
 class CustomerRequest(BaseClient):
+    @traced
     def create_customer(self, customer, idempotency_key=None):
         """
         Create a customer in PayWay system
@@ -16,12 +17,18 @@ class CustomerRequest(BaseClient):
         PUT /customers/{customerNumber} to use your own customer number
 
         :param customer:    PayWayCustomer object represents a customer in PayWay
-        :param idempotency_key:   str: unique value to avoid duplicate POSTs
+        :param idempotency_key:   str: unique value to avoid duplicate POSTs, new per call when omitted
         See model.PayWayCustomer
         :return:
         """
+        return self._send(self._customer_request(customer, idempotency_key))
 
-        data = customer.to_dict()
+    def _customer_request(self, customer, idempotency_key=None):
+        """
+        :return: PayWayRequest  creating the customer, see create_customer
+        """
+        with span(self, "build_payload"):
+            data = customer.to_dict()
         data.update(
             {"merchantId": self.merchant_id, "bankAccountId": self.bank_account_id}
         )
@@ -30,31 +37,38 @@ class CustomerRequest(BaseClient):
 
         if customer.custom_id:
             endpoint = "{}/{}".format(CUSTOMER_ENDPOINT_PATH, customer.custom_id)
-            response = self.put_request(endpoint, data)
-        else:
-            endpoint = "{}".format(CUSTOMER_ENDPOINT_PATH)
-            response = self.post_request(
-                endpoint, data, idempotency_key=idempotency_key
+            return PayWayRequest(
+                "PUT",
+                endpoint,
+                data,
+                parser=PayWayCustomer.from_dict,
+                idempotent=True,
+                on_success=self._cache_customer,
             )
+        endpoint = "{}".format(CUSTOMER_ENDPOINT_PATH)
+        return PayWayRequest(
+            "POST",
+            endpoint,
+            data,
+            idempotency_key=idempotency_key,
+            parser=PayWayCustomer.from_dict,
+            idempotent=True,
+            on_success=self._cache_customer,
+        )
 
-        logger.info("Response from server: %s" % response)
-        errors = self._validate_response(response)
-        if errors:
-            return None, errors
-        else:
-            customer = PayWayCustomer().from_dict(response.json())
-            return customer, errors
-
+    @traced
     def get_customer(self, customer_id):
         """
         Returns a PayWay Customer's Payment Setup, [Payment] Schedule, Contact Details, Custom Fields and Notes
         :param customer_id  str PayWay customer ID in PayWay system
         """
         endpoint = "%s/%s" % (CUSTOMER_ENDPOINT_PATH, str(customer_id))
-        response = self.get_request(endpoint)
-        errors = self._validate_response(response)
-        if errors:
-            return None, errors
-        else:
-            customer = PayWayCustomer.from_dict(response.json())
-        return customer, errors
+        return self._send(
+            PayWayRequest(
+                "GET",
+                endpoint,
+                parser=PayWayCustomer.from_dict,
+                cache=self.customer_cache,
+                cache_key=str(customer_id),
+            )
+        )
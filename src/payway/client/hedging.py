@@ -0,0 +1,87 @@
+import threading
+from collections import deque
+
+
+DEFAULT_HEDGE_PERCENTILE = 0.95
+DEFAULT_HEDGE_BUDGET = 0.05
+DEFAULT_HEDGE_MIN_DELAY = 0.005
+DEFAULT_LATENCY_WINDOW = 500
+DEFAULT_MIN_SAMPLES = 50
+
+
+class HedgingPolicy(object):
+    """
+    Decides when a GET lookup (get_transaction, get_customer) is hedged: if PayWay has not
+    answered within the `percentile` of recent latency, the same GET is sent again on
+    another pooled connection and whichever response arrives first is used.
+
+    The budget caps the extra load: every GET earns `budget` of a hedge and every hedge
+    spends a whole one, so hedges never exceed that share of GETs (5% by default), even
+    when PayWay slows down across the board.
+    Thread safe; one instance may be shared between clients.
+
+    percentile: float: share of recent GETs expected to answer before a hedge is sent
+    budget: float: max extra GETs sent as hedges, as a share of all GETs
+    min_delay: float: seconds a GET is always given before hedging
+    window: int: number of recent latencies the percentile is taken from
+    min_samples: int: GETs observed before hedging starts
+    """
+
+    def __init__(
+        self,
+        percentile=DEFAULT_HEDGE_PERCENTILE,
+        budget=DEFAULT_HEDGE_BUDGET,
+        min_delay=DEFAULT_HEDGE_MIN_DELAY,
+        window=DEFAULT_LATENCY_WINDOW,
+        min_samples=DEFAULT_MIN_SAMPLES,
+    ):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._delay = None
+        self._stale = 0
+        # unused hedge allowance, capped so a long quiet spell cannot fund a hedge storm
+        self._credit = 0.0
+        self._max_credit = max(1.0, budget * min_samples)
+        self.requests = 0
+        self.hedges = 0
+
+    def hedge_delay(self):
+        """
+        Called as a GET is sent
+        :return: float seconds to wait for it before hedging, None to never hedge it
+        """
+        with self._lock:
+            self.requests += 1
+            self._credit = min(self._max_credit, self._credit + self.budget)
+            return self._delay
+
+    def acquire(self):
+        """
+        :return: bool  True if the budget allows one more hedge, which is then counted
+        """
+        with self._lock:
+            if self._credit < 1.0:
+                return False
+            self._credit -= 1.0
+            self.hedges += 1
+            return True
+
+    def record(self, latency):
+        """
+        :param latency: float  seconds a GET took to answer
+        """
+        with self._lock:
+            self._latencies.append(latency)
+            self._stale += 1
+            # sorting the window on every call would cost more than the hedge saves
+            if len(self._latencies) >= self.min_samples and (
+                self._delay is None or self._stale >= len(self._latencies) // 10
+            ):
+                ordered = sorted(self._latencies)
+                index = min(len(ordered) - 1, int(len(ordered) * self.percentile))
+                self._delay = max(self.min_delay, ordered[index])
+                self._stale = 0
@@ -0,0 +1,65 @@
+import hashlib
+
+from ..cache import MemoryCache
+
+
+DEFAULT_IDEMPOTENCY_WINDOW = 60
+
+
+def request_fingerprint(merchant_id, idempotency_key, method, endpoint, kind=None):
+    """
+    Store key of the response to a call made with a caller-supplied idempotency key.
+    Besides the key, only what identifies the operation enters the digest, never card or
+    bank details, so a key reused for a different operation is not answered with the
+    response of the first one.
+    :param merchant_id: str  keeps different merchant facilities apart
+    :param idempotency_key: str  key the caller passed for the call
+    :param method: str  HTTP method
+    :param endpoint: str  PayWay endpoint path
+    :param kind: str  transactionType of the request, payments and refunds share an endpoint
+    """
+    digest = hashlib.sha256()
+    for part in (merchant_id, idempotency_key, method, endpoint, kind):
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class IdempotencyStore(object):
+    """
+    Remembers, for a window of time, the response PayWay returned to a call made with a
+    caller-supplied idempotency key.
+
+    Calling again with the same key inside the window, e.g. when a batch is resumed in
+    another process, is answered from the store without a network round trip. Calls
+    without a key of their own get a new key each time and are never answered from the
+    store, so two identical payments are always two payments.
+
+    cache: MemoryCache or SQLiteCache: backend, SQLiteCache shares the store between processes
+    window: float: seconds a response is remembered
+    """
+
+    def __init__(self, cache=None, window=DEFAULT_IDEMPOTENCY_WINDOW):
+        if cache is None:
+            cache = MemoryCache(ttl=window)
+        self.cache = cache
+        self.window = window
+
+    def replay(self, fingerprint):
+        """
+        :param fingerprint: str  see request_fingerprint
+        :return: dict  JSON body of the recorded successful response, or None
+        """
+        entry = self.cache.get(fingerprint)
+        if entry is None:
+            return None
+        return entry.get("body")
+
+    def record(self, fingerprint, key, body):
+        """
+        Remember the successful response to a request
+        :param fingerprint: str  see request_fingerprint
+        :param key: str  idempotency key the request was sent with
+        :param body: dict  JSON body of the response
+        """
+        self.cache.set(fingerprint, {"key": key, "body": body}, ttl=self.window)
@@ -0,0 +1,239 @@
+import threading
+import weakref
+from bisect import bisect_left
+from collections import defaultdict
+
+
+DEFAULT_LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+DEFAULT_PARSE_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01
+)
+
+
+class MetricsHook(object):
+    """
+    Receives measurements from a client. Every method is a no-op, so an implementation
+    only overrides what it is interested in. A client without a hook (the default) skips
+    all measuring, so metrics cost nothing unless enabled.
+
+    Endpoints are reported by family ("/transactions", "/customers", ...) to keep the
+    number of distinct labels small.
+    """
+
+    def observe_request(self, endpoint, method, status, seconds, bytes_sent, bytes_received):
+        """
+        One attempt answered by PayWay
+        :param status: int  HTTP status code
+        :param seconds: float  time from sending the request to reading the whole response
+        :param bytes_sent: int  size of the request body
+        :param bytes_received: int  size of the response body
+        """
+
+    def observe_retry(self, endpoint):
+        """
+        A throttled request is about to be retried
+        """
+
+    def observe_timeout(self, endpoint):
+        """
+        An attempt timed out or ran out of deadline
+        """
+
+    def observe_parse(self, model, seconds):
+        """
+        A response body was turned into a model
+        :param model: str  e.g. "PayWayTransaction"
+        :param seconds: float  time spent in from_dict
+        """
+
+    def track_transport(self, transport):
+        """
+        Called with the client's transport, whose pool_stats() report connection reuse
+        """
+
+
+class _Histogram(object):
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # one count per bucket plus the +Inf bucket, not cumulative until exported
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class InMemoryMetrics(MetricsHook):
+    """
+    Aggregates the measurements of one or more clients in process and exports them in
+    the Prometheus text format, e.g. from a /metrics endpoint:
+
+        metrics = InMemoryMetrics()
+        payway_client = PayWayClient(..., metrics=metrics)
+        ...
+        body = metrics.to_prometheus()
+
+    latency_buckets: tuple: upper bounds in seconds of the request latency histogram
+    parse_buckets: tuple: upper bounds in seconds of the parse time histogram
+    """
+
+    def __init__(self, latency_buckets=DEFAULT_LATENCY_BUCKETS, parse_buckets=DEFAULT_PARSE_BUCKETS):
+        self.latency_buckets = tuple(latency_buckets)
+        self.parse_buckets = tuple(parse_buckets)
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._parse = {}
+        self._responses = defaultdict(int)
+        self._retries = defaultdict(int)
+        self._timeouts = defaultdict(int)
+        self._bytes_sent = defaultdict(int)
+        self._bytes_received = defaultdict(int)
+        self._transports = weakref.WeakSet()
+
+    def observe_request(self, endpoint, method, status, seconds, bytes_sent, bytes_received):
+        with self._lock:
+            histogram = self._latency.get((endpoint, method))
+            if histogram is None:
+                histogram = self._latency[(endpoint, method)] = _Histogram(
+                    self.latency_buckets
+                )
+            histogram.observe(seconds)
+            self._responses[(endpoint, status)] += 1
+            self._bytes_sent[endpoint] += bytes_sent
+            self._bytes_received[endpoint] += bytes_received
+
+    def observe_retry(self, endpoint):
+        with self._lock:
+            self._retries[endpoint] += 1
+
+    def observe_timeout(self, endpoint):
+        with self._lock:
+            self._timeouts[endpoint] += 1
+
+    def observe_parse(self, model, seconds):
+        with self._lock:
+            histogram = self._parse.get(model)
+            if histogram is None:
+                histogram = self._parse[model] = _Histogram(self.parse_buckets)
+            histogram.observe(seconds)
+
+    def track_transport(self, transport):
+        if hasattr(transport, "pool_stats"):
+            self._transports.add(transport)
+
+    def pool_stats(self):
+        """
+        :return: tuple (connections opened, requests sent) over all tracked transports
+        """
+        opened = sent = 0
+        for transport in list(self._transports):
+            transport_opened, transport_sent = transport.pool_stats()
+            opened += transport_opened
+            sent += transport_sent
+        return opened, sent
+
+    def pool_reuse_rate(self):
+        """
+        :return: float  share of requests sent over an already open connection
+        """
+        opened, sent = self.pool_stats()
+        if not sent:
+            return 0.0
+        return max(0.0, 1.0 - opened / sent)
+
+    def to_prometheus(self):
+        """
+        :return: str  all metrics in the Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            _histogram_lines(
+                lines,
+                "payway_request_duration_seconds",
+                "Time to send a request to PayWay and read its response",
+                [
+                    ({"endpoint": endpoint, "method": method}, histogram)
+                    for (endpoint, method), histogram in sorted(self._latency.items())
+                ],
+            )
+            _counter_lines(
+                lines,
+                "payway_responses_total",
+                "Responses received from PayWay by status code",
+                [
+                    ({"endpoint": endpoint, "status": status}, count)
+                    for (endpoint, status), count in sorted(self._responses.items())
+                ],
+            )
+            for name, help_text, counts in (
+                ("payway_retries_total", "Throttled requests retried", self._retries),
+                ("payway_timeouts_total", "Attempts that timed out", self._timeouts),
+                ("payway_sent_bytes_total", "Request body bytes sent", self._bytes_sent),
+                (
+                    "payway_received_bytes_total",
+                    "Response body bytes received",
+                    self._bytes_received,
+                ),
+            ):
+                _counter_lines(
+                    lines,
+                    name,
+                    help_text,
+                    [({"endpoint": endpoint}, count) for endpoint, count in sorted(counts.items())],
+                )
+            _histogram_lines(
+                lines,
+                "payway_parse_duration_seconds",
+                "Time to turn a PayWay response into a model",
+                [({"model": model}, histogram) for model, histogram in sorted(self._parse.items())],
+            )
+        opened, sent = self.pool_stats()
+        _counter_lines(
+            lines,
+            "payway_connections_opened_total",
+            "Connections opened to PayWay",
+            [({}, opened)],
+        )
+        _counter_lines(
+            lines,
+            "payway_pooled_requests_total",
+            "Requests sent through the connection pool",
+            [({}, sent)],
+        )
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels.items()
+    )
+
+
+def _counter_lines(lines, name, help_text, samples):
+    lines.append("# HELP %s %s" % (name, help_text))
+    lines.append("# TYPE %s counter" % name)
+    for labels, value in samples:
+        lines.append("%s%s %s" % (name, _labels(labels), value))
+
+
+def _histogram_lines(lines, name, help_text, samples):
+    lines.append("# HELP %s %s" % (name, help_text))
+    lines.append("# TYPE %s histogram" % name)
+    for labels, histogram in samples:
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+            cumulative += count
+            bucket_labels = dict(labels, le=bound if bound == "+Inf" else repr(bound))
+            lines.append("%s_bucket%s %d" % (name, _labels(bucket_labels), cumulative))
+        lines.append("%s_sum%s %r" % (name, _labels(labels), histogram.sum))
+        lines.append("%s_count%s %d" % (name, _labels(labels), histogram.count))
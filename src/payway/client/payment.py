@@ -1,25 +1,39 @@
 from logging import getLogger
 
-from .base import TOKEN_NO_REDIRECT_ENDPOINT_PATH, TRANSACTION_ENDPOINT_PATH, CUSTOMER_ENDPOINT_PATH
+from .base import (
+    TOKEN_NO_REDIRECT_ENDPOINT_PATH,
+    TRANSACTION_ENDPOINT_PATH,
+    CUSTOMER_ENDPOINT_PATH,
+    BaseClient,
+    PayWayRequest,
+)
+from .tracing import span, traced
 from ..consts import CREDIT_CARD_PAYMENT_CHOICE, BANK_ACCOUNT_PAYMENT_CHOICE, VALID_PAYMENT_METHOD_CHOICES
 from ..errors import PaywayError
-from ..models import TokenResponse, PayWayTransaction, PaymentSetup
-from ..client.client import (
-    BaseClient
-)
+from ..models import TokenResponse, PaymentSetup
 
 logger = getLogger(__name__)
 
 
 class PaymentRequest(BaseClient):
+    @traced
     def create_token(self, payway_obj, payment_method, idempotency_key=None):
         """
         Creates a single use token for a Customer's payment setup (credit card or bank account)
         :param payway_obj:   object: one of model.PayWayCard or model.BankAccount object
         :param payment_method:   str: one of `card` or `direct_debit`
-        :param idempotency_key:   str: unique value to avoid duplicate POSTs
+        :param idempotency_key:   str: unique value to avoid duplicate POSTs, new per call when omitted
+        """
+        return self._send(
+            self._token_request(payway_obj, payment_method, idempotency_key)
+        )
+
+    def _token_request(self, payway_obj, payment_method, idempotency_key=None):
         """
-        data = payway_obj.to_dict()
+        :return: PayWayRequest  creating a single use token, see create_token
+        """
+        with span(self, "build_payload"):
+            data = payway_obj.to_dict()
         if payment_method == "card":
             payway_payment_method = CREDIT_CARD_PAYMENT_CHOICE
         elif payment_method == "direct_debit":
@@ -36,72 +50,88 @@ class PaymentRequest(BaseClient):
             }
         )
         logger.info("Sending Create Token request to PayWay.")
-        response = self.post_request(
+        return PayWayRequest(
+            "POST",
             TOKEN_NO_REDIRECT_ENDPOINT_PATH,
             data,
             auth=(self.publishable_api_key, ""),
             idempotency_key=idempotency_key,
+            parser=TokenResponse.from_dict,
+            idempotent=True,
+            # a token is single use, handing a recorded one out again would fail the
+            # call that uses it
+            replayable=False,
         )
-        logger.info("Response from server: %s" % response)
-        errors = self._validate_response(response)
-        if errors:
-            return None, errors
-        else:
-            token_response = TokenResponse().from_dict(response.json())
-            return token_response, errors
 
+    @traced
     def create_card_token(self, card, idempotency_key=None):
         """
         :param card:    PayWayCard object represents a customer's credit card details
-        :param idempotency_key:   str: unique value to avoid duplicate POSTs
+        :param idempotency_key:   str: unique value to avoid duplicate POSTs, new per call when omitted
         See model.PayWayCard
         """
         return self.create_token(card, "card", idempotency_key=idempotency_key)
 
+    @traced
     def create_bank_account_token(self, bank_account, idempotency_key=None):
         """
         :param bank_account:    BankAccount object represents a customer's bank account
-        :param idempotency_key:   str: unique value to avoid duplicate POSTs
+        :param idempotency_key:   str: unique value to avoid duplicate POSTs, new per call when omitted
         See model.BankAccount
         """
         return self.create_token(
             bank_account, "direct_debit", idempotency_key=idempotency_key
         )
 
+    @traced
     def process_payment(self, payment, idempotency_key=None):
         """
         Process an individual payment against a Customer with active Recurring Billing setup.
         :param payment: PayWayPayment object (see model.PayWayPayment)
-        :param idempotency_key:   str: unique value to avoid duplicate POSTs
+        :param idempotency_key:   str: unique value to avoid duplicate POSTs, new per call when omitted
+        """
+        return self._send(self._payment_request(payment, idempotency_key))
+
+    def _payment_request(self, payment, idempotency_key=None):
+        """
+        :return: PayWayRequest  processing the payment, see process_payment
         """
-        data = payment.to_dict()
+        with span(self, "build_payload"):
+            data = payment.to_dict()
         logger.info("Sending Process Payment request to PayWay.")
-        response = self.post_request(TRANSACTION_ENDPOINT_PATH, data, idempotency_key=idempotency_key)
-        logger.info("Response from server: %s" % response)
-        errors = self._validate_response(response)
-        if errors:
-            return None, errors
-        else:
-            # convert response to PayWayTransaction object
-            transaction = PayWayTransaction.from_dict(response.json())
-        return transaction, errors
+        return PayWayRequest(
+            "POST",
+            TRANSACTION_ENDPOINT_PATH,
+            data,
+            idempotency_key=idempotency_key,
+            parser=self.transaction_class.from_dict,
+            idempotent=True,
+            on_success=self._cache_transaction,
+        )
 
+    @traced
     def update_payment_setup(self, token, customer_id):
         """
         Updates the Customer's Payment Setup with a new Credit Card or Bank Account.
         :param token: PayWay credit card or bank account token
         :param customer_id: PayWay customer ID
         """
+        return self._send(self._payment_setup_request(token, customer_id))
+
+    def _payment_setup_request(self, token, customer_id):
+        """
+        :return: PayWayRequest  replacing the payment setup, see update_payment_setup
+        """
         endpoint = "%s/%s/payment-setup" % (CUSTOMER_ENDPOINT_PATH, str(customer_id))
         data = {
             "singleUseTokenId": token,
             "merchantId": self.merchant_id,
             "bankAccountId": self.bank_account_id,
         }
-        response = self.put_request(endpoint, data)
-        errors = self._validate_response(response)
-        if errors:
-            return None, errors
-        else:
-            ps = PaymentSetup.from_dict(response.json())
-        return ps, errors
+        return PayWayRequest(
+            "PUT",
+            endpoint,
+            data,
+            parser=PaymentSetup.from_dict,
+            on_success=lambda body: self._invalidate_customer(customer_id),
+        )
@@ -0,0 +1,228 @@
+import os
+import random
+import struct
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+
+THROTTLED_STATUS_CODES = (429, 503)
+IDEMPOTENT_METHODS = ("GET", "PUT", "DELETE")
+
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 30.0
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header given either as seconds or as an HTTP date
+    :param value: str  header value
+    :return: float seconds to wait, or None if missing or unparseable
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class RetryPolicy(object):
+    """
+    Decides whether a throttled (429/503) response is retried and how long to wait first.
+    Only idempotent methods, or POSTs carrying an idempotency key, are ever retried.
+
+    max_retries: int: retries after the first attempt
+    backoff_base: float: seconds, doubled on every attempt
+    backoff_max: float: cap on a single backoff delay
+    """
+
+    def __init__(
+        self,
+        max_retries=DEFAULT_MAX_RETRIES,
+        backoff_base=DEFAULT_BACKOFF_BASE,
+        backoff_max=DEFAULT_BACKOFF_MAX,
+    ):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def is_retryable(self, request):
+        """
+        :param request: PayWayRequest
+        """
+        return request.method in IDEMPOTENT_METHODS or bool(request.idempotency_key)
+
+    def delay(self, attempt, retry_after=None):
+        """
+        Seconds to wait before retry number `attempt` (starting at 0).
+        Honours Retry-After when PayWay sends it, otherwise uses full-jitter exponential backoff.
+        :param attempt: int
+        :param retry_after: float  parsed Retry-After header
+        """
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+class TokenBucket(object):
+    """
+    Client side token bucket pacing every request sent through a client.
+
+    The rate adapts to PayWay's feedback: it is halved when PayWay throttles a request (at
+    most once per second, so a burst of concurrent 429s counts once) and creeps back up
+    towards max_rate with every successful one.
+    Thread safe; share one instance between clients to give them a common budget.
+
+    rate: float: requests per second allowed
+    burst: int: requests that may be sent back to back before pacing starts
+    min_rate: float: floor the rate never drops below
+    """
+
+    def __init__(self, rate, burst=None, min_rate=None):
+        self.max_rate = float(rate)
+        self.burst = burst or max(1, int(rate))
+        self.min_rate = min_rate or self.max_rate / 32
+        self._lock = threading.Lock()
+        self._rate = self.max_rate
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._decreased = 0.0
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def _now(self):
+        return time.monotonic()
+
+    def _load(self):
+        return (
+            self._rate,
+            self._tokens,
+            self._updated,
+            self._blocked_until,
+            self._decreased,
+        )
+
+    def _store(self, rate, tokens, updated, blocked_until, decreased):
+        self._rate = rate
+        self._tokens = tokens
+        self._updated = updated
+        self._blocked_until = blocked_until
+        self._decreased = decreased
+
+    def _locked(self):
+        return self._lock
+
+    def reserve(self):
+        """
+        Take a token for one request
+        :return: float seconds the caller must wait before sending it
+        """
+        with self._locked():
+            rate, tokens, updated, blocked_until, decreased = self._load()
+            now = self._now()
+            tokens = min(float(self.burst), tokens + (now - updated) * rate)
+            # tokens may go negative: later callers queue up behind earlier reservations
+            tokens -= 1
+            wait = max(0.0, -tokens / rate, blocked_until - now)
+            self._store(rate, tokens, now, blocked_until, decreased)
+            return wait
+
+    def throttled(self, retry_after=None):
+        """
+        PayWay rejected a request with 429/503: halve the rate and honour Retry-After
+        :param retry_after: float seconds
+        """
+        with self._locked():
+            rate, tokens, updated, blocked_until, decreased = self._load()
+            now = self._now()
+            if now - decreased >= 1.0:
+                rate = max(self.min_rate, rate / 2)
+                decreased = now
+            if retry_after:
+                blocked_until = max(blocked_until, now + retry_after)
+            self._store(rate, min(tokens, 0.0), updated, blocked_until, decreased)
+
+    def succeeded(self):
+        """
+        PayWay accepted a request: recover a little of the rate lost to throttling
+        """
+        with self._locked():
+            rate, tokens, updated, blocked_until, decreased = self._load()
+            if rate < self.max_rate:
+                rate = min(self.max_rate, rate + self.max_rate / 100)
+                self._store(rate, tokens, updated, blocked_until, decreased)
+
+
+class _FileLock(object):
+    def __init__(self, fd, lock, fcntl):
+        self.fd = fd
+        self.lock = lock
+        self.fcntl = fcntl
+
+    def __enter__(self):
+        self.lock.acquire()
+        self.fcntl.flock(self.fd, self.fcntl.LOCK_EX)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.fcntl.flock(self.fd, self.fcntl.LOCK_UN)
+        self.lock.release()
+
+
+class FileTokenBucket(TokenBucket):
+    """
+    TokenBucket whose state lives in a small local file guarded by flock(), so every
+    process on the host (e.g. a pool of billing workers) draws from the same budget and
+    sees the same throttling feedback. Needs a POSIX system.
+    """
+
+    _STATE = struct.Struct("ddddd")
+
+    def __init__(self, path, rate, burst=None, min_rate=None):
+        """
+        :param path: str  state file shared by all processes
+        """
+        # POSIX only, imported here so the client itself still imports on Windows
+        import fcntl
+
+        super(FileTokenBucket, self).__init__(rate, burst=burst, min_rate=min_rate)
+        self._fcntl = fcntl
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked():
+            if os.fstat(self._fd).st_size < self._STATE.size:
+                self._store(self.max_rate, float(self.burst), self._now(), 0.0, 0.0)
+
+    def _now(self):
+        # wall clock, as monotonic clocks are not comparable between processes
+        return time.time()
+
+    def _load(self):
+        return self._STATE.unpack(os.pread(self._fd, self._STATE.size, 0))
+
+    def _store(self, rate, tokens, updated, blocked_until, decreased):
+        os.pwrite(
+            self._fd,
+            self._STATE.pack(rate, tokens, updated, blocked_until, decreased),
+            0,
+        )
+
+    def _locked(self):
+        return _FileLock(self._fd, self._lock, self._fcntl)
+
+    @property
+    def rate(self):
+        with self._locked():
+            return self._load()[0]
+
+    def close(self):
+        os.close(self._fd)
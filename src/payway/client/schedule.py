@@ -0,0 +1,107 @@
+from logging import getLogger
+
+from .base import CUSTOMER_ENDPOINT_PATH, BaseClient, PayWayRequest
+from .concurrency import DEFAULT_CONCURRENCY, bounded_map
+from .tracing import span, traced
+from ..models import PayWaySchedule
+
+logger = getLogger(__name__)
+
+
+class ScheduleRequest(BaseClient):
+    @traced
+    def get_schedule(self, customer_id):
+        """
+        Returns the regular payment schedule of a customer
+        :param customer_id: str  PayWay customer ID
+        """
+        endpoint = "%s/%s/schedule" % (CUSTOMER_ENDPOINT_PATH, str(customer_id))
+        return self._send(
+            PayWayRequest("GET", endpoint, parser=PayWaySchedule.from_dict)
+        )
+
+    @traced
+    def set_schedule(self, customer_id, schedule):
+        """
+        Creates or replaces the regular payment schedule of a customer
+        :param customer_id: str  PayWay customer ID
+        :param schedule: PayWaySchedule
+        """
+        endpoint = "%s/%s/schedule" % (CUSTOMER_ENDPOINT_PATH, str(customer_id))
+        with span(self, "build_payload"):
+            data = schedule.to_dict()
+        return self._send(
+            PayWayRequest(
+                "PUT",
+                endpoint,
+                data,
+                parser=PayWaySchedule.from_dict,
+                on_success=lambda body: self._invalidate_customer(customer_id),
+            )
+        )
+
+    @traced
+    def stop_schedule(self, customer_id):
+        """
+        Stops the regular payments of a customer
+        :param customer_id: str  PayWay customer ID
+        :return: tuple (None, list of PaymentError or None)
+        """
+        endpoint = "%s/%s/schedule" % (CUSTOMER_ENDPOINT_PATH, str(customer_id))
+        return self._send(
+            PayWayRequest(
+                "DELETE",
+                endpoint,
+                on_success=lambda body: self._invalidate_customer(customer_id),
+            )
+        )
+
+    def _set_schedule_item(self, item):
+        customer_id, schedule = item
+        return self.set_schedule(customer_id, schedule)
+
+    def set_schedules(
+        self, schedules, concurrency=DEFAULT_CONCURRENCY, on_progress=None
+    ):
+        """
+        Set the schedules of many customers concurrently, e.g. to reprice a plan, yielding
+        each result as soon as it arrives. A failed update is yielded alongside the others
+        instead of aborting the run.
+        :param schedules: iterable of (customer_id, PayWaySchedule), consumed lazily
+        :param concurrency: int  max updates in flight
+        :param on_progress: callable  called with (succeeded, failed) after every update
+        :return: generator of (customer_id, result) in completion order, where result is
+                 a PayWaySchedule, a list of PaymentError, or the exception raised
+        """
+        progress = _Progress(on_progress)
+        for (customer_id, _), future in bounded_map(
+            self._set_schedule_item, schedules, concurrency
+        ):
+            try:
+                schedule, errors = future.result()
+            except Exception as e:
+                logger.warning("Schedule of customer %s failed: %s" % (customer_id, e))
+                progress.update(False)
+                yield customer_id, e
+                continue
+            progress.update(not errors)
+            yield customer_id, errors or schedule
+
+
+class _Progress(object):
+    """
+    Counts the outcomes of a bulk operation for its on_progress callback
+    """
+
+    def __init__(self, on_progress):
+        self.on_progress = on_progress
+        self.succeeded = 0
+        self.failed = 0
+
+    def update(self, succeeded):
+        if succeeded:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        if self.on_progress is not None:
+            self.on_progress(self.succeeded, self.failed)
@@ -0,0 +1,110 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from src.payway.errors import PaywayError
+
+
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+
+# per call overrides, set with timeout() and deadline(). Context variables follow the
+# caller into coroutines and into bounded_map worker threads, but not into other threads.
+_timeout_override = ContextVar("payway_timeout", default=(None, None))
+_deadline = ContextVar("payway_deadline", default=None)
+
+
+@contextmanager
+def timeout(connect=None, read=None):
+    """
+    Override the connect and/or read timeout of the calls made inside the block
+    :param connect: float  seconds to establish a connection, None keeps the current value
+    :param read: float  seconds to wait for data from PayWay, None keeps the current value
+    """
+    current_connect, current_read = _timeout_override.get()
+    token = _timeout_override.set(
+        (
+            current_connect if connect is None else connect,
+            current_read if read is None else read,
+        )
+    )
+    try:
+        yield
+    finally:
+        _timeout_override.reset(token)
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Bound the total time of every call made inside the block, retries and backoff included.
+    A nested deadline can only shorten the one around it.
+    :param seconds: float
+    """
+    expires = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        expires = min(expires, current)
+    token = _deadline.set(expires)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """
+    :return: float seconds left before the current deadline, or None without a deadline
+    """
+    expires = _deadline.get()
+    if expires is None:
+        return None
+    return expires - time.monotonic()
+
+
+def check_deadline(wait=0.0):
+    """
+    Raise PaywayError DEADLINE_EXCEEDED if the deadline passes within `wait` seconds,
+    so the client never sleeps past a deadline it cannot meet
+    :param wait: float  seconds the caller is about to wait
+    """
+    left = remaining()
+    if left is not None and left <= wait:
+        raise PaywayError(
+            code="DEADLINE_EXCEEDED", message="Deadline exceeded before PayWay answered"
+        )
+
+
+def resolve(default):
+    """
+    Timeouts for the next attempt: the overrides, falling back to `default`, and capped by
+    the time left before the deadline
+    :param default: tuple (connect, read) of the transport
+    :return: tuple (connect, read), None meaning no limit
+    """
+    connect, read = _timeout_override.get()
+    default_connect, default_read = default or (None, None)
+    if connect is None:
+        connect = default_connect
+    if read is None:
+        read = default_read
+    left = remaining()
+    if left is not None:
+        check_deadline()
+        connect = left if connect is None else min(connect, left)
+        read = left if read is None else min(read, left)
+    return connect, read
+
+
+def timeout_error(error):
+    """
+    :param error: the timeout raised by requests or httpx
+    :return: PaywayError  DEADLINE_EXCEEDED if the deadline cut the attempt short,
+                          TIMEOUT otherwise
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        return PaywayError(
+            code="DEADLINE_EXCEEDED", message="Deadline exceeded: %s" % error
+        )
+    return PaywayError(code="TIMEOUT", message="PayWay did not answer in time: %s" % error)
@@ -0,0 +1,323 @@
+import functools
+import inspect
+import os
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from src.payway import codec
+
+
+_current_span = ContextVar("payway_span", default=None)
+_NO_SPAN = nullcontext()
+
+
+def current_span():
+    """
+    :return: Span  the innermost open span of this thread or task, or None
+    """
+    return _current_span.get()
+
+
+class Span(object):
+    """
+    One timed phase of a client call. Spans nest: a call such as process_payment is the
+    root, with build_payload, attempt (acquire_connection, tcp_connect, tls, send,
+    wait_first_byte, read_body), validate and parse below it.
+
+    Used as a context manager the span is current for the code inside it and finishes,
+    recording any exception, when the block exits.
+    """
+
+    __slots__ = (
+        "tracer",
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start",
+        "duration",
+        "attributes",
+        "error",
+        "_started",
+        "_token",
+    )
+
+    def __init__(self, tracer, name, parent=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        if parent is None:
+            self.trace_id = os.urandom(16).hex()
+            self.parent_id = None
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+        self.start = time.time()
+        self.duration = None
+        self.attributes = attributes or {}
+        self.error = None
+        self._started = time.perf_counter()
+        self._token = None
+
+    def set(self, name, value):
+        self.attributes[name] = value
+
+    def finish(self, error=None):
+        """
+        :param error: Exception  that ended the phase, if any
+        """
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        if error is not None:
+            self.error = {"type": type(error).__name__, "message": str(error)}
+            code = getattr(error, "code", None)
+            if code is not None:
+                self.error["code"] = code
+            trace_code = getattr(error, "trace_code", None)
+            if trace_code is not None:
+                # quote it to PayWay support to find the failed request on their side
+                self.error["traceCode"] = trace_code
+        self.tracer.export(self)
+
+    def to_dict(self):
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentId": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration": self.duration,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current_span.reset(self._token)
+        self.finish(exc_value)
+        return False
+
+
+class Tracer(object):
+    """
+    Creates spans for client calls and hands finished ones to the exporter.
+
+    exporter: object with export(span), e.g. JSONLinesExporter
+    """
+
+    def __init__(self, exporter):
+        self.exporter = exporter
+
+    def span(self, name, **attributes):
+        """
+        :return: Span  child of the current span, or a new trace
+        """
+        return Span(self, name, _current_span.get(), attributes)
+
+    def record(self, name, start, duration, parent, **attributes):
+        """
+        Add a span for a phase that was timed by other means
+        :param start: float  epoch seconds
+        :param duration: float  seconds
+        :param parent: Span
+        """
+        span = Span(self, name, parent, attributes)
+        span.start = start
+        span.duration = duration
+        self.export(span)
+
+    def export(self, span):
+        self.exporter.export(span)
+
+
+class JSONLinesExporter(object):
+    """
+    Appends finished spans to a local file, one JSON object per line, for offline
+    analysis (e.g. building flame graphs from traceId/parentId and start/duration).
+    Thread safe.
+
+    path: str: file to append to
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+
+    def export(self, span):
+        line = codec.dumps(span.to_dict()) + b"\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def traced(method):
+    """
+    Run a client method inside a root span named after it when the client has a tracer.
+    Awaitables returned by the async client keep the span open until they complete.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        tracer = self.tracer
+        if tracer is None:
+            return method(self, *args, **kwargs)
+        span = tracer.span(method.__name__)
+        token = _current_span.set(span)
+        try:
+            result = method(self, *args, **kwargs)
+        except BaseException as e:
+            span.finish(e)
+            raise
+        finally:
+            _current_span.reset(token)
+        if inspect.isawaitable(result):
+            return _finish_when_done(span, result)
+        span.finish()
+        return result
+
+    return wrapper
+
+
+async def _finish_when_done(span, awaitable):
+    with span:
+        return await awaitable
+
+
+def span(client, name, **attributes):
+    """
+    :return: a span of the client's tracer, or a no-op context manager without one
+    """
+    if client.tracer is None:
+        return _NO_SPAN
+    return client.tracer.span(name, **attributes)
+
+
+# urllib3 hooks for the sync transport: they only record while a client call is traced
+
+
+def _child(name):
+    parent = _current_span.get()
+    if parent is None:
+        return _NO_SPAN
+    return parent.tracer.span(name)
+
+
+class _TracedConnectionMixin(object):
+    def _new_conn(self):
+        with _child("tcp_connect"):
+            sock = super(_TracedConnectionMixin, self)._new_conn()
+        self._tcp_connected = (time.time(), time.perf_counter())
+        return sock
+
+    def connect(self):
+        self._tcp_connected = None
+        super(_TracedConnectionMixin, self).connect()
+        parent = _current_span.get()
+        if (
+            parent is not None
+            and self._tcp_connected is not None
+            and isinstance(self, HTTPSConnection)
+        ):
+            # HTTPSConnection.connect() opens the socket, then runs the TLS handshake
+            start, started = self._tcp_connected
+            parent.tracer.record("tls", start, time.perf_counter() - started, parent)
+
+    def request(self, *args, **kwargs):
+        with _child("send"):
+            return super(_TracedConnectionMixin, self).request(*args, **kwargs)
+
+    def getresponse(self, *args, **kwargs):
+        with _child("wait_first_byte"):
+            return super(_TracedConnectionMixin, self).getresponse(*args, **kwargs)
+
+
+class TracedHTTPConnection(_TracedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TracedHTTPSConnection(_TracedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TracedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TracedHTTPConnection
+
+    def _get_conn(self, timeout=None):
+        with _child("acquire_connection"):
+            return super(TracedHTTPConnectionPool, self)._get_conn(timeout=timeout)
+
+
+class TracedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TracedHTTPSConnection
+
+    def _get_conn(self, timeout=None):
+        with _child("acquire_connection"):
+            return super(TracedHTTPSConnectionPool, self)._get_conn(timeout=timeout)
+
+
+def install_urllib3_hooks(adapter):
+    """
+    Make a requests HTTPAdapter create connection pools that record tracing spans
+    :param adapter: requests.adapters.HTTPAdapter
+    """
+    adapter.poolmanager.pool_classes_by_scheme = {
+        "http": TracedHTTPConnectionPool,
+        "https": TracedHTTPSConnectionPool,
+    }
+
+
+# httpcore trace events for the async transport, by the phase they belong to
+_HTTPCORE_PHASES = {
+    "connection.connect_tcp": "tcp_connect",
+    "connection.start_tls": "tls",
+    "http11.send_request_headers": "send",
+    "http11.send_request_body": "send",
+    "http2.send_request_headers": "send",
+    "http2.send_request_body": "send",
+    "http11.receive_response_headers": "wait_first_byte",
+    "http2.receive_response_headers": "wait_first_byte",
+    "http11.receive_response_body": "read_body",
+    "http2.receive_response_body": "read_body",
+}
+
+
+def httpx_trace_extension(parent):
+    """
+    httpx "trace" extension recording the phases of one request as children of parent.
+    Consecutive events of the same phase (request headers, then body) form one span.
+    :param parent: Span
+    """
+    started = {}
+
+    async def trace(event_name, info):
+        event, _, stage = event_name.rpartition(".")
+        phase = _HTTPCORE_PHASES.get(event)
+        if phase is None:
+            return
+        if stage == "started":
+            started.setdefault(phase, (time.time(), time.perf_counter()))
+        elif stage in ("complete", "failed"):
+            if phase == "send" and event.endswith("headers") and stage == "complete":
+                # the body follows and closes the send span
+                return
+            start = started.pop(phase, None)
+            if start is not None:
+                parent.tracer.record(
+                    phase, start[0], time.perf_counter() - start[1], parent
+                )
+
+    return trace
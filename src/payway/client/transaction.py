@@ -1,43 +1,81 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from logging import getLogger
+from urllib.parse import urlencode
 
-from .base import TRANSACTION_ENDPOINT_PATH
-from .client import BaseClient
-from ..models import PayWayTransaction
+from .base import (
+    TRANSACTION_ENDPOINT_PATH,
+    TRANSACTION_SEARCH_CUSTOMER_PATH,
+    TRANSACTION_SEARCH_RECEIPT_PATH,
+    TRANSACTION_SEARCH_SETTLEMENT_PATH,
+    BaseClient,
+    PayWayRequest,
+)
+from .concurrency import DEFAULT_CONCURRENCY, bounded_map
+from .tracing import traced
 
 logger = getLogger(__name__)
 
 
 class TransactionRequest(BaseClient):
+    @traced
     def get_transaction(self, transaction_id):
         """
         Lookup and return a transaction if found in PayWay
         :param transaction_id: str  A PayWay transaction ID
         """
         endpoint = "%s/%s" % (TRANSACTION_ENDPOINT_PATH, str(transaction_id))
-        response = self.get_request(endpoint)
-        logger.info("Response from server: %s" % response)
-        errors = self._validate_response(response)
-        if errors:
-            return None, errors
-        else:
-            transaction = PayWayTransaction.from_dict(response.json())
-        return transaction, errors
+        return self._send(
+            PayWayRequest(
+                "GET",
+                endpoint,
+                parser=self.transaction_class.from_dict,
+                cache=self.transaction_cache,
+                cache_key=str(transaction_id),
+            )
+        )
 
+    def get_transactions(self, transaction_ids, concurrency=DEFAULT_CONCURRENCY):
+        """
+        Lookup many transactions concurrently, yielding each result as soon as it arrives.
+        A failed lookup is yielded alongside the others instead of aborting the batch.
+        :param transaction_ids: iterable of str PayWay transaction IDs, consumed lazily
+        :param concurrency: int  max lookups in flight
+        :return: generator of (transaction_id, result) in completion order, where result is
+                 a PayWayTransaction, a list of PaymentError, or the exception raised
+        """
+        for transaction_id, future in bounded_map(
+            self.get_transaction, transaction_ids, concurrency
+        ):
+            try:
+                transaction, errors = future.result()
+            except Exception as e:
+                logger.warning("Lookup of transaction %s failed: %s" % (transaction_id, e))
+                yield transaction_id, e
+                continue
+            yield transaction_id, errors or transaction
+
+    @traced
     def void_transaction(self, transaction_id, idempotency_key=None):
         """
         Void a transaction in PayWay
         :param transaction_id: str  A PayWay transaction ID
-        :param idempotency_key:   str: unique value to avoid duplicate POSTs
+        :param idempotency_key:   str: unique value to avoid duplicate POSTs, new per call when omitted
         """
         endpoint = "%s/%s/void" % (TRANSACTION_ENDPOINT_PATH, transaction_id)
-        response = self.post_request(endpoint, data={}, idempotency_key=idempotency_key)
-        errors = self._validate_response(response)
-        if errors:
-            return None, errors
-        else:
-            transaction = PayWayTransaction.from_dict(response.json())
-        return transaction, errors
+        return self._send(
+            PayWayRequest(
+                "POST",
+                endpoint,
+                data={},
+                idempotency_key=idempotency_key,
+                parser=self.transaction_class.from_dict,
+                idempotent=True,
+                on_success=self._cache_transaction,
+            )
+        )
 
+    @traced
     def refund_transaction(
         self,
         transaction_id,
@@ -52,7 +90,7 @@ class TransactionRequest(BaseClient):
         :param amount:  str  amount to refund
         :param order_id:  str  optional reference number
         :param ip_address:  str  optional IP address
-        :param idempotency_key:   str: unique value to avoid duplicate POSTs
+        :param idempotency_key:   str: unique value to avoid duplicate POSTs, new per call when omitted
         """
         endpoint = TRANSACTION_ENDPOINT_PATH
         data = {
@@ -64,10 +102,104 @@ class TransactionRequest(BaseClient):
             data["orderNumber"] = order_id
         if ip_address:
             data["customerIpAddress"] = ip_address
-        response = self.post_request(endpoint, data, idempotency_key=idempotency_key)
-        errors = self._validate_response(response)
-        if errors:
-            return None, errors
-        else:
-            transaction = PayWayTransaction.from_dict(response.json())
-        return transaction, errors
+
+        def on_refunded(body):
+            self._cache_transaction(body)
+            # the parent's refundable state changes with every refund
+            self._invalidate_transaction(transaction_id)
+
+        return self._send(
+            PayWayRequest(
+                "POST",
+                endpoint,
+                data,
+                idempotency_key=idempotency_key,
+                parser=self.transaction_class.from_dict,
+                idempotent=True,
+                on_success=on_refunded,
+            )
+        )
+
+    def search_customer_transactions(self, customer_number):
+        """
+        All transactions of a customer
+        :param customer_number: str  PayWay customer number
+        :return: generator of PayWayTransaction, fetched page by page
+                 (an async generator with AsyncPayWayClient)
+        """
+        return self._search_transactions(
+            "%s?%s"
+            % (
+                TRANSACTION_SEARCH_CUSTOMER_PATH,
+                urlencode({"customerNumber": customer_number}),
+            )
+        )
+
+    def search_settlement_transactions(self, from_date, to_date=None):
+        """
+        Transactions settled between two dates
+        :param from_date: date or str  first settlement date, e.g. "2024-06-12"
+        :param to_date: date or str  last settlement date, defaults to from_date
+        :return: generator of PayWayTransaction, fetched page by page
+                 (an async generator with AsyncPayWayClient)
+        """
+        return self._search_transactions(
+            "%s?%s"
+            % (TRANSACTION_SEARCH_SETTLEMENT_PATH, _date_range(from_date, to_date))
+        )
+
+    def search_receipt_transactions(self, from_date, to_date=None):
+        """
+        Transactions processed between two dates
+        :param from_date: date or str  first transaction date, e.g. "2024-06-12"
+        :param to_date: date or str  last transaction date, defaults to from_date
+        :return: generator of PayWayTransaction, fetched page by page
+                 (an async generator with AsyncPayWayClient)
+        """
+        return self._search_transactions(
+            "%s?%s" % (TRANSACTION_SEARCH_RECEIPT_PATH, _date_range(from_date, to_date))
+        )
+
+    def _search_transactions(self, endpoint):
+        """
+        Yield the transactions of a search page by page. The next page is fetched in the
+        background while the caller works through the current one, so at most two pages
+        are held in memory whatever the size of the result.
+        :param endpoint: str  the search, with its query string
+        """
+        executor = ThreadPoolExecutor(max_workers=1)
+
+        def fetch(endpoint):
+            # in a copy of the caller's context, so timeout() and deadline() apply
+            context = contextvars.copy_context()
+            return executor.submit(
+                context.run, self._send, self._search_page_request(endpoint)
+            )
+
+        future = fetch(endpoint)
+        try:
+            while future is not None:
+                page = self._search_page(future.result())
+                future = None
+                if page.next_page is not None:
+                    future = fetch(self._next_page_endpoint(page.next_page))
+                for transaction in page.transactions:
+                    yield transaction
+        finally:
+            # a caller that stops early does not wait for the page being prefetched
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _date_range(from_date, to_date):
+    """
+    :return: str  fromDate and toDate query parameters
+    """
+    if to_date is None:
+        to_date = from_date
+    return urlencode({"fromDate": _search_date(from_date), "toDate": _search_date(to_date)})
+
+
+def _search_date(value):
+    if hasattr(value, "strftime"):
+        return value.strftime("%Y-%m-%d")
+    return value
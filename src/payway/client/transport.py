@@ -0,0 +1,138 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import tracing as _tracing
+from .timeouts import DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+
+
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_KEEP_ALIVE = 60
+
+
+class PayWayTransport(object):
+    """
+    Sends HTTP requests to PayWay over a single requests.Session with pooled,
+    keep-alive connections, so consecutive calls reuse the TCP+TLS connection
+    instead of performing a fresh handshake each time.
+
+    A transport is thread safe and may be shared between several clients.
+    """
+
+    def __init__(
+        self,
+        pool_connections=DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize=DEFAULT_POOL_MAXSIZE,
+        keep_alive=DEFAULT_KEEP_ALIVE,
+        pool_block=False,
+        max_in_flight=None,
+        connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+        read_timeout=DEFAULT_READ_TIMEOUT,
+        tracing=False,
+    ):
+        """
+        :param pool_connections : int       = Number of per-host connection pools to cache
+        :param pool_maxsize     : int       = Max connections kept alive per host
+        :param keep_alive       : float     = Seconds an idle connection may be reused, None to never recycle
+        :param pool_block       : bool      = Wait for a free connection instead of opening one beyond pool_maxsize
+        :param max_in_flight    : int       = Global cap on concurrent requests through this transport, None for no cap
+        :param connect_timeout  : float     = Default seconds to establish a connection, None to wait forever
+        :param read_timeout     : float     = Default seconds to wait for data from PayWay, None to wait forever
+        :param tracing          : bool      = Record connection level spans (acquire, connect, TLS, send, ...)
+                                              for traced client calls
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.pool_block = pool_block
+        self.max_in_flight = max_in_flight
+        self.timeout = (connect_timeout, read_timeout)
+        self.tracing = tracing
+
+        self._adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+        )
+        if tracing:
+            _tracing.install_urllib3_hooks(self._adapter)
+        session = requests.Session()
+        session.mount("https://", self._adapter)
+        session.mount("http://", self._adapter)
+        self.session = session
+
+        self._lock = threading.Lock()
+        self._last_used = time.monotonic()
+        # (connections opened, requests sent) of the pools dropped by recycling
+        self._retired_pool_stats = (0, 0)
+        self._in_flight = None
+        if max_in_flight:
+            self._in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request through the pooled session
+        :param method: str  HTTP method
+        :param url: str  absolute URL
+        :param kwargs: passed through to requests.Session.request
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        self._recycle_idle_connections()
+        if self._in_flight is None:
+            return self._request(method, url, kwargs)
+        with self._in_flight:
+            return self._request(method, url, kwargs)
+
+    def _request(self, method, url, kwargs):
+        if not self.tracing or _tracing.current_span() is None or kwargs.get("stream"):
+            return self.session.request(method, url, **kwargs)
+        # stream the body so reading it is timed on its own
+        kwargs["stream"] = True
+        response = self.session.request(method, url, **kwargs)
+        with _tracing.current_span().tracer.span("read_body"):
+            response.content
+        return response
+
+    def _recycle_idle_connections(self):
+        """
+        Drop pooled connections that have been idle for longer than keep_alive.
+        Servers and load balancers silently close idle sockets, and reusing one
+        of those fails the request, so they are discarded before the next call.
+        """
+        if self.keep_alive is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            idle = now - self._last_used
+            self._last_used = now
+        if idle > self.keep_alive:
+            with self._lock:
+                self._retired_pool_stats = self._live_pool_stats(self._retired_pool_stats)
+                self._adapter.poolmanager.clear()
+
+    def pool_stats(self):
+        """
+        :return: tuple (connections opened, requests sent) since the transport was created.
+                 Requests minus connections is the number of requests that reused one.
+        """
+        with self._lock:
+            return self._live_pool_stats(self._retired_pool_stats)
+
+    def _live_pool_stats(self, totals):
+        opened, sent = totals
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+                sent += pool.num_requests
+        return opened, sent
+
+    def close(self):
+        """
+        Close all pooled connections
+        """
+        self.session.close()
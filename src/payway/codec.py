@@ -0,0 +1,87 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib codec is used without it
+    orjson = None
+
+
+class StdlibJSONCodec(object):
+    """
+    JSON codec on the standard library json module, always available
+    """
+
+    name = "json"
+
+    def loads(self, data):
+        """
+        :param data: bytes or str  JSON document, bytes are decoded to a str copy first
+        """
+        return json.loads(data)
+
+    def dumps(self, value):
+        """
+        :return: bytes  compact UTF-8 JSON
+        """
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode(
+            "utf-8"
+        )
+
+
+class OrjsonCodec(object):
+    """
+    JSON codec on orjson, several times faster than the stdlib for PayWay sized payloads
+    """
+
+    name = "orjson"
+
+    def loads(self, data):
+        """
+        :param data: bytes or str  JSON document, bytes are parsed without a text copy
+        """
+        return orjson.loads(data)
+
+    def dumps(self, value):
+        # non str keys are converted like the stdlib does, e.g. integer IDs
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+
+def default_codec():
+    """
+    :return: OrjsonCodec when orjson is installed, StdlibJSONCodec otherwise
+    """
+    if orjson is not None:
+        return OrjsonCodec()
+    return StdlibJSONCodec()
+
+
+_codec = default_codec()
+
+
+def get_codec():
+    return _codec
+
+
+def set_codec(codec):
+    """
+    Replace the codec used to decode PayWay responses and to encode cached and stored data.
+    Any object with loads(bytes or str) and dumps(value) -> bytes will do; decode errors
+    must be ValueErrors (json.JSONDecodeError is one).
+    :param codec: e.g. StdlibJSONCodec() to opt out of orjson
+    """
+    global _codec
+    _codec = codec
+
+
+def loads(data):
+    """
+    :param data: bytes or str  JSON document
+    """
+    return _codec.loads(data)
+
+
+def dumps(value):
+    """
+    :return: bytes  JSON encoded value
+    """
+    return _codec.dumps(value)
@@ -1,10 +1,13 @@
 TRANSACTION_APPROVED = "0"
+TRANSACTION_DECLINED = "1"
+TRANSACTION_ERRED = "2"
+TRANSACTION_REJECTED = "3"
 
 SUMMARY_CODES = {
     TRANSACTION_APPROVED: "Transaction Approved",
-    "1": "Transaction Declined",
-    "2": "Transaction Erred",
-    "3": "Transaction Rejected",
+    TRANSACTION_DECLINED: "Transaction Declined",
+    TRANSACTION_ERRED: "Transaction Erred",
+    TRANSACTION_REJECTED: "Transaction Rejected",
 }
 
 EFT_RESPONSE_CODES = {
@@ -1,12 +1,21 @@
 class PaywayError(Exception):
     _code = None
     _message = None
+    # traceCode PayWay returned with a server error, if any
+    trace_code = None
 
     def __init__(self, code, message, *args, **kwargs):
         super(PaywayError, self).__init__(*args, **kwargs)
 
         self._code = code
-        self._message = "{}: {}".format(code, message).encode("utf-8")
+        self._message = "{}: {}".format(code, message)
+
+    @property
+    def code(self):
+        """
+        HTTP status code, or a string such as "TIMEOUT" or "DEADLINE_EXCEEDED"
+        """
+        return self._code
 
     def __str__(self):
         return self._message
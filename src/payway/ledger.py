@@ -0,0 +1,359 @@
+import atexit
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta, timezone
+from logging import getLogger
+
+from . import codec
+from .models import LazyPayWayTransaction, PayWayTransaction
+
+
+logger = getLogger(__name__)
+
+DEFAULT_LEDGER_BATCH_SIZE = 500
+DEFAULT_LEDGER_MAX_PENDING = 100000
+DEFAULT_LEDGER_MAX_WAIT = 1.0
+
+# PayWay reports times in Sydney time, e.g. "12 Jun 2024 14:05 AEST"
+_PAYWAY_TIMEZONES = {
+    "AEST": timezone(timedelta(hours=10)),
+    "AEDT": timezone(timedelta(hours=11)),
+}
+
+_COLUMNS = (
+    "transaction_id",
+    "receipt_number",
+    "status",
+    "transaction_type",
+    "customer_number",
+    "order_number",
+    "principal_amount",
+    "transaction_time",
+    "settlement_date",
+    "body",
+)
+
+
+def _transaction_time(value):
+    """
+    :param value: str  PayWay transactionDateTime, e.g. "12 Jun 2024 14:05 AEST"
+    :return: float  epoch seconds, or None if it cannot be read
+    """
+    if not value:
+        return None
+    text, _, zone = value.rpartition(" ")
+    try:
+        moment = datetime.strptime(text, "%d %b %Y %H:%M")
+    except ValueError:
+        return None
+    return moment.replace(tzinfo=_PAYWAY_TIMEZONES.get(zone, timezone.utc)).timestamp()
+
+
+def _settlement_date(value):
+    """
+    :param value: str  PayWay settlementDate, e.g. "12 Jun 2024"
+    :return: str  ISO date that sorts and compares correctly, e.g. "2024-06-12"
+    """
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%d %b %Y").date().isoformat()
+    except ValueError:
+        return None
+
+
+def _epoch(value):
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return value
+
+
+def _iso_date(value):
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%Y-%m-%d")
+    return value
+
+
+class TransactionLedger(object):
+    """
+    Local record of every PayWay transaction a client creates or fetches, kept in an
+    indexed SQLite database, so questions about past payments (all transactions of a
+    customer, an order number, recent declines) are answered without calling PayWay.
+
+    Recording only queues the response: a background thread writes queued transactions
+    in batches, one SQLite transaction per batch, so process_payment does not wait for
+    the disk. Queries first wait for the transactions queued before them. The database
+    runs in WAL mode, so readers in other processes never block the writer.
+
+    The queue is bounded. When it is full, recording waits up to max_wait seconds for
+    the writer to catch up, then drops the transactions with a warning. Transactions
+    recorded after close() are dropped the same way. Dropped ones are counted in
+    dropped.
+
+    path: str: database file, may be shared by the worker processes of a host
+    batch_size: int: max transactions written per SQLite transaction
+    max_pending: int: max transactions queued, None for no limit
+    max_wait: float: seconds recording waits for room in a full queue
+    lazy: bool: return LazyPayWayTransaction objects, decoded only as fields are read
+    table: str: table name
+    """
+
+    def __init__(
+        self,
+        path,
+        batch_size=DEFAULT_LEDGER_BATCH_SIZE,
+        lazy=False,
+        table="payway_transactions",
+        max_pending=DEFAULT_LEDGER_MAX_PENDING,
+        max_wait=DEFAULT_LEDGER_MAX_WAIT,
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.max_wait = max_wait
+        self.dropped = 0
+        self.transaction_class = LazyPayWayTransaction if lazy else PayWayTransaction
+        self.table = table
+        self._insert = "INSERT OR REPLACE INTO %s (%s) VALUES (%s)" % (
+            table,
+            ", ".join(_COLUMNS),
+            ", ".join("?" * len(_COLUMNS)),
+        )
+        self._local = threading.local()
+        self._condition = threading.Condition()
+        self._pending = []
+        self._queued = 0
+        self._written = 0
+        self._closed = False
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS %s ("
+                "transaction_id TEXT PRIMARY KEY, receipt_number TEXT, status TEXT, "
+                "transaction_type TEXT, customer_number TEXT, order_number TEXT, "
+                "principal_amount REAL, transaction_time REAL, settlement_date TEXT, "
+                "body BLOB NOT NULL)" % table
+            )
+            for columns in (
+                "customer_number, transaction_time",
+                "order_number",
+                "status, transaction_time",
+                "transaction_time",
+                "settlement_date",
+            ):
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS %s_%s ON %s (%s)"
+                    % (table, columns.split(",")[0], table, columns)
+                )
+        self._writer = threading.Thread(
+            target=self._write_batches, name="payway-ledger", daemon=True
+        )
+        self._writer.start()
+        # queued transactions are written before the interpreter exits
+        atexit.register(self.close)
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def record(self, body):
+        """
+        Queue a transaction to be written, replacing any earlier record of it
+        :param body: dict  PayWay transaction response
+        """
+        if body.get("transactionId") is None:
+            return
+        self._enqueue([body])
+
+    def record_many(self, bodies):
+        """
+        :param bodies: iterable of dict  PayWay transaction responses
+        """
+        bodies = [body for body in bodies if body.get("transactionId") is not None]
+        if not bodies:
+            return
+        self._enqueue(bodies)
+
+    def _enqueue(self, bodies):
+        with self._condition:
+            if self.max_pending is not None:
+                # backpressure, a larger batch than max_pending still fits an empty queue
+                self._condition.wait_for(
+                    lambda: self._closed
+                    or not self._pending
+                    or len(self._pending) + len(bodies) <= self.max_pending,
+                    self.max_wait,
+                )
+            if self._closed:
+                reason = "the ledger is closed"
+            elif (
+                self.max_pending is not None
+                and self._pending
+                and len(self._pending) + len(bodies) > self.max_pending
+            ):
+                reason = "%d transactions are already queued" % len(self._pending)
+            else:
+                self._pending.extend(bodies)
+                self._queued += len(bodies)
+                self._condition.notify_all()
+                return
+            self.dropped += len(bodies)
+        logger.warning(
+            "Dropped %d transactions instead of recording them in the ledger, %s"
+            % (len(bodies), reason)
+        )
+
+    def flush(self, timeout=None):
+        """
+        Wait until every transaction recorded so far is written
+        :param timeout: float  seconds to wait at most, None to wait as long as it takes
+        :return: bool  False if the timeout expired first
+        """
+        with self._condition:
+            target = self._queued
+            return self._condition.wait_for(
+                lambda: self._written >= target or not self._writer.is_alive(),
+                timeout,
+            )
+
+    def close(self):
+        """
+        Write the queued transactions and stop the writer thread
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._writer is not threading.current_thread():
+            self._writer.join()
+        atexit.unregister(self.close)
+
+    def _write_batches(self):
+        connection = self._connection()
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                batch = self._pending[: self.batch_size]
+                del self._pending[: self.batch_size]
+                # wakes up recording waiting for room in the queue
+                self._condition.notify_all()
+            try:
+                with connection:
+                    connection.executemany(
+                        self._insert, [self._row(body) for body in batch]
+                    )
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                logger.error(
+                    "Could not record %d transactions in the ledger: %s"
+                    % (len(batch), e)
+                )
+            with self._condition:
+                self._written += len(batch)
+                self._condition.notify_all()
+
+    @staticmethod
+    def _row(body):
+        return (
+            str(body["transactionId"]),
+            body.get("receiptNumber"),
+            body.get("status"),
+            body.get("transactionType"),
+            body.get("customerNumber"),
+            body.get("orderNumber"),
+            body.get("principalAmount"),
+            _transaction_time(body.get("transactionDateTime")),
+            _settlement_date(body.get("settlementDate")),
+            codec.dumps(body),
+        )
+
+    def _query(self, where, params, limit=None):
+        self.flush()
+        sql = (
+            "SELECT body FROM %s WHERE %s ORDER BY transaction_time, transaction_id"
+            % (self.table, where)
+        )
+        if limit is not None:
+            sql += " LIMIT %d" % limit
+        rows = self._connection().execute(sql, params).fetchall()
+        if self.transaction_class is LazyPayWayTransaction:
+            # the stored bytes are only decoded when a field is read
+            return [LazyPayWayTransaction(body) for (body,) in rows]
+        return [PayWayTransaction.from_dict(codec.loads(body)) for (body,) in rows]
+
+    def get(self, transaction_id):
+        """
+        :return: PayWayTransaction  or None if it was never recorded
+        """
+        transactions = self._query("transaction_id = ?", (str(transaction_id),))
+        return transactions[0] if transactions else None
+
+    def by_customer(self, customer_number, limit=None):
+        """
+        :return: list of PayWayTransaction of the customer, oldest first
+        """
+        return self._query("customer_number = ?", (customer_number,), limit)
+
+    def by_order_number(self, order_number):
+        """
+        :return: list of PayWayTransaction with this order number, oldest first
+        """
+        return self._query("order_number = ?", (order_number,))
+
+    def by_status(self, status, since=None, until=None, limit=None):
+        """
+        e.g. the declines of the last hour:
+        by_status("declined", since=time.time() - 3600)
+        :param since: datetime or float epoch seconds  earliest transaction time
+        :param until: datetime or float epoch seconds  latest transaction time
+        """
+        where = ["status = ?"]
+        params = [status]
+        self._time_range(where, params, since, until)
+        return self._query(" AND ".join(where), params, limit)
+
+    def between(self, since, until=None, limit=None):
+        """
+        :param since: datetime or float epoch seconds  earliest transaction time
+        :param until: datetime or float epoch seconds  latest transaction time
+        :return: list of PayWayTransaction processed in the range, oldest first
+        """
+        where = []
+        params = []
+        self._time_range(where, params, since, until)
+        return self._query(" AND ".join(where), params, limit)
+
+    def by_settlement_date(self, from_date, to_date=None, limit=None):
+        """
+        :param from_date: date or str  first settlement date, e.g. "2024-06-12"
+        :param to_date: date or str  last settlement date, defaults to from_date
+        """
+        if to_date is None:
+            to_date = from_date
+        return self._query(
+            "settlement_date BETWEEN ? AND ?",
+            (_iso_date(from_date), _iso_date(to_date)),
+            limit,
+        )
+
+    @staticmethod
+    def _time_range(where, params, since, until):
+        if since is not None:
+            where.append("transaction_time >= ?")
+            params.append(_epoch(since))
+        if until is not None:
+            where.append("transaction_time <= ?")
+            params.append(_epoch(until))
+        if not where:
+            where.append("1")
+
+    def __len__(self):
+        self.flush()
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM %s" % self.table
+        ).fetchone()[0]
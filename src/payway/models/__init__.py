@@ -2,3 +2,4 @@ from .bank import *
 from .merchant import *
 from .payment import *
 from .customer import *
+from .transaction_batch import *
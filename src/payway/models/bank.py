@@ -5,6 +5,8 @@ class BankAccount(object):
     account_number: str: bank account number
     """
 
+    __slots__ = ("account_name", "bsb", "account_number")
+
     def __init__(self, account_name, bsb, account_number):
         self.account_name = account_name
         self.bsb = bsb
@@ -1,7 +1,31 @@
 from src.payway.models.payment import PaymentSetup
 
 
+CUSTOM_FIELDS = ("customField1", "customField2", "customField3", "customField4")
+
+
 class PayWayCustomer(object):
+    __slots__ = (
+        "custom_id",
+        "customer_name",
+        "email_address",
+        "send_email_receipts",
+        "phone_number",
+        "street",
+        "street2",
+        "city_name",
+        "state",
+        "postal_code",
+        "token",
+        "customer_number",
+        "payment_setup",
+        "notes",
+        "customField1",
+        "customField2",
+        "customField3",
+        "customField4",
+    )
+
     def __init__(
         self,
         custom_id=None,
@@ -89,10 +113,12 @@ class PayWayCustomer(object):
                 response.get("paymentSetup")
             )
 
-        if response.get("customFields") is not None:
-            custom_fields = response.get("customFields")
-            for k, v in custom_fields.items():
-                setattr(customer, k, v)
+        custom_fields = response.get("customFields")
+        if custom_fields is not None:
+            # PayWay only defines customField1 to customField4, ignore anything else
+            for name in CUSTOM_FIELDS:
+                if name in custom_fields:
+                    setattr(customer, name, custom_fields[name])
 
         if response.get("notes") is not None:
             customer.notes = response["notes"]
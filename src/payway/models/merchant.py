@@ -9,12 +9,22 @@ class Merchant(object):
                             account
     """
 
-    merchant_id = None
-    merchant_name = None
-    settlement_bsb = None
-    settlement_account_number = None
-    surcharge_bsb = None
-    surcharge_account_number = None
+    __slots__ = (
+        "merchant_id",
+        "merchant_name",
+        "settlement_bsb",
+        "settlement_account_number",
+        "surcharge_bsb",
+        "surcharge_account_number",
+    )
+
+    def __init__(self):
+        self.merchant_id = None
+        self.merchant_name = None
+        self.settlement_bsb = None
+        self.settlement_account_number = None
+        self.surcharge_bsb = None
+        self.surcharge_account_number = None
 
     def to_dict(self):
         return {
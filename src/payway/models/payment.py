@@ -1,11 +1,15 @@
+from src.payway import codec
 from src.payway.models.merchant import Merchant
 
 
 class TokenResponse(object):
-    token = None
-    payment_method = None
-    card = None
-    bank_account = None
+    __slots__ = ("token", "payment_method", "card", "bank_account")
+
+    def __init__(self):
+        self.token = None
+        self.payment_method = None
+        self.card = None
+        self.bank_account = None
 
     @staticmethod
     def from_dict(response):
@@ -22,10 +26,13 @@ class TokenResponse(object):
 
 
 class PaymentSetup(object):
-    payment_method = None
-    stopped = None
-    credit_card = None
-    merchant = None
+    __slots__ = ("payment_method", "stopped", "credit_card", "merchant")
+
+    def __init__(self):
+        self.payment_method = None
+        self.stopped = None
+        self.credit_card = None
+        self.merchant = None
 
     @staticmethod
     def from_dict(response):
@@ -43,6 +50,14 @@ class PaymentSetup(object):
 
 
 class PayWayCard(object):
+    __slots__ = (
+        "card_number",
+        "cvn",
+        "card_holder_name",
+        "expiry_date_month",
+        "expiry_date_year",
+    )
+
     def __init__(
         self,
         card_number=None,
@@ -93,6 +108,18 @@ class PayWayPayment(object):
     merchant_id: 	This merchant will be used for processing.
     """
 
+    __slots__ = (
+        "transaction_type",
+        "customer_number",
+        "amount",
+        "currency",
+        "order_number",
+        "ip_address",
+        "parent_transaction_id",
+        "token",
+        "merchant_id",
+    )
+
     def __init__(
         self,
         transaction_type,
@@ -134,43 +161,153 @@ class PayWayPayment(object):
         return payment
 
 
+class PayWaySchedule(object):
+    """
+    frequency:	weekly, fortnightly, monthly, quarterly, six-monthly or yearly
+    next_payment_date:	date (or str as "12 Jun 2024") of the next regular payment
+    regular_principal_amount:	Amount of each regular payment, before any surcharge.
+    next_principal_amount:	Amount of the next payment, if different to the regular amount.
+    number_of_payments_remaining:	Payments left before the schedule stops, None for no end.
+    final_principal_amount:	Amount of the last payment, if different to the regular amount.
+    """
+
+    __slots__ = (
+        "frequency",
+        "next_payment_date",
+        "regular_principal_amount",
+        "next_principal_amount",
+        "number_of_payments_remaining",
+        "final_principal_amount",
+    )
+
+    def __init__(
+        self,
+        frequency=None,
+        next_payment_date=None,
+        regular_principal_amount=None,
+        next_principal_amount=None,
+        number_of_payments_remaining=None,
+        final_principal_amount=None,
+    ):
+        self.frequency = frequency
+        self.next_payment_date = next_payment_date
+        self.regular_principal_amount = regular_principal_amount
+        self.next_principal_amount = next_principal_amount
+        self.number_of_payments_remaining = number_of_payments_remaining
+        self.final_principal_amount = final_principal_amount
+
+    def to_dict(self):
+        next_payment_date = self.next_payment_date
+        if hasattr(next_payment_date, "strftime"):
+            next_payment_date = next_payment_date.strftime("%d %b %Y")
+        schedule = {
+            "frequency": self.frequency,
+            "nextPaymentDate": next_payment_date,
+            "regularPrincipalAmount": self.regular_principal_amount,
+        }
+        # optional fields are left out so PayWay applies its defaults
+        if self.next_principal_amount is not None:
+            schedule["nextPrincipalAmount"] = self.next_principal_amount
+        if self.number_of_payments_remaining is not None:
+            schedule["numberOfPaymentsRemaining"] = self.number_of_payments_remaining
+        if self.final_principal_amount is not None:
+            schedule["finalPrincipalAmount"] = self.final_principal_amount
+        return schedule
+
+    @staticmethod
+    def from_dict(response):
+        """
+        :param: response: dict PayWay response dictionary
+        """
+        schedule = PayWaySchedule()
+        schedule.frequency = response.get("frequency")
+        schedule.next_payment_date = response.get("nextPaymentDate")
+        schedule.regular_principal_amount = response.get("regularPrincipalAmount")
+        schedule.next_principal_amount = response.get("nextPrincipalAmount")
+        schedule.number_of_payments_remaining = response.get(
+            "numberOfPaymentsRemaining"
+        )
+        schedule.final_principal_amount = response.get("finalPrincipalAmount")
+        return schedule
+
+
 class PayWayTransaction(object):
-    transaction_id = None
-    receipt_number = None
-    status = None
-    response_code = None
-    response_text = None
-    transaction_type = None
-    customer_number = None
-    customer_name = None
-    customer_email = None
-    bpay_ref = None
-    order_number = None
-    currency = None
-    principal_amount = None
-    surcharge_amount = None
-    payment_amount = None
-    payment_method = None
-    declined_date = None
-    card = None
-    merchant = None
-    virtual_account = None
-    australia_post = None
-    bpay = None
-    your_bank_account = None
-    customer_paypal_account = None
-    your_paypal_account = None
-    transaction_date_time = None
-    user = None
-    settlement_date = None
-    parent_transaction = None
-    ip_address = None
-    fraud_result = None
-    ip_country = None
-    card_country = None
-    custom_fields = None
-    is_voidable = None
-    is_refundable = None
+    __slots__ = (
+        "transaction_id",
+        "receipt_number",
+        "status",
+        "response_code",
+        "response_text",
+        "transaction_type",
+        "customer_number",
+        "customer_name",
+        "customer_email",
+        "bpay_ref",
+        "order_number",
+        "currency",
+        "principal_amount",
+        "surcharge_amount",
+        "payment_amount",
+        "payment_method",
+        "declined_date",
+        "card",
+        "merchant",
+        "virtual_account",
+        "australia_post",
+        "bpay",
+        "your_bank_account",
+        "customer_paypal_account",
+        "your_paypal_account",
+        "transaction_date_time",
+        "user",
+        "settlement_date",
+        "parent_transaction",
+        "ip_address",
+        "fraud_result",
+        "ip_country",
+        "card_country",
+        "custom_fields",
+        "is_voidable",
+        "is_refundable",
+    )
+
+    def __init__(self):
+        self.transaction_id = None
+        self.receipt_number = None
+        self.status = None
+        self.response_code = None
+        self.response_text = None
+        self.transaction_type = None
+        self.customer_number = None
+        self.customer_name = None
+        self.customer_email = None
+        self.bpay_ref = None
+        self.order_number = None
+        self.currency = None
+        self.principal_amount = None
+        self.surcharge_amount = None
+        self.payment_amount = None
+        self.payment_method = None
+        self.declined_date = None
+        self.card = None
+        self.merchant = None
+        self.virtual_account = None
+        self.australia_post = None
+        self.bpay = None
+        self.your_bank_account = None
+        self.customer_paypal_account = None
+        self.your_paypal_account = None
+        self.transaction_date_time = None
+        self.user = None
+        self.settlement_date = None
+        self.parent_transaction = None
+        self.ip_address = None
+        self.fraud_result = None
+        self.ip_country = None
+        self.card_country = None
+        self.custom_fields = None
+        self.is_voidable = None
+        self.is_refundable = None
 
     def to_dict(self):
         return {
@@ -225,6 +362,7 @@ class PayWayTransaction(object):
         transaction.customer_number = response.get("customerNumber")
         transaction.customer_name = response.get("customerName")
         transaction.customer_email = response.get("customerEmail")
+        transaction.order_number = response.get("orderNumber")
         transaction.currency = response.get("currency")
         transaction.principal_amount = response.get("principalAmount")
         transaction.surcharge_amount = response.get("surchargeAmount")
@@ -256,3 +394,158 @@ class PayWayTransaction(object):
         transaction.is_voidable = response.get("isVoidable")
         transaction.is_refundable = response.get("isRefundable")
         return transaction
+
+
+class _LazyField(object):
+    """
+    Reads one LazyPayWayTransaction field from the raw response on access.
+    Plain fields are looked up in the response every time, which is as cheap as a dict lookup.
+    Nested objects (card, merchant) are built on first access and kept in the inherited slot.
+    """
+
+    __slots__ = ("key", "decode", "slot")
+
+    def __init__(self, key, decode, slot):
+        self.key = key
+        self.decode = decode
+        self.slot = slot
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        if self.decode is None:
+            return obj._response().get(self.key)
+        try:
+            return self.slot.__get__(obj, owner)
+        except AttributeError:
+            value = obj._response().get(self.key)
+            if value is not None:
+                value = self.decode(value)
+            self.slot.__set__(obj, value)
+            return value
+
+    def __set__(self, obj, value):
+        if self.decode is None:
+            obj._writable_response()[self.key] = value
+        else:
+            self.slot.__set__(obj, value)
+
+
+class LazyPayWayTransaction(PayWayTransaction):
+    """
+    PayWayTransaction backed by the raw PayWay response (a dict or the undecoded JSON bytes).
+    Nothing is copied up front: the JSON is decoded on the first field access, and the nested
+    card and merchant objects are only built when they are read. Callers that look at a couple
+    of fields, such as transaction_id and status, skip most of the parsing and allocation.
+    """
+
+    __slots__ = ("_raw", "_owned")
+
+    def __init__(self, raw):
+        """
+        :param raw: dict or bytes  PayWay transaction response
+        """
+        self._raw = raw
+        # a dict handed in may be shared (e.g. with a cache), so it is copied before any write
+        self._owned = not isinstance(raw, dict)
+
+    def _response(self):
+        raw = self._raw
+        if not isinstance(raw, dict):
+            raw = self._raw = codec.loads(raw)
+        return raw
+
+    def _writable_response(self):
+        if not self._owned:
+            self._raw = dict(self._response())
+            self._owned = True
+        return self._response()
+
+    @staticmethod
+    def from_dict(response):
+        """
+        :param: response: dict PayWay response dictionary
+        """
+        return LazyPayWayTransaction(response)
+
+
+# PayWayTransaction attribute -> (PayWay response field, decoder), mirroring from_dict.
+# Attributes from_dict does not read are kept under their own name, which PayWay never sends.
+_LAZY_TRANSACTION_FIELDS = {
+    "transaction_id": ("transactionId", None),
+    "receipt_number": ("receiptNumber", None),
+    "status": ("status", None),
+    "response_code": ("responseCode", None),
+    "response_text": ("responseText", None),
+    "transaction_type": ("transactionType", None),
+    "customer_number": ("customerNumber", None),
+    "customer_name": ("customerName", None),
+    "customer_email": ("customerEmail", None),
+    "bpay_ref": (None, None),
+    "order_number": ("orderNumber", None),
+    "currency": ("currency", None),
+    "principal_amount": ("principalAmount", None),
+    "surcharge_amount": ("surchargeAmount", None),
+    "payment_amount": ("paymentAmount", None),
+    "payment_method": ("paymentMethod", None),
+    "declined_date": ("declinedDate", None),
+    "card": ("creditCard", PayWayCard.from_dict),
+    "merchant": ("merchant", Merchant.from_dict),
+    "virtual_account": ("virtualAccount", None),
+    "australia_post": ("bpaustraliaPostay", None),
+    "bpay": ("bpay", None),
+    "your_bank_account": ("yourBankAccount", None),
+    "customer_paypal_account": ("customerPayPalAccount", None),
+    "your_paypal_account": ("yourPayPalAccount", None),
+    "transaction_date_time": ("transactionDateTime", None),
+    "user": ("user", None),
+    "settlement_date": ("settlementDate", None),
+    "parent_transaction": ("parentTransaction", None),
+    "ip_address": ("customerIpAddress", None),
+    "fraud_result": ("fraudResult", None),
+    "ip_country": ("customerIpCountry", None),
+    "card_country": ("cardCountry", None),
+    "custom_fields": ("customFields", None),
+    "is_voidable": ("isVoidable", None),
+    "is_refundable": ("isRefundable", None),
+}
+
+for _name, (_key, _decode) in _LAZY_TRANSACTION_FIELDS.items():
+    setattr(
+        LazyPayWayTransaction,
+        _name,
+        _LazyField(_key or _name, _decode, PayWayTransaction.__dict__[_name]),
+    )
+
+
+class TransactionSearchPage(object):
+    """
+    One page of a PayWay transaction search. PayWay links each page to the next one.
+    """
+
+    __slots__ = ("transactions", "next_page")
+
+    # model the transactions of the page are parsed into
+    transaction_class = PayWayTransaction
+
+    def __init__(self, transactions=None, next_page=None):
+        self.transactions = transactions or []
+        self.next_page = next_page
+
+    @classmethod
+    def from_dict(cls, response):
+        """
+        :param: response: dict PayWay response dictionary
+        """
+        from_dict = cls.transaction_class.from_dict
+        page = cls([from_dict(data) for data in response.get("data") or ()])
+        for link in response.get("links") or ():
+            if link.get("rel") == "next":
+                page.next_page = link.get("href")
+        return page
+
+
+class LazyTransactionSearchPage(TransactionSearchPage):
+    __slots__ = ()
+
+    transaction_class = LazyPayWayTransaction
@@ -0,0 +1,243 @@
+from array import array
+from collections import Counter
+from itertools import islice
+from operator import methodcaller
+
+from src.payway.models.payment import PayWayTransaction
+
+__all__ = ["TransactionBatch", "to_cents"]
+
+# PayWayTransaction attribute -> PayWay response field
+AMOUNT_COLUMNS = {
+    "principal_amount": "principalAmount",
+    "surcharge_amount": "surchargeAmount",
+    "payment_amount": "paymentAmount",
+}
+CATEGORY_COLUMNS = {
+    "status": "status",
+    "response_code": "responseCode",
+    "transaction_type": "transactionType",
+    "currency": "currency",
+    "payment_method": "paymentMethod",
+    "card_country": "cardCountry",
+    "settlement_date": "settlementDate",
+}
+TEXT_COLUMNS = {
+    "transaction_id": "transactionId",
+    "receipt_number": "receiptNumber",
+    "customer_number": "customerNumber",
+    "order_number": "orderNumber",
+    "transaction_date_time": "transactionDateTime",
+}
+
+EXTEND_CHUNK_SIZE = 65536
+
+
+def to_cents(amount):
+    """
+    :param amount: float or str  PayWay amount in dollars
+    :return: int  amount in cents, 0 when missing
+    """
+    if amount is None or amount == "":
+        return 0
+    # round() of a float already returns an int
+    return round(float(amount) * 100)
+
+
+class _CategoryColumn(object):
+    """
+    Dictionary encoded column: one small integer code per row plus the distinct values
+    """
+
+    __slots__ = ("codes", "values", "_lookup")
+
+    def __init__(self):
+        self.codes = array("I")
+        self.values = []
+        self._lookup = {}
+
+    def append(self, value):
+        code = self._lookup.get(value)
+        if code is None:
+            code = self._lookup[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+    def extend(self, values):
+        values = list(values)
+        lookup = self._lookup
+        for value in set(values):
+            if value not in lookup:
+                lookup[value] = len(self.values)
+                self.values.append(value)
+        # second pass runs entirely in C
+        self.codes.extend(map(lookup.__getitem__, values))
+
+    def __getitem__(self, index):
+        return self.values[self.codes[index]]
+
+    def codes_for(self, values):
+        return {self._lookup[value] for value in values if value in self._lookup}
+
+    def take(self, indices):
+        column = _CategoryColumn()
+        column.values = self.values
+        column._lookup = self._lookup
+        column.codes = array("I", map(self.codes.__getitem__, indices))
+        return column
+
+
+class TransactionBatch(object):
+    """
+    Column oriented container for large sets of PayWay transactions.
+
+    Amounts are kept as integer cents in compact arrays, low cardinality fields (status,
+    response code, card country, ...) are dictionary encoded, so totals, counts and group-bys
+    run over flat arrays instead of millions of PayWayTransaction objects. Rows are only
+    turned back into PayWayTransaction objects on demand.
+
+    Amount columns: principal_amount, surcharge_amount, payment_amount
+    Category columns: status, response_code, transaction_type, currency, payment_method,
+                      card_country, settlement_date
+    Text columns: transaction_id, receipt_number, customer_number, order_number,
+                  transaction_date_time
+    """
+
+    def __init__(self):
+        self.amounts = {name: array("q") for name in AMOUNT_COLUMNS}
+        self.categories = {name: _CategoryColumn() for name in CATEGORY_COLUMNS}
+        self.texts = {name: [] for name in TEXT_COLUMNS}
+
+    @staticmethod
+    def from_dicts(responses):
+        """
+        Build a batch straight from PayWay transaction response dictionaries
+        :param responses: iterable of dict  consumed once, e.g. a generator over a file
+        """
+        batch = TransactionBatch()
+        batch.extend(responses)
+        return batch
+
+    def extend(self, responses):
+        """
+        :param responses: iterable of dict  PayWay transaction response dictionaries
+        """
+        responses = iter(responses)
+        while True:
+            # fill the columns one chunk at a time so each column is built by a single
+            # map() over the chunk rather than a Python loop over every field of every row
+            chunk = list(islice(responses, EXTEND_CHUNK_SIZE))
+            if not chunk:
+                return
+            for name, key in AMOUNT_COLUMNS.items():
+                self.amounts[name].extend(map(to_cents, map(methodcaller("get", key), chunk)))
+            for name, key in CATEGORY_COLUMNS.items():
+                self.categories[name].extend(map(methodcaller("get", key), chunk))
+            for name, key in TEXT_COLUMNS.items():
+                self.texts[name].extend(map(methodcaller("get", key), chunk))
+
+    def __len__(self):
+        return len(self.texts["transaction_id"])
+
+    def column(self, name):
+        """
+        All values of a column, amounts in cents
+        :param name: str  PayWayTransaction attribute name
+        """
+        if name in self.amounts:
+            return self.amounts[name]
+        if name in self.categories:
+            category = self.categories[name]
+            return [category.values[code] for code in category.codes]
+        return self.texts[name]
+
+    def total(self, amount="principal_amount"):
+        """
+        :param amount: str  amount column to add up
+        :return: int  total in cents
+        """
+        return sum(self.amounts[amount])
+
+    def count_by(self, column):
+        """
+        Number of transactions per value of a category column
+        :param column: str  e.g. "status", "response_code" or "card_country"
+        :return: dict  value -> count
+        """
+        category = self.categories[column]
+        return {
+            category.values[code]: count
+            for code, count in Counter(category.codes).items()
+        }
+
+    def sum_by(self, column, amount="principal_amount"):
+        """
+        Total amount per value of a category column
+        :param column: str  category column to group by
+        :param amount: str  amount column to add up
+        :return: dict  value -> total in cents
+        """
+        category = self.categories[column]
+        sums = [0] * len(category.values)
+        for code, cents in zip(category.codes, self.amounts[amount]):
+            sums[code] += cents
+        return {category.values[code]: sums[code] for code in Counter(category.codes)}
+
+    def filter(self, **conditions):
+        """
+        Transactions whose category columns match all conditions, as a new batch.
+        Each condition is a single value or a collection of accepted values:
+
+            batch.filter(status="approved", card_country=["AUS", "NZL"])
+        """
+        selected = None
+        for name, accepted in conditions.items():
+            if isinstance(accepted, (str, bytes)) or not hasattr(accepted, "__iter__"):
+                accepted = [accepted]
+            category = self.categories[name]
+            codes = category.codes_for(accepted)
+            if selected is None:
+                selected = [i for i, code in enumerate(category.codes) if code in codes]
+            else:
+                category_codes = category.codes
+                selected = [i for i in selected if category_codes[i] in codes]
+        if selected is None:
+            selected = range(len(self))
+        return self.take(selected)
+
+    def take(self, indices):
+        """
+        :param indices: sequence of int  row positions to keep
+        :return: TransactionBatch  with only those rows
+        """
+        batch = TransactionBatch()
+        batch.amounts = {
+            name: array("q", map(values.__getitem__, indices))
+            for name, values in self.amounts.items()
+        }
+        batch.categories = {
+            name: category.take(indices) for name, category in self.categories.items()
+        }
+        batch.texts = {
+            name: list(map(values.__getitem__, indices))
+            for name, values in self.texts.items()
+        }
+        return batch
+
+    def row(self, index):
+        """
+        Build a PayWayTransaction for one row. Only the columns held by the batch are set.
+        :param index: int  row position
+        """
+        transaction = PayWayTransaction()
+        for name, values in self.amounts.items():
+            setattr(transaction, name, values[index] / 100)
+        for name, category in self.categories.items():
+            setattr(transaction, name, category[index])
+        for name, values in self.texts.items():
+            setattr(transaction, name, values[index])
+        return transaction
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.row(index)
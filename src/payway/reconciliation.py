@@ -0,0 +1,424 @@
+"""
+Reconciles internal orders against PayWay transactions in one streaming pass.
+
+    reconciler = Reconciler(memory_rows=2000000)
+    for result in reconciler.reconcile(orders, payway_client.search_settlement_transactions(day)):
+        if result.kind != MATCHED:
+            ...
+    print(reconciler.counts)
+"""
+import marshal
+import os
+import tempfile
+from collections import Counter
+from itertools import groupby
+
+from .consts import APPROVED_TRANSACTION_STATUS
+
+
+MATCHED = "matched"
+# the order has no PayWay transaction
+MISSING_TRANSACTION = "missing_transaction"
+# the PayWay transaction has no order
+MISSING_ORDER = "missing_order"
+AMOUNT_MISMATCH = "amount_mismatch"
+STATUS_MISMATCH = "status_mismatch"
+# further transactions for an order that was already matched, e.g. a declined attempt
+DUPLICATE_TRANSACTION = "duplicate_transaction"
+
+MATCH_KEYS = ("order_number", "transaction_id")
+
+DEFAULT_MEMORY_ROWS = 1000000
+DEFAULT_PARTITIONS = 64
+# re-partitioning a partition that is still too large stops at this depth, it can only
+# be made of duplicates of a few keys by then
+MAX_PARTITION_DEPTH = 4
+
+# row layout shared by orders and transactions: compact tuples that marshal can spill
+_KEY, _TRANSACTION_ID, _ORDER_NUMBER, _AMOUNT, _STATUS = range(5)
+
+
+class Order(object):
+    """
+    An internal order to reconcile. Any object with these attributes, or a dict with these
+    keys, can be passed instead.
+
+    order_number: str: the orderNumber sent to PayWay with the payment
+    amount: str, Decimal or float: expected principal amount
+    status: str: expected transaction status, None to not check it
+    transaction_id: str: PayWay transaction ID, if known
+    """
+
+    __slots__ = ("order_number", "amount", "status", "transaction_id")
+
+    def __init__(
+        self,
+        order_number,
+        amount,
+        status=APPROVED_TRANSACTION_STATUS,
+        transaction_id=None,
+    ):
+        self.order_number = order_number
+        self.amount = amount
+        self.status = status
+        self.transaction_id = transaction_id
+
+
+class ReconciliationResult(object):
+    """
+    Outcome for one order and/or transaction. Only the reconciled fields are kept, so
+    results stay small however many are produced.
+
+    kind: str: MATCHED, MISSING_TRANSACTION, MISSING_ORDER, AMOUNT_MISMATCH,
+               STATUS_MISMATCH or DUPLICATE_TRANSACTION
+    key: str: value the order and transaction were matched on
+    order_amount, transaction_amount: int: amounts in cents, None when absent
+    order_status, transaction_status: str: statuses, None when absent
+    """
+
+    __slots__ = (
+        "kind",
+        "key",
+        "order_number",
+        "transaction_id",
+        "order_amount",
+        "transaction_amount",
+        "order_status",
+        "transaction_status",
+    )
+
+    def __init__(self, kind, order=None, transaction=None):
+        """
+        :param order: tuple  order row
+        :param transaction: tuple  transaction row
+        """
+        row = order or transaction
+        self.kind = kind
+        self.key = row[_KEY]
+        self.order_number = row[_ORDER_NUMBER]
+        self.transaction_id = (transaction or order)[_TRANSACTION_ID]
+        self.order_amount = order[_AMOUNT] if order else None
+        self.transaction_amount = transaction[_AMOUNT] if transaction else None
+        self.order_status = order[_STATUS] if order else None
+        self.transaction_status = transaction[_STATUS] if transaction else None
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _cents(amount):
+    if amount is None or amount == "":
+        return None
+    return int(round(float(amount) * 100))
+
+
+def _field(item, name):
+    if isinstance(item, dict):
+        return item.get(name)
+    return getattr(item, name, None)
+
+
+class Reconciler(object):
+    """
+    Matches orders to PayWay transactions by order number (or transaction ID) and streams
+    one ReconciliationResult per order and per unmatched transaction.
+
+    Unsorted sources are joined with a hash join: transactions are held in memory as
+    compact rows while orders stream past them. Once more than `memory_rows` transactions
+    are held, both sides are spilled to `partitions` files on disk by hash of the key, and
+    the partitions are joined one at a time, so memory stays bounded whatever the size of
+    the sources. Sources already sorted by the key (presorted=True) are merged instead,
+    which holds only the rows of one key at a time.
+
+    An amount mismatch is reported ahead of a status mismatch. Amounts are compared in
+    cents against the transaction's principal amount.
+
+    key: str: "order_number" or "transaction_id"
+    memory_rows: int: transactions held in memory before spilling to disk
+    partitions: int: spill files per side
+    spill_dir: str: directory for spill files, the system temp directory by default
+    presorted: bool: both sources are sorted by key, ascending
+    """
+
+    def __init__(
+        self,
+        key="order_number",
+        memory_rows=DEFAULT_MEMORY_ROWS,
+        partitions=DEFAULT_PARTITIONS,
+        spill_dir=None,
+        presorted=False,
+    ):
+        if key not in MATCH_KEYS:
+            raise ValueError("key must be one of %s" % (MATCH_KEYS,))
+        self.key = key
+        self.memory_rows = memory_rows
+        self.partitions = partitions
+        self.spill_dir = spill_dir
+        self.presorted = presorted
+        self.counts = Counter()
+        self.spilled_rows = 0
+
+    def reconcile(self, orders, transactions):
+        """
+        :param orders: iterable of Order (or objects/dicts with the same fields)
+        :param transactions: iterable of PayWayTransaction, e.g. a transaction search
+        :return: generator of ReconciliationResult
+        """
+        order_rows = (self._order_row(order) for order in orders)
+        transaction_rows = (
+            self._transaction_row(transaction) for transaction in transactions
+        )
+        if self.presorted:
+            results = self._merge_join(order_rows, transaction_rows)
+        else:
+            results = self._hash_join(order_rows, transaction_rows, 0)
+        for result in results:
+            self.counts[result.kind] += 1
+            yield result
+
+    def _order_row(self, order):
+        transaction_id = _field(order, "transaction_id")
+        if transaction_id is not None:
+            transaction_id = str(transaction_id)
+        order_number = _field(order, "order_number")
+        return (
+            (order_number if self.key == "order_number" else transaction_id) or None,
+            transaction_id,
+            order_number,
+            _cents(_field(order, "amount")),
+            _field(order, "status"),
+        )
+
+    def _transaction_row(self, transaction):
+        transaction_id = transaction.transaction_id
+        if transaction_id is not None:
+            transaction_id = str(transaction_id)
+        order_number = transaction.order_number
+        return (
+            (order_number if self.key == "order_number" else transaction_id) or None,
+            transaction_id,
+            order_number,
+            _cents(transaction.principal_amount),
+            transaction.status,
+        )
+
+    # matching
+
+    @staticmethod
+    def _compare(order, transaction):
+        if order[_AMOUNT] is not None and transaction[_AMOUNT] != order[_AMOUNT]:
+            return ReconciliationResult(AMOUNT_MISMATCH, order, transaction)
+        if order[_STATUS] is not None and transaction[_STATUS] != order[_STATUS]:
+            return ReconciliationResult(STATUS_MISMATCH, order, transaction)
+        return ReconciliationResult(MATCHED, order, transaction)
+
+    @staticmethod
+    def _best(order, candidates):
+        """
+        :return: int  index of the transaction that fits the order best
+        """
+        fallback = None
+        for index, transaction in enumerate(candidates):
+            if order[_STATUS] is None or transaction[_STATUS] == order[_STATUS]:
+                if order[_AMOUNT] is None or transaction[_AMOUNT] == order[_AMOUNT]:
+                    return index
+                if fallback is None:
+                    fallback = index
+        return fallback or 0
+
+    def _match_group(self, orders, transactions):
+        """
+        Match the orders and transactions sharing one key
+        """
+        transactions = list(transactions)
+        matched = False
+        for order in orders:
+            if not transactions:
+                yield ReconciliationResult(MISSING_TRANSACTION, order=order)
+                continue
+            transaction = transactions.pop(self._best(order, transactions))
+            matched = True
+            yield self._compare(order, transaction)
+        for transaction in transactions:
+            yield ReconciliationResult(
+                DUPLICATE_TRANSACTION if matched else MISSING_ORDER,
+                transaction=transaction,
+            )
+
+    # sorted sources
+
+    def _merge_join(self, order_rows, transaction_rows):
+        order_groups = self._groups(order_rows, "order")
+        transaction_groups = self._groups(transaction_rows, "transaction")
+        order_key, orders = next(order_groups, (None, None))
+        transaction_key, transactions = next(transaction_groups, (None, None))
+        while orders is not None or transactions is not None:
+            if orders is not None and order_key is None:
+                # nothing to match on
+                results = self._match_group(orders, ())
+                order_key, orders = next(order_groups, (None, None))
+            elif transactions is not None and transaction_key is None:
+                results = self._match_group((), transactions)
+                transaction_key, transactions = next(transaction_groups, (None, None))
+            elif transactions is None or (
+                orders is not None and order_key < transaction_key
+            ):
+                results = self._match_group(orders, ())
+                order_key, orders = next(order_groups, (None, None))
+            elif orders is None or transaction_key < order_key:
+                results = self._match_group((), transactions)
+                transaction_key, transactions = next(transaction_groups, (None, None))
+            else:
+                results = self._match_group(orders, transactions)
+                order_key, orders = next(order_groups, (None, None))
+                transaction_key, transactions = next(transaction_groups, (None, None))
+            for result in results:
+                yield result
+
+    def _groups(self, rows, side):
+        """
+        :return: generator of (key, list of rows) in key order, rows without a key are
+                 yielded one by one under None
+        """
+        previous = None
+        for key, group in groupby(rows, key=lambda row: row[_KEY]):
+            group = list(group)
+            if key is None:
+                for row in group:
+                    yield None, [row]
+                continue
+            if previous is not None and key < previous:
+                raise ValueError(
+                    "%ss are not sorted by %s: %r after %r"
+                    % (side, self.key, key, previous)
+                )
+            previous = key
+            yield key, group
+
+    # unsorted sources
+
+    def _hash_join(self, order_rows, transaction_rows, depth):
+        build = {}
+        held = 0
+        unkeyed = []
+        transaction_rows = iter(transaction_rows)
+        for transaction in transaction_rows:
+            key = transaction[_KEY]
+            if key is None:
+                unkeyed.append(transaction)
+                continue
+            candidates = build.get(key)
+            if candidates is None:
+                build[key] = [transaction]
+            else:
+                candidates.append(transaction)
+            held += 1
+            if held > self.memory_rows and depth < MAX_PARTITION_DEPTH:
+                for result in self._spill_join(
+                    order_rows, build, transaction_rows, depth
+                ):
+                    yield result
+                for transaction in unkeyed:
+                    yield ReconciliationResult(MISSING_ORDER, transaction=transaction)
+                return
+
+        for transaction in unkeyed:
+            yield ReconciliationResult(MISSING_ORDER, transaction=transaction)
+        # transactions whose key was matched, kept until the end only if they have leftovers
+        matched = set()
+        for order in order_rows:
+            key = order[_KEY]
+            candidates = build.get(key) if key is not None else None
+            if not candidates:
+                yield ReconciliationResult(MISSING_TRANSACTION, order=order)
+                continue
+            transaction = candidates.pop(self._best(order, candidates))
+            if candidates:
+                matched.add(key)
+            else:
+                del build[key]
+            yield self._compare(order, transaction)
+        for key, candidates in build.items():
+            kind = DUPLICATE_TRANSACTION if key in matched else MISSING_ORDER
+            for transaction in candidates:
+                yield ReconciliationResult(kind, transaction=transaction)
+
+    def _spill_join(self, order_rows, build, transaction_rows, depth):
+        """
+        Partition both sides to disk by hash of the key, then join partition by partition
+        """
+        with tempfile.TemporaryDirectory(
+            prefix="payway-reconcile-", dir=self.spill_dir
+        ) as directory:
+            transaction_files = _Partitions(directory, "t", self.partitions, depth)
+            for candidates in build.values():
+                for transaction in candidates:
+                    transaction_files.write(transaction)
+            build.clear()
+            for transaction in transaction_rows:
+                if transaction[_KEY] is None:
+                    yield ReconciliationResult(MISSING_ORDER, transaction=transaction)
+                else:
+                    transaction_files.write(transaction)
+            order_files = _Partitions(directory, "o", self.partitions, depth)
+            for order in order_rows:
+                if order[_KEY] is None:
+                    yield ReconciliationResult(MISSING_TRANSACTION, order=order)
+                else:
+                    order_files.write(order)
+            transaction_files.close()
+            order_files.close()
+            self.spilled_rows += transaction_files.rows + order_files.rows
+            for partition in range(self.partitions):
+                for result in self._hash_join(
+                    order_files.read(partition),
+                    transaction_files.read(partition),
+                    depth + 1,
+                ):
+                    yield result
+                order_files.remove(partition)
+                transaction_files.remove(partition)
+
+
+class _Partitions(object):
+    """
+    Rows spread over spill files by hash of their key. The hash is salted with the
+    partitioning depth, so a partition split again spreads over all new files.
+    """
+
+    def __init__(self, directory, side, count, depth):
+        self.count = count
+        self.depth = depth
+        self.rows = 0
+        self.paths = [
+            os.path.join(directory, "%s%d-%d-%d" % (side, depth, id(self), i))
+            for i in range(count)
+        ]
+        self.files = [open(path, "wb") for path in self.paths]
+
+    def write(self, row):
+        marshal.dump(row, self.files[hash((self.depth, row[_KEY])) % self.count])
+        self.rows += 1
+
+    def close(self):
+        for f in self.files:
+            f.close()
+
+    def read(self, partition):
+        with open(self.paths[partition], "rb") as f:
+            while True:
+                try:
+                    yield marshal.load(f)
+                except EOFError:
+                    return
+
+    def remove(self, partition):
+        os.remove(self.paths[partition])
+
+
+def reconcile(orders, transactions, **kwargs):
+    """
+    :param kwargs: see Reconciler
+    :return: generator of ReconciliationResult
+    """
+    return Reconciler(**kwargs).reconcile(orders, transactions)
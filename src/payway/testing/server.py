@@ -0,0 +1,719 @@
+"""
+Local stand-in for the PayWay REST API, for load and performance testing without PayWay
+credentials or network access.
+
+    python -m src.payway.testing.server --port 8080 --latency 0.05 --throttle-rate 0.02
+
+or in-process:
+
+    with FakePayWayServer(profile=ServerProfile(latency=0.02, error_rate=0.01)) as server:
+        payway_client = PayWayClient(api_base_url=server.url, ...)
+"""
+import argparse
+import itertools
+import os
+import random
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from src.payway import codec
+
+
+# principal amounts ending in these cents are declined, like PayWay's test facility
+DECLINED_CENTS = ("51",)
+
+DEFAULT_RETRY_AFTER = 1
+DEFAULT_PAGE_SIZE = 100
+
+# PayWay reports times in Sydney time
+AEST = timezone(timedelta(hours=10), "AEST")
+
+CUSTOM_FIELDS = ("customField1", "customField2", "customField3", "customField4")
+
+
+class ServerProfile(object):
+    """
+    How the fake server misbehaves. Every decision is random per request.
+
+    latency: float: seconds added to every response
+    jitter: float: up to this many extra seconds, uniformly distributed
+    slow_rate: float: share of requests that take slow_latency instead, for tail latency tests
+    slow_latency: float: seconds a slow request takes
+    error_rate: float: share of requests answered with a 500 server error
+    throttle_rate: float: share of requests answered with 429 Too Many Requests
+    retry_after: int: Retry-After seconds sent with a 429, None to leave it out
+    seed: int: makes the random decisions repeatable
+    """
+
+    def __init__(
+        self,
+        latency=0.0,
+        jitter=0.0,
+        slow_rate=0.0,
+        slow_latency=1.0,
+        error_rate=0.0,
+        throttle_rate=0.0,
+        retry_after=DEFAULT_RETRY_AFTER,
+        seed=None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        with self._lock:
+            if self.slow_rate and self._random.random() < self.slow_rate:
+                return self.slow_latency
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def fault(self):
+        """
+        :return: int  500 or 429 to inject, or None to answer normally
+        """
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.error_rate:
+            return 500
+        if roll < self.error_rate + self.throttle_rate:
+            return 429
+        return None
+
+
+class NotFound(Exception):
+    pass
+
+
+class Invalid(Exception):
+    """
+    Request rejected with 422 and PayWay's list of field errors
+    """
+
+    def __init__(self, field_name, message, field_value=None):
+        super(Invalid, self).__init__(message)
+        self.field_name = field_name
+        self.message = message
+        self.field_value = field_value
+
+
+class PayWayState(object):
+    """
+    Customers, tokens, schedules and transactions held by the fake server
+    """
+
+    def __init__(self, merchant_id="TEST"):
+        self.merchant_id = merchant_id
+        self.lock = threading.Lock()
+        self.tokens = {}
+        self.customers = {}
+        self.transactions = {}
+        self.refunded = {}
+        self._customer_numbers = itertools.count(1)
+        self._transaction_ids = itertools.count(1000000000)
+
+    def merchant(self):
+        return {
+            "merchantId": self.merchant_id,
+            "merchantName": "Test Merchant",
+            "settlementBsb": "032-002",
+            "settlementAccountNumber": "000000",
+            "surchargeBsb": "032-002",
+            "surchargeAccountNumber": "000000",
+        }
+
+    # single use tokens
+
+    def create_token(self, form):
+        method = form.get("paymentMethod")
+        if method == "creditCard":
+            number = _required(form, "cardNumber")
+            setup = {
+                "creditCard": {
+                    "cardNumber": "%s...%s" % (number[:6], number[-4:]),
+                    "expiryDateMonth": _required(form, "expiryDateMonth"),
+                    "expiryDateYear": _required(form, "expiryDateYear"),
+                    "cardScheme": "visa" if number.startswith("4") else "mastercard",
+                    "cardType": "credit",
+                    "cardholderName": form.get("cardholderName"),
+                }
+            }
+        elif method == "bankAccount":
+            number = _required(form, "accountNumber")
+            setup = {
+                "bankAccount": {
+                    "bsb": _required(form, "bsb"),
+                    "accountNumber": "...%s" % number[-3:],
+                    "accountName": _required(form, "accountName"),
+                }
+            }
+        else:
+            raise Invalid("paymentMethod", "must be creditCard or bankAccount", method)
+        token = os.urandom(16).hex()
+        setup["paymentMethod"] = method
+        with self.lock:
+            self.tokens[token] = setup
+        return dict(setup, singleUseTokenId=token)
+
+    def _use_token(self, form):
+        token = _required(form, "singleUseTokenId")
+        with self.lock:
+            setup = self.tokens.pop(token, None)
+        if setup is None:
+            raise Invalid("singleUseTokenId", "is not a valid single use token", token)
+        return setup
+
+    # customers
+
+    def save_customer(self, customer_number, form):
+        setup = self._use_token(form)
+        with self.lock:
+            if customer_number is None:
+                customer_number = str(next(self._customer_numbers))
+            elif customer_number in self.customers:
+                raise Invalid("customerNumber", "already exists", customer_number)
+            customer = {
+                "customerNumber": customer_number,
+                "paymentSetup": self._payment_setup(setup),
+                "contact": {
+                    "customerName": form.get("customerName"),
+                    "emailAddress": form.get("emailAddress"),
+                    "sendEmailReceipts": form.get("sendEmailReceipts") == "true",
+                    "phoneNumber": form.get("phoneNumber"),
+                    "address": {
+                        "street1": form.get("street1"),
+                        "street2": form.get("street2"),
+                        "cityName": form.get("cityName"),
+                        "state": form.get("state"),
+                        "postalCode": form.get("postalCode"),
+                    },
+                },
+                "customFields": {
+                    name: form[name]
+                    for name in CUSTOM_FIELDS
+                    if name in form
+                },
+                "notes": {"notes1": form.get("notes")} if form.get("notes") else {},
+            }
+            self.customers[customer_number] = customer
+        return customer
+
+    def customer(self, customer_number):
+        with self.lock:
+            customer = self.customers.get(customer_number)
+        if customer is None:
+            raise NotFound("customerNumber", customer_number)
+        return customer
+
+    def update_payment_setup(self, customer_number, form):
+        customer = self.customer(customer_number)
+        setup = self._use_token(form)
+        with self.lock:
+            customer["paymentSetup"] = self._payment_setup(setup)
+        return customer["paymentSetup"]
+
+    def _payment_setup(self, setup):
+        payment_setup = dict(setup, stopped=False, merchant=self.merchant())
+        return payment_setup
+
+    # regular payment schedules
+
+    def schedule(self, customer_number):
+        schedule = self.customer(customer_number).get("schedule")
+        if schedule is None:
+            raise NotFound("schedule", customer_number)
+        return schedule
+
+    def set_schedule(self, customer_number, form):
+        customer = self.customer(customer_number)
+        frequency = _required(form, "frequency")
+        if frequency not in (
+            "weekly",
+            "fortnightly",
+            "monthly",
+            "quarterly",
+            "six-monthly",
+            "yearly",
+        ):
+            raise Invalid("frequency", "is not a valid frequency", frequency)
+        next_payment_date = _required(form, "nextPaymentDate")
+        regular_amount = _amount(form, "regularPrincipalAmount")
+        schedule = {
+            "frequency": frequency,
+            "nextPaymentDate": next_payment_date,
+            "nextPrincipalAmount": float(
+                form.get("nextPrincipalAmount") or regular_amount
+            ),
+            "regularPrincipalAmount": regular_amount,
+            "numberOfPaymentsRemaining": form.get("numberOfPaymentsRemaining"),
+            "finalPrincipalAmount": form.get("finalPrincipalAmount"),
+        }
+        with self.lock:
+            customer["schedule"] = schedule
+        return schedule
+
+    def stop_schedule(self, customer_number):
+        customer = self.customer(customer_number)
+        with self.lock:
+            if customer.pop("schedule", None) is None:
+                raise NotFound("schedule", customer_number)
+
+    # transactions
+
+    def transaction(self, transaction_id):
+        with self.lock:
+            transaction = self.transactions.get(transaction_id)
+        if transaction is None:
+            raise NotFound("transactionId", transaction_id)
+        return transaction
+
+    def process(self, form):
+        transaction_type = form.get("transactionType")
+        if transaction_type == "payment":
+            return self._payment(form)
+        if transaction_type == "refund":
+            return self._refund(form)
+        raise Invalid("transactionType", "must be payment or refund", transaction_type)
+
+    def _payment(self, form):
+        amount = _amount(form, "principalAmount")
+        if form.get("singleUseTokenId"):
+            setup = self._use_token(form)
+            customer = {"customerNumber": form.get("customerNumber")}
+        else:
+            customer = self.customer(_required(form, "customerNumber"))
+            setup = customer["paymentSetup"]
+        declined = form["principalAmount"].endswith(DECLINED_CENTS)
+        transaction = self._transaction(
+            form,
+            "payment",
+            amount,
+            setup,
+            customer.get("customerNumber"),
+            customer.get("contact", {}).get("customerName"),
+            "declined" if declined else "approved",
+        )
+        return transaction
+
+    def _refund(self, form):
+        parent = self.transaction(_required(form, "parentTransactionId"))
+        amount = _amount(form, "principalAmount")
+        if parent["status"] != "approved" or parent["transactionType"] != "payment":
+            raise Invalid(
+                "parentTransactionId", "cannot be refunded", parent["transactionId"]
+            )
+        with self.lock:
+            refunded = self.refunded.get(parent["transactionId"], 0.0) + amount
+            if refunded > parent["principalAmount"]:
+                raise Invalid(
+                    "principalAmount", "exceeds the refundable amount", amount
+                )
+            self.refunded[parent["transactionId"]] = refunded
+            # PayWay only voids payments that were not refunded
+            parent["isVoidable"] = False
+        transaction = self._transaction(
+            form,
+            "refund",
+            amount,
+            parent,
+            parent["customerNumber"],
+            parent["customerName"],
+            "approved",
+        )
+        transaction["parentTransaction"] = {
+            "transactionId": parent["transactionId"],
+            "receiptNumber": parent["receiptNumber"],
+        }
+        return transaction
+
+    def void(self, transaction_id):
+        transaction = self.transaction(transaction_id)
+        with self.lock:
+            if not transaction["isVoidable"]:
+                raise Invalid("transactionId", "cannot be voided", transaction_id)
+            transaction["status"] = "voided"
+            transaction["isVoidable"] = False
+            transaction["isRefundable"] = False
+        return transaction
+
+    def search(self, kind, form):
+        """
+        :param kind: str  "customer", "settlement" or "receipt"
+        :return: list of transactions matching the search, oldest first
+        """
+        if kind == "customer":
+            customer_number = _required(form, "customerNumber")
+
+            def matches(transaction):
+                return transaction["customerNumber"] == customer_number
+
+        else:
+            from_date = _date(form, "fromDate")
+            to_date = _date(form, "toDate") if form.get("toDate") else from_date
+            field = "settlementDate" if kind == "settlement" else "transactionDateTime"
+
+            def matches(transaction):
+                day = datetime.strptime(transaction[field][:11], "%d %b %Y").date()
+                return from_date <= day <= to_date
+
+        with self.lock:
+            transactions = list(self.transactions.values())
+        return [transaction for transaction in transactions if matches(transaction)]
+
+    def _transaction(
+        self,
+        form,
+        transaction_type,
+        amount,
+        setup,
+        customer_number,
+        customer_name,
+        status,
+    ):
+        now = datetime.now(AEST)
+        approved = status == "approved"
+        with self.lock:
+            transaction_id = next(self._transaction_ids)
+            transaction = {
+                "transactionId": transaction_id,
+                "receiptNumber": str(transaction_id + 1000000000),
+                "status": status,
+                "responseCode": "08" if approved else "05",
+                "responseText": (
+                    "Honour with identification" if approved else "Do not honour"
+                ),
+                "transactionType": transaction_type,
+                "customerNumber": customer_number,
+                "customerName": customer_name,
+                "orderNumber": form.get("orderNumber"),
+                "currency": form.get("currency", "aud"),
+                "principalAmount": amount,
+                "surchargeAmount": 0.0,
+                "paymentAmount": amount,
+                "paymentMethod": setup.get("paymentMethod", "creditCard"),
+                "creditCard": setup.get("creditCard"),
+                "bankAccount": setup.get("bankAccount"),
+                "merchant": self.merchant(),
+                "transactionDateTime": now.strftime("%d %b %Y %H:%M AEST"),
+                "user": "SECRET_API_KEY",
+                "settlementDate": now.strftime("%d %b %Y"),
+                "declinedDate": None if approved else now.strftime("%d %b %Y"),
+                "customerIpAddress": form.get("customerIpAddress"),
+                "fraudResult": "NOT_CHECKED",
+                "isVoidable": approved and transaction_type == "payment",
+                "isRefundable": approved and transaction_type == "payment",
+            }
+            self.transactions[str(transaction_id)] = transaction
+        return transaction
+
+
+def _required(form, name):
+    value = form.get(name)
+    if not value:
+        raise Invalid(name, "must not be blank", value)
+    return value
+
+
+def _date(form, name):
+    value = _required(form, name)
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise Invalid(name, "must be a date like 2024-06-12", value)
+
+
+def _amount(form, name):
+    value = _required(form, name)
+    try:
+        amount = float(value)
+    except ValueError:
+        raise Invalid(name, "must be a number", value)
+    if amount <= 0:
+        raise Invalid(name, "must be greater than zero", value)
+    return amount
+
+
+# method, path pattern, handler name
+ROUTES = [
+    ("POST", r"/single-use-tokens(-redirect)?", "create_token"),
+    ("POST", r"/customers", "create_customer"),
+    ("PUT", r"/customers/(?P<customer>[^/]+)", "put_customer"),
+    ("GET", r"/customers/(?P<customer>[^/]+)", "get_customer"),
+    ("PUT", r"/customers/(?P<customer>[^/]+)/payment-setup", "put_payment_setup"),
+    ("GET", r"/customers/(?P<customer>[^/]+)/schedule", "get_schedule"),
+    ("PUT", r"/customers/(?P<customer>[^/]+)/schedule", "put_schedule"),
+    ("DELETE", r"/customers/(?P<customer>[^/]+)/schedule", "delete_schedule"),
+    ("POST", r"/transactions", "post_transaction"),
+    (
+        "GET",
+        r"/transactions/search-(?P<kind>customer|settlement|receipt)",
+        "search_transactions",
+    ),
+    ("GET", r"/transactions/(?P<transaction>[^/]+)", "get_transaction"),
+    ("POST", r"/transactions/(?P<transaction>[^/]+)/void", "void_transaction"),
+]
+_ROUTES = [
+    (method, re.compile(pattern + "$"), name) for method, pattern, name in ROUTES
+]
+
+
+class PayWayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # answers are small, don't let Nagle hold them back
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def _handle(self, method):
+        # always consume the body, or a keep-alive connection would be left out of sync
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        server = self.server
+        server.count_request()
+        delay = server.profile.delay()
+        if delay:
+            time.sleep(delay)
+        url = urlsplit(self.path)
+        path = url.path
+        if path.startswith(server.base_path):
+            path = path[len(server.base_path):]
+        if not self.headers.get("Authorization", "").startswith("Basic "):
+            return self._send(401, {"message": "Unauthorized"})
+        fault = server.profile.fault()
+        if fault == 429:
+            headers = {}
+            if server.profile.retry_after is not None:
+                headers["Retry-After"] = str(server.profile.retry_after)
+            return self._send(429, {"message": "Too Many Requests"}, headers)
+        if fault == 500:
+            return self._server_error()
+        for route_method, pattern, name in _ROUTES:
+            match = pattern.match(path)
+            if match is None:
+                continue
+            if route_method != method:
+                continue
+            form = {
+                key: values[-1]
+                for key, values in parse_qs(body.decode("utf-8")).items()
+            }
+            form.update(
+                {key: values[-1] for key, values in parse_qs(url.query).items()}
+            )
+            try:
+                status, payload = getattr(self, name)(form, **match.groupdict())
+            except NotFound as e:
+                field_name, field_value = e.args
+                return self._field_error(404, field_name, "was not found", field_value)
+            except Invalid as e:
+                return self._field_error(422, e.field_name, e.message, e.field_value)
+            except Exception:
+                return self._server_error()
+            return self._send(status, payload)
+        if any(pattern.match(path) for _, pattern, _ in _ROUTES):
+            return self._send(405, {"message": "Method Not Allowed"})
+        return self._field_error(404, "path", "was not found", path)
+
+    def _field_error(self, status, field_name, message, field_value):
+        # the body _validate_response turns into PaymentError objects
+        self._send(
+            status,
+            {
+                "data": [
+                    {
+                        "fieldName": field_name,
+                        "message": message,
+                        "fieldValue": field_value,
+                    }
+                ]
+            },
+        )
+
+    def _server_error(self):
+        self._send(500, {"errorNumber": 1, "traceCode": os.urandom(8).hex()})
+
+    def _send(self, status, payload, headers=None):
+        body = b"" if payload is None else codec.dumps(payload)
+        self.send_response(status)
+        if payload is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    # routes, each returns (status, JSON payload)
+
+    def create_token(self, form, **kwargs):
+        return 200, self.server.state.create_token(form)
+
+    def create_customer(self, form):
+        return 200, self.server.state.save_customer(None, form)
+
+    def put_customer(self, form, customer):
+        return 200, self.server.state.save_customer(customer, form)
+
+    def get_customer(self, form, customer):
+        return 200, self.server.state.customer(customer)
+
+    def put_payment_setup(self, form, customer):
+        return 200, self.server.state.update_payment_setup(customer, form)
+
+    def get_schedule(self, form, customer):
+        return 200, self.server.state.schedule(customer)
+
+    def put_schedule(self, form, customer):
+        return 200, self.server.state.set_schedule(customer, form)
+
+    def delete_schedule(self, form, customer):
+        self.server.state.stop_schedule(customer)
+        return 204, None
+
+    def post_transaction(self, form):
+        return 200, self.server.state.process(form)
+
+    def get_transaction(self, form, transaction):
+        return 200, self.server.state.transaction(transaction)
+
+    def search_transactions(self, form, kind):
+        transactions = self.server.state.search(kind, form)
+        page = int(form.pop("page", None) or 1)
+        size = self.server.page_size
+        payload = {"data": transactions[(page - 1) * size : page * size], "links": []}
+        if page * size < len(transactions):
+            query = urlencode(dict(form, page=page + 1))
+            href = "http://%s%s?%s" % (self.headers["Host"], urlsplit(self.path).path, query)
+            payload["links"].append({"rel": "next", "href": href})
+        return 200, payload
+
+    def void_transaction(self, form, transaction):
+        return 200, self.server.state.void(transaction)
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # many concurrent clients connect at once during load tests
+    request_queue_size = 1024
+
+
+class FakePayWayServer(object):
+    """
+    Runs the fake PayWay API on a background thread.
+
+    host: str: interface to listen on
+    port: int: 0 picks a free port, see url
+    profile: ServerProfile: injected latency, errors and throttling
+    base_path: str: path prefix of the API, like PayWay's /rest/v1
+    page_size: int: transactions per page of a search
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        profile=None,
+        base_path="/rest/v1",
+        page_size=DEFAULT_PAGE_SIZE,
+    ):
+        self.profile = profile or ServerProfile()
+        self.base_path = base_path
+        self.state = PayWayState()
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._httpd = _HTTPServer((host, port), PayWayHandler)
+        self._httpd.profile = self.profile
+        self._httpd.base_path = base_path
+        self._httpd.page_size = page_size
+        self._httpd.state = self.state
+        self._httpd.count_request = self._count_request
+        self._thread = None
+
+    @property
+    def url(self):
+        """
+        API base URL to give to PayWayClient
+        """
+        host, port = self._httpd.server_address[:2]
+        return "http://%s:%d%s" % (host, port, self.base_path)
+
+    def _count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name="fake-payway", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake PayWay REST API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=DEFAULT_RETRY_AFTER)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    args = parser.parse_args(argv)
+    profile = ServerProfile(
+        latency=args.latency,
+        jitter=args.jitter,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    server = FakePayWayServer(args.host, args.port, profile, page_size=args.page_size)
+    print("Fake PayWay API listening on %s" % server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()